@@ -1,9 +1,21 @@
 # backend/app.py
 from flask import Flask, jsonify, send_from_directory, request
 from flask_cors import CORS
+import click
+import contextvars
+import copy
+import hashlib
 import os
-import requests
 import json
+import re
+from barcodes import canonical_barcode, normalize_barcode
+import awaited
+import cache_warmer
+import compression
+import deadlines
+import metrics
+import restriction_masks
+from dataset import registry as dataset_registry
 from dataset.ingredient_checker import check_ingredient_against_restrictions
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,11 +26,29 @@ MEAL_PLANS_FILE = os.path.join(BASE_DIR, "meal_plans.json")
 
 app = Flask(__name__, static_folder=os.path.join(BASE_DIR, "..", "frontend"), static_url_path="/")
 CORS(app)
+compression.init_app(app)
+deadlines.init_app(app)
+cache_warmer.init_app(app, history=lambda: [item.get("barcode") for item in reversed(load_history())])
+metrics.init_app(app)
+# A request waiting on a dataset load gives up when its deadline does
+dataset_registry.set_wait_limit(deadlines.remaining)
+# Products the lookups cache get their restriction masks in the background
+restriction_masks.compute_in_background(lambda barcode, product: product_restriction_mask(barcode, product))
 
 # In-memory storage (fallback if files don't exist)
 saved_items = []  # Last 2 scanned items
 
 def load_profiles():
+    """Load all profiles (a private copy the caller may modify and save). Readers use profiles_snapshot()."""
+    return copy.deepcopy(profiles_snapshot())
+
+
+def profiles_snapshot():
+    """All profiles as parsed from file, reused until the file changes. Treat as read-only."""
+    return read_json_cached((PROFILES_FILE, PROFILE_FILE), _read_profiles)
+
+
+def _read_profiles():
     """Load all profiles from file or return default structure."""
     try:
         if os.path.exists(PROFILES_FILE):
@@ -74,15 +104,17 @@ def save_profiles(profiles_data):
     try:
         with open(PROFILES_FILE, 'w') as f:
             json.dump(profiles_data, f, indent=2)
+        bump_data_version(PROFILES_FILE)
         return True
     except Exception as e:
         print(f"Error saving profiles: {e}")
         return False
 
 
-def get_active_profile():
-    """Get the currently active profile."""
-    profiles_data = load_profiles()
+def get_active_profile(profiles_data=None):
+    """Get the currently active profile (shared cached data; treat as read-only)."""
+    if profiles_data is None:
+        profiles_data = profiles_snapshot()
     active_id = profiles_data.get("activeProfileId", "default")
     
     for profile in profiles_data.get("profiles", []):
@@ -103,6 +135,10 @@ def load_profile():
 
 def load_history():
     """Load saved items history from file or return empty list."""
+    return list(read_json_cached((HISTORY_FILE,), _read_history))
+
+
+def _read_history():
     global saved_items
     try:
         if os.path.exists(HISTORY_FILE):
@@ -121,37 +157,108 @@ def save_history(items):
         saved_items = items[-2:] if len(items) > 2 else items
         with open(HISTORY_FILE, 'w') as f:
             json.dump(saved_items, f)
+        bump_data_version(HISTORY_FILE)
         return True
     except Exception as e:
         print(f"Error saving history: {e}")
         return False
 
 
+# -------- Content versions for conditional GETs --------
+# Writes from this process, per file; covers several writes within one mtime tick
+_data_versions = {}
+
+
+def bump_data_version(path):
+    _data_versions[path] = _data_versions.get(path, 0) + 1
+
+
+def data_version(*paths):
+    """
+    Version of the data in some JSON files, from their stat() and this
+    process's write counters - no file is read. Changes whenever any file
+    is written (here or by another worker).
+    """
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{path}:{st.st_mtime_ns}:{st.st_size}:{st.st_ino}:{_data_versions.get(path, 0)}")
+        except OSError:
+            parts.append(f"{path}:missing:{_data_versions.get(path, 0)}")
+    return data_hash("|".join(parts))
+
+
+# Parsed JSON files by path tuple: (data_version, value)
+_json_cache = {}
+
+
+def read_json_cached(paths, loader):
+    """loader()'s result, reused while data_version(*paths) is unchanged."""
+    version = data_version(*paths)
+    cached = _json_cache.get(paths)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    value = loader()
+    _json_cache[paths] = (version, value)
+    return value
+
+
+def data_hash(text):
+    return hashlib.blake2b(str(text).encode(), digest_size=8).hexdigest()
+
+
+def matching_etag(etag):
+    """
+    The If-None-Match entry that matches this ETag, allowing for the
+    content-coding suffix compression adds (see compression.py), or None.
+    """
+    from compression import strip_etag_coding
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    if if_none_match.star_tag:
+        return etag
+    return next((tag for tag in if_none_match.as_set() if strip_etag_coding(tag) == etag), None)
+
+
+def conditional_json(version, build, cache_control="private, no-cache"):
+    """
+    Respond with build()'s JSON under a strong ETag for `version`, or with a
+    bare 304 when the client already has it - build() isn't called then, so
+    nothing is read or serialized.
+    """
+    etag = f"{request.endpoint}-{version}"
+    matched = matching_etag(etag)
+    if matched:
+        # Echo the variant the client holds
+        response = app.response_class(status=304)
+        response.set_etag(matched)
+    else:
+        response = build()
+        if not isinstance(response, app.response_class):
+            response = jsonify(response)
+        if response.status_code != 200:
+            return response
+        response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
 # Initialize on startup
-# Initialize on startup
-load_profiles()  # Initialize profiles system
+profiles_snapshot()  # Initialize profiles system
 load_history()
 
-# Start background thread to load dataset
-def preload_dataset():
-    try:
-        print("Pre-loading food allergens dataset...")
-        from dataset.food_allergens_dataset import load_food_allergens_dataset
-        load_food_allergens_dataset()
-        print("Food allergens dataset pre-loaded.")
-    except Exception as e:
-        print(f"Failed to pre-load allergens dataset: {e}")
-        
-    try:
-        print("Pre-loading food classification dataset...")
-        from dataset.food_classification import load_food_classification_dataset
-        load_food_classification_dataset()
-        print("Food classification dataset pre-loaded.")
-    except Exception as e:
-        print(f"Failed to pre-load classification dataset: {e}")
 
-import threading
-threading.Thread(target=preload_dataset, daemon=True).start()
+def preload_dataset():
+    """
+    Load and index the datasets used on the request path.
+    The dev server runs this in a background thread; the production entry
+    point (wsgi.py) runs it once in the master before workers are forked.
+    Requests that need a dataset while it loads wait for it (see dataset.registry).
+    """
+    from dataset.registry import preload_datasets
+    preload_datasets()
 
 
 @app.route("/")
@@ -162,67 +269,60 @@ def index():
 
 def fetch_product_from_api(barcode):
     """
-    Fetch product data from Open Food Facts API.
+    Fetch product data through the product source chain
+    (memory cache, local store, then Open Food Facts; see product_sources).
     Returns (product_data, error_message).
     """
-    try:
-        url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            # Open Food Facts API returns data in format: {"status": 1, "product": {...}}
-            if data.get("status") == 1 and "product" in data:
-                return data["product"], None
-            else:
-                return None, "Product not found in Open Food Facts database"
-        else:
-            return None, f"API returned status code {response.status_code}"
-    except requests.exceptions.Timeout:
-        print(f"Timeout fetching from Open Food Facts API for {barcode}")
-        return None, "Connection timed out. Please try again."
-    except requests.exceptions.ConnectionError:
-        print(f"Connection error fetching from Open Food Facts API for {barcode}")
-        return None, "Connection error. Please check your internet connection."
-    except Exception as e:
-        print(f"Error fetching from Open Food Facts API: {e}")
-        return None, f"Error: {str(e)}"
+    barcode, error_msg = normalize_barcode(barcode)
+    if error_msg:
+        return None, error_msg
+    
+    from product_sources import get_product
+    return get_product(barcode)
 
 
-def search_similar_barcodes(barcode, prefix_length=8, max_results=10):
+def similar_barcode_searches(barcode, prefix_length=8, max_results=10):
     """
-    Search for products with barcodes that start with the same prefix.
-    Returns a list of products with matching barcode prefixes.
+    The search behind search_similar_barcodes, as a sans-IO generator: it
+    yields the params of each search call and is sent the decoded response
+    (see product_sources.drive). Starts at prefix_length digits and retries
+    one digit shorter, down to 6, while fewer than 5 products were found.
     """
+    barcode = canonical_barcode(barcode)
     if not barcode or len(barcode) < prefix_length:
         return []
     
-    # Get the prefix (first N digits)
-    prefix = barcode[:prefix_length]
     similar_products = []
     existing_barcodes = set()
     
     try:
-        # Try different approaches to find similar barcodes
-        # Approach 1: Try searching with the prefix using search API
-        url = f"https://world.openfoodfacts.org/cgi/search.pl"
-        params = {
-            "search_terms": prefix,
-            "search_simple": "1",
-            "action": "process",
-            "json": "1",
-            "page_size": 50  # Get more to filter
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            products = data.get("products", [])
+        for length in range(prefix_length, min(prefix_length, 6) - 1, -1):
+            # Enough found at a longer prefix
+            if length < prefix_length and len(similar_products) >= 5:
+                break
+            # Out of request budget: no (more) suggestions
+            if deadlines.exhausted():
+                break
+            
+            # Get the prefix (first N digits)
+            prefix = barcode[:length]
+            params = {
+                "search_terms": prefix,
+                "search_simple": "1",
+                "action": "process",
+                "json": "1",
+                "page_size": 50,  # Get more to filter
+                # Only what the suggestions show
+                "fields": "code,product_name,product_name_en,image_url,brands"
+            }
+            
+            data = yield params
+            products = (data or {}).get("products", [])
             
             # Filter products that actually start with the prefix
             for product in products:
                 product_code = str(product.get("code", ""))
+                product_code = canonical_barcode(product_code) or product_code
                 if product_code.startswith(prefix) and product_code != barcode and product_code not in existing_barcodes:
                     # Extract useful information
                     product_name = product.get("product_name") or product.get("product_name_en") or "Unknown Product"
@@ -237,18 +337,8 @@ def search_similar_barcodes(barcode, prefix_length=8, max_results=10):
                     # Limit results
                     if len(similar_products) >= max_results:
                         break
-        
-        # If we didn't find enough results, try with shorter prefix
-        if len(similar_products) < 5 and prefix_length > 6:
-            # Try with one digit less (recursive)
-            shorter_results = search_similar_barcodes(barcode, prefix_length - 1, max_results - len(similar_products))
-            # Add unique results
-            for product in shorter_results:
-                if product["barcode"] not in existing_barcodes:
-                    similar_products.append(product)
-                    existing_barcodes.add(product["barcode"])
-                    if len(similar_products) >= max_results:
-                        break
+            if len(similar_products) >= max_results:
+                break
         
     except Exception as e:
         print(f"Error searching similar barcodes: {e}")
@@ -256,53 +346,237 @@ def search_similar_barcodes(barcode, prefix_length=8, max_results=10):
     return similar_products[:max_results]
 
 
+def search_similar_barcodes(barcode, prefix_length=8, max_results=10):
+    """
+    Search for products with barcodes that start with the same prefix.
+    Returns a list of products with matching barcode prefixes.
+    """
+    from product_sources import drive, remote_request
+    # The async front end may already have searched for this request
+    similar_products = awaited.result(("similar", canonical_barcode(barcode), prefix_length, max_results))
+    if similar_products is not None:
+        return similar_products
+    return drive(similar_barcode_searches(barcode, prefix_length, max_results),
+                 lambda params: remote_request("/cgi/search.pl", params=params))
+
+
+async def search_similar_barcodes_async(barcode, prefix_length=8, max_results=10):
+    """search_similar_barcodes() as a coroutine (asgi.py)."""
+    from product_sources import drive_async, remote_request_async
+    return await drive_async(similar_barcode_searches(barcode, prefix_length, max_results),
+                             lambda params: remote_request_async("/cgi/search.pl", params=params))
+
+
+@app.route("/api/ready", methods=["GET"])
+def readiness():
+    """Report per-dataset load state and timings; 503 until preloaded datasets settle."""
+    summary = readiness_summary()
+    return jsonify(summary), 200 if summary["ready"] else 503
+
+
+def readiness_summary():
+    """Whether preloaded datasets have settled, whether any failed, and per-dataset status."""
+    from dataset.registry import dataset_status, FAILED, LOADING, PENDING
+    datasets = dataset_status()
+    preloaded = [d for d in datasets.values() if d["preload"]]
+    return {
+        "ready": all(d["state"] not in (PENDING, LOADING) for d in preloaded),
+        "degraded": any(d["state"] == FAILED for d in preloaded),
+        "datasets": datasets
+    }
+
+
+# -------- Bootstrap endpoint: everything the frontend needs on load --------
+@app.route("/api/bootstrap", methods=["GET"])
+def bootstrap():
+    """
+    Profiles, the active profile's restrictions, recent history and dataset
+    readiness in one response, built from the cached in-memory state.
+    """
+    readiness_state = readiness_summary()
+    dataset_states = {name: d["state"] for name, d in readiness_state["datasets"].items()}
+    version = data_hash(f"{data_version(PROFILES_FILE, PROFILE_FILE, HISTORY_FILE)}-{sorted(dataset_states.items())}")
+    
+    def build():
+        profiles_data = profiles_snapshot()
+        profile = get_active_profile(profiles_data)
+        return {
+            "profiles": profiles_data.get("profiles", []),
+            "activeProfileId": profiles_data.get("activeProfileId", "default"),
+            "restrictions": {
+                "allergies": profile.get("allergies", []),
+                "restrictions": profile.get("restrictions", [])
+            },
+            "history": load_history(),
+            "readiness": {
+                "ready": readiness_state["ready"],
+                "degraded": readiness_state["degraded"],
+                "datasets": dataset_states
+            }
+        }
+    return conditional_json(version, build)
+
+
+# -------- Admin endpoints --------
+def admin_authorized():
+    """Admin endpoints are open unless ADMIN_TOKEN is set, then they need a matching X-Admin-Token."""
+    token = os.getenv("ADMIN_TOKEN")
+    return not token or request.headers.get("X-Admin-Token") == token
+
+
+@app.route("/api/admin/datasets", methods=["GET"])
+def admin_datasets():
+    """Report each dataset's state, resident memory and last access, plus the memory budget."""
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    from dataset.registry import memory_report
+    return jsonify(memory_report())
+
+
+@app.route("/api/admin/datasets/<name>/<action>", methods=["POST"])
+def admin_dataset_action(name, action):
+    """Load or evict a single dataset."""
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    from dataset.registry import DATASETS, evict_dataset, get_dataset, dataset_status
+    if name not in DATASETS:
+        return jsonify({"error": "Dataset not found"}), 404
+    if action == "evict":
+        evicted = evict_dataset(name)
+        return jsonify({"ok": True, "evicted": evicted, "dataset": dataset_status()[name]})
+    if action == "load":
+        loaded = get_dataset(name) is not None
+        return jsonify({"ok": loaded, "dataset": dataset_status()[name]}), 200 if loaded else 500
+    return jsonify({"error": "Unknown action"}), 400
+
+
+@app.route("/api/admin/sources", methods=["GET"])
+def admin_sources():
+    """Report hit rate, latency and size for each product source tier."""
+    if not admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    from product_sources import source_stats
+    return jsonify({**source_stats(), "warmer": cache_warmer.stats(),
+                    "restrictionMasks": restriction_masks.background_stats()})
+
+
+def extract_ingredients(product_data):
+    """
+    Ingredient names for a product: parsed from ingredients_text (nested
+    sub-ingredients flattened, duplicates dropped), or taken from the
+    ingredients array when there is no text.
+    Returns (names, parsed entries with parent links; empty when from the array).
+    """
+    from dataset.ingredient_parser import parse_ingredients
+    ingredients_text = product_data.get("ingredients_text") or product_data.get("ingredients_text_en") or ""
+    parsed = parse_ingredients(ingredients_text)
+    ingredients_list = [ing.name for ing in parsed]
+    
+    # Also check ingredients array if available
+    if not ingredients_list and "ingredients" in product_data:
+        ingredients = product_data.get("ingredients", [])
+        if isinstance(ingredients, list):
+            ingredients_list = [ing.get("text", "") for ing in ingredients if isinstance(ing, dict) and ing.get("text")]
+    
+    return ingredients_list, parsed
+
+
+def requested_fields():
+    """
+    The ?fields= projection for product data: a comma-separated list,
+    "all" for the full Open Food Facts record, or the compact default set.
+    """
+    return parse_fields(request.args.get("fields", ""))
+
+
+def parse_fields(fields):
+    """A ?fields= value as a field tuple, None for "all", or the default set when empty."""
+    from product_sources import PRODUCT_FIELDS
+    fields = fields.strip()
+    if not fields:
+        return PRODUCT_FIELDS
+    if fields.lower() == "all":
+        return None
+    return tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+
+
 # -------- Scan endpoint: lookup by barcode using Open Food Facts API --------
 @app.route("/api/scan/<barcode>", methods=["GET"])
 def scan_barcode(barcode):
-    # Search in Open Food Facts API
-    product_data, error_msg = fetch_product_from_api(barcode)
+    # Canonicalize first so UPC-A / EAN-13 / GTIN-14 forms share one lookup
+    barcode, error_msg = normalize_barcode(barcode)
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+    
+    # Memory cache, local store, then Open Food Facts; a stale cached copy is
+    # served at once (and refreshed in the background) rather than waiting on the API
+    from product_sources import cache_ttl, lookup_product, project_product
+    fields = requested_fields()
+    with metrics.stage("fetch"):
+        lookup = lookup_product(barcode, fields)
+    product_data, error_msg = lookup.product, lookup.error
+    if product_data:
+        cache_warmer.record_scan(barcode, product_data, fetched=lookup.source == "remote")
     
     if not product_data:
-        # Search for similar barcodes
-        similar_products = search_similar_barcodes(barcode, prefix_length=8, max_results=10)
+        # Search for similar barcodes with whatever is left of the request budget
+        with metrics.stage("similar"):
+            similar_products = search_similar_barcodes(barcode, prefix_length=8, max_results=10)
         
-        return jsonify({
+        payload = {
             "error": error_msg or "i cant find it :)",
             "similarProducts": similar_products
-        }), 404
-    
-    # Extract key information
-    product_name = product_data.get("product_name") or product_data.get("product_name_en") or product_data.get("abbreviated_product_name") or "Unknown Product"
-    
-    # Parse ingredients
-    ingredients_text = product_data.get("ingredients_text") or product_data.get("ingredients_text_en") or ""
-    ingredients_list = []
-    if ingredients_text:
-        # Split by comma and clean up
-        ingredients_list = [ing.strip() for ing in str(ingredients_text).split(",") if ing.strip()]
+        }
+        if deadlines.exhausted():
+            # Budget ran out before the lookup/suggestions finished
+            payload["partial"] = True
+            payload["message"] = "Not found, no suggestions yet" if not similar_products else "Not found, some suggestions"
+        response = jsonify(payload)
+        response.status_code = 404
+        response.headers["Cache-Control"] = "no-store"
+        return response
     
-    # Also check ingredients array if available
-    if not ingredients_list and "ingredients" in product_data:
-        ingredients = product_data.get("ingredients", [])
-        if isinstance(ingredients, list):
-            ingredients_list = [ing.get("text", "") for ing in ingredients if isinstance(ing, dict) and ing.get("text")]
+    def build():
+        # Extract key information
+        product_name = product_data.get("product_name") or product_data.get("product_name_en") or product_data.get("abbreviated_product_name") or "Unknown Product"
+        
+        # Parse ingredients
+        with metrics.stage("parse"):
+            ingredients_list, parsed = extract_ingredients(product_data)
+        
+        return {
+            "barcode": barcode,
+            "stale": lookup.stale,
+            "productName": product_name,
+            "ingredients": ingredients_list,
+            # Same ingredients with nesting: parent is an index into this list
+            "ingredientTree": [ing._asdict() for ing in parsed],
+            # Open Food Facts record, projected to ?fields= (compact default set, or "all")
+            "allData": project_product(product_data, fields)
+        }
     
-    return jsonify({
-        "productName": product_name,
-        "ingredients": ingredients_list,
-        "allData": product_data  # Return all API data
-    })
+    # Browsers may reuse the response while our cached copy is fresh; stale copies are revalidated
+    ttl = cache_ttl()
+    if lookup.stale or not ttl:
+        cache_control = "public, no-cache"
+    else:
+        cache_control = f"public, max-age={max(0, int(ttl - (lookup.age_seconds or 0)))}"
+    # Same barcode, same fetched copy, same projection -> same body
+    version = f"{lookup.stored_at or 0:.6f}-{int(lookup.stale)}-{','.join(fields) if fields is not None else 'all'}"
+    return conditional_json(data_hash(version), build, cache_control)
 
 
 # -------- Profile endpoints --------
 @app.route("/api/profiles", methods=["GET"])
 def list_profiles():
     """List all profiles."""
-    profiles_data = load_profiles()
-    return jsonify({
-        "profiles": profiles_data.get("profiles", []),
-        "activeProfileId": profiles_data.get("activeProfileId", "default")
-    })
+    def build():
+        profiles_data = profiles_snapshot()
+        return {
+            "profiles": profiles_data.get("profiles", []),
+            "activeProfileId": profiles_data.get("activeProfileId", "default")
+        }
+    return conditional_json(data_version(PROFILES_FILE, PROFILE_FILE), build)
 
 
 @app.route("/api/profiles", methods=["POST"])
@@ -345,14 +619,18 @@ def create_profile():
 @app.route("/api/profiles/<profile_id>", methods=["GET"])
 def get_profile(profile_id):
     """Get a specific profile by ID."""
-    profiles_data = load_profiles()
-    profiles = profiles_data.get("profiles", [])
-    
-    for profile in profiles:
-        if profile.get("id") == profile_id:
-            return jsonify(profile)
-    
-    return jsonify({"error": "Profile not found"}), 404
+    def build():
+        profiles_data = profiles_snapshot()
+        profiles = profiles_data.get("profiles", [])
+        
+        for profile in profiles:
+            if profile.get("id") == profile_id:
+                return jsonify(profile)
+        
+        response = jsonify({"error": "Profile not found"})
+        response.status_code = 404
+        return response
+    return conditional_json(data_version(PROFILES_FILE, PROFILE_FILE), build)
 
 
 @app.route("/api/profiles/<profile_id>", methods=["PUT"])
@@ -447,11 +725,13 @@ def set_active_profile():
 @app.route("/api/profile/restrictions", methods=["GET"])
 def get_restrictions():
     """Get active profile's dietary restrictions and allergies (backward compatible)."""
-    profile = get_active_profile()
-    return jsonify({
-        "allergies": profile.get("allergies", []),
-        "restrictions": profile.get("restrictions", [])
-    })
+    def build():
+        profile = get_active_profile()
+        return {
+            "allergies": profile.get("allergies", []),
+            "restrictions": profile.get("restrictions", [])
+        }
+    return conditional_json(data_version(PROFILES_FILE, PROFILE_FILE), build)
 
 
 @app.route("/api/profile/restrictions", methods=["POST"])
@@ -486,52 +766,93 @@ def save_restrictions():
     return jsonify({"error": "Active profile not found"}), 404
 
 
-def check_allergens_from_product_data(product_data, profile):
+def _product_taxonomy_ids(product_data):
+    """
+    Allergen tag ids and ingredient ids of a product, as
+    {id: (source, ingredient text)}. Nested ingredients are included.
+    """
+    ids = {}
+    allergens_tags = product_data.get("allergens_tags", [])
+    if isinstance(allergens_tags, list):
+        for tag in allergens_tags:
+            if isinstance(tag, str) and tag:
+                ids.setdefault(tag.strip().lower(), ("allergens_tags", None))
+
+    pending = list(product_data.get("ingredients") or [])
+    for ingredient in pending:
+        if not isinstance(ingredient, dict):
+            continue
+        ingredient_id = ingredient.get("id")
+        if isinstance(ingredient_id, str) and ingredient_id:
+            ids.setdefault(ingredient_id.strip().lower(), ("ingredients", ingredient.get("text")))
+        pending.extend(ingredient.get("ingredients") or [])
+    return ids
+
+
+_LANGUAGE_PREFIX_RE = re.compile(r"\b[a-z]{2}:")
+
+
+def check_allergens_from_product_data(product_data, profile, product_ids=None):
     """
     Check Open Food Facts allergen fields directly.
     Returns list of flagged allergens.
+
+    When the product carries taxonomy ids (allergens_tags / ingredients[].id)
+    this is a set intersection with the profile's canonical allergen ids.
+    The free-text allergen fields are only matched for untagged products.
+    Pass product_ids if _product_taxonomy_ids() already ran for this product.
     """
+    from dataset.allergen_vocabulary import profile_allergy_index, tag_to_name
+
     flagged = []
     user_allergies = [a.lower().strip() for a in profile.get("allergies", [])]
     
     if not user_allergies:
         return flagged
-    
+    seen = set()
+
+    if product_ids is None:
+        product_ids = _product_taxonomy_ids(product_data)
+    if product_ids:
+        allergy_index = profile_allergy_index(user_allergies)
+        for taxonomy_id, (source, text) in product_ids.items():
+            if taxonomy_id not in allergy_index:
+                continue
+            ingredient = text.strip() if isinstance(text, str) and text.strip() else tag_to_name(taxonomy_id)
+            for user_allergy in allergy_index[taxonomy_id]:
+                key = (ingredient.lower(), user_allergy)
+                if key in seen:
+                    continue
+                seen.add(key)
+                flagged.append({
+                    "type": "allergy",
+                    "item": user_allergy,
+                    "ingredient": ingredient,
+                    "source": source
+                })
+        return flagged
+
     # Helper to clean and check a single allergen string
     def check_and_add(allergen_raw, source):
         if not allergen_raw:
             return
             
         # Split by comma to get individual items
-        parts = [p.strip() for p in str(allergen_raw).split(',')]
-        
-        for part in parts:
-            if not part:
-                continue
-                
+        for part in str(allergen_raw).split(','):
             # Clean up the part (remove en: prefix, etc)
-            clean_part = part
-            for prefix in ["en:", "fr:", "de:", "es:", "it:", "pt:"]:
-                clean_part = clean_part.replace(prefix, "")
-            clean_part = clean_part.replace("-", " ").replace("_", " ").strip()
+            clean_part = _LANGUAGE_PREFIX_RE.sub("", part.strip()).replace("-", " ").replace("_", " ").strip()
+            if not clean_part:
+                continue
             clean_part_lower = clean_part.lower()
             
             for user_allergy in user_allergies:
-                user_allergy_lower = user_allergy.lower()
-                
                 # Check for match
-                if (user_allergy_lower == clean_part_lower or
-                    user_allergy_lower in clean_part_lower or 
-                    clean_part_lower in user_allergy_lower):
-                    
-                    # Avoid duplicates
-                    already_flagged = any(
-                        f.get("ingredient", "").lower() == clean_part_lower and 
-                        f.get("item", "").lower() == user_allergy_lower
-                        for f in flagged
-                    )
-                    
-                    if not already_flagged:
+                if (user_allergy == clean_part_lower or
+                    user_allergy in clean_part_lower or 
+                    clean_part_lower in user_allergy):
+                    key = (clean_part_lower, user_allergy)
+                    if key not in seen:
+                        seen.add(key)
                         flagged.append({
                             "type": "allergy",
                             "item": user_allergy,
@@ -540,12 +861,6 @@ def check_allergens_from_product_data(product_data, profile):
                         })
                     # Don't break here, one ingredient might match multiple allergies (rare but possible)
 
-    # Check allergens_tags (array)
-    allergens_tags = product_data.get("allergens_tags", [])
-    if isinstance(allergens_tags, list):
-        for tag in allergens_tags:
-            check_and_add(tag, "allergens_tags")
-            
     # Check allergens text field
     allergens_text = product_data.get("allergens", "")
     if allergens_text:
@@ -565,14 +880,16 @@ def check_ingredients():
     """Check product ingredients against user restrictions."""
     data = request.get_json() or {}
     barcode = data.get("barcode")
-    
-    # Get user profile
-    profile = load_profile()
+    if barcode:
+        barcode, error_msg = normalize_barcode(barcode)
+        if error_msg:
+            return jsonify({"error": error_msg}), 400
     
     # Fetch product if barcode provided
     product_data = None
     if barcode:
-        product_data, _ = fetch_product_from_api(barcode)
+        with metrics.stage("fetch"):
+            product_data, _ = fetch_product_from_api(barcode)
     
     # Use provided product data or fetched data
     if not product_data and data.get("productData"):
@@ -581,82 +898,509 @@ def check_ingredients():
     if not product_data:
         return jsonify({"error": "Product data not found"}), 404
     
-    flagged = []
+    # Household check: ?profiles=all or ?profiles=id1,id2
+    profile_ids = request.args.get("profiles") or data.get("profiles")
+    if profile_ids:
+        try:
+            profiles = select_profiles(profile_ids)
+        except ProfileNotFound as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(check_household(product_data, profiles))
     
-    # FIRST: Check Open Food Facts allergen fields directly (most reliable)
-    allergen_flags = check_allergens_from_product_data(product_data, profile)
-    flagged.extend(allergen_flags)
+    return jsonify(check_product(product_data, load_profile()))
+
+
+class ProfileNotFound(LookupError):
+    """Raised by select_profiles when an id matches no profile."""
+
+    def __str__(self):
+        return f"Profile not found: {', '.join(self.args)}"
+
+
+def select_profiles(profile_ids):
+    """
+    Profiles for "all", a comma-separated id string or a list of ids, in the
+    order given.
+
+    Raises:
+        ValueError: profile_ids is none of those, or selects no profile
+        ProfileNotFound: an id is unknown
+    """
+    profiles = profiles_snapshot().get("profiles", [])
+    if profile_ids == "all":
+        if not profiles:
+            raise ValueError("There are no profiles")
+        return profiles
+    if isinstance(profile_ids, str):
+        profile_ids = profile_ids.split(",")
+    elif not (isinstance(profile_ids, list) and all(isinstance(pid, str) for pid in profile_ids)):
+        raise ValueError('profiles must be "all", a comma-separated string or a list of profile ids')
+    profile_ids = [pid.strip() for pid in profile_ids if pid.strip()]
+    if not profile_ids:
+        raise ValueError("No profile ids given")
+    by_id = {p.get("id"): p for p in profiles}
+    missing = [pid for pid in profile_ids if pid not in by_id]
+    if missing:
+        raise ProfileNotFound(*missing)
+    return [by_id[pid] for pid in dict.fromkeys(profile_ids)]
+
+
+def analyze_product(product_data):
+    """
+    The profile-independent half of a check: taxonomy ids, the product's
+    classification, and every (nested) ingredient looked up in the datasets.
+    Evaluate it against any number of profiles with evaluate_product().
+    """
+    from dataset.ingredient_checker import analyze_ingredient
     
-    # SECOND: Check product name against classification dataset first
+    # Check product name against classification dataset first
     # This allows us to trust product-level classifications even if ingredients might normally be flagged
     product_classification = None
     try:
         from dataset.food_classification import get_food_classification
         product_name = product_data.get("product_name") or product_data.get("product_name_en") or ""
         if product_name:
-            product_classification = get_food_classification(product_name)
+            with metrics.stage("classification"):
+                product_classification = get_food_classification(product_name)
     except Exception as e:
         print(f"Error checking product classification: {e}")
     
-    # THIRD: Extract and check ingredients
-    ingredients_text = product_data.get("ingredients_text") or product_data.get("ingredients_text_en") or ""
-    ingredients_list = []
-    if ingredients_text:
-        # Better parsing: split by comma, but also handle parentheses
-        ingredients_list = [ing.strip() for ing in str(ingredients_text).split(",") if ing.strip()]
-        # Also extract ingredients from parentheses (e.g., "milk powder (milk, whey)")
-        for ing in ingredients_list[:]:  # Use slice to avoid modifying during iteration
-            if "(" in ing and ")" in ing:
-                # Extract content from parentheses
-                start = ing.find("(")
-                end = ing.find(")")
-                if start < end:
-                    nested = ing[start+1:end].strip()
-                    nested_ingredients = [n.strip() for n in nested.split(",") if n.strip()]
-                    ingredients_list.extend(nested_ingredients)
+    # Extract ingredients (nested sub-ingredients included); look each distinct one up once
+    with metrics.stage("parse"):
+        ingredients_list, _ = extract_ingredients(product_data)
+    facts = {}
+    with metrics.stage("ingredients"):
+        for ingredient in ingredients_list:
+            if ingredient not in facts:
+                facts[ingredient] = analyze_ingredient(ingredient)
     
-    # Also check ingredients array if available
-    if not ingredients_list and "ingredients" in product_data:
-        ingredients = product_data.get("ingredients", [])
-        if isinstance(ingredients, list):
-            ingredients_list = [ing.get("text", "") for ing in ingredients if isinstance(ing, dict) and ing.get("text")]
+    return {
+        "productData": product_data,
+        "productName": product_data.get("product_name") or product_data.get("product_name_en") or "Unknown",
+        "taxonomyIds": _product_taxonomy_ids(product_data),
+        "classification": product_classification,
+        "ingredients": [facts[ingredient] for ingredient in ingredients_list],
+    }
+
+
+def evaluate_product(analysis, profile, allergen_flags=None):
+    """
+    Full verdict for an analyzed product against one profile: allergen fields
+    first, then the product classification, then every ingredient.
+    Pass allergen_flags if check_allergens_from_product_data already ran.
+    Returns the /api/check response body.
+    """
+    from dataset.ingredient_checker import evaluate_ingredient
     
-    # Check each ingredient against restrictions
-    for ingredient in ingredients_list:
-        result = check_ingredient_against_restrictions(ingredient, profile, product_classification)
-        if result:
-            # Avoid duplicates
-            already_flagged = any(
-                f.get("ingredient", "").lower() == ingredient.lower() and
-                f.get("item", "").lower() == result.get("item", "").lower()
-                for f in flagged
-            )
-            if not already_flagged:
-                flagged.append(result)
+    # FIRST: Check Open Food Facts allergen fields directly (most reliable)
+    if allergen_flags is None:
+        with metrics.stage("allergens"):
+            allergen_flags = check_allergens_from_product_data(analysis["productData"], profile, analysis["taxonomyIds"])
+    flagged = list(allergen_flags)
+    seen = {(f.get("ingredient", "").lower(), f.get("item", "").lower()) for f in flagged}
     
-    return jsonify({
+    # SECOND: Check each ingredient against restrictions, trusting the product classification
+    with metrics.stage("ingredients"):
+        for facts in analysis["ingredients"]:
+            result = evaluate_ingredient(facts, profile, analysis["classification"])
+            if result:
+                # Avoid duplicates
+                key = (facts.ingredient.lower(), result.get("item", "").lower())
+                if key not in seen:
+                    seen.add(key)
+                    flagged.append(result)
+    
+    return {
         "flagged": flagged,
         "hasIssues": len(flagged) > 0,
-        "ingredientsChecked": len(ingredients_list),
-        "productName": product_data.get("product_name") or product_data.get("product_name_en") or "Unknown"
+        "ingredientsChecked": len(analysis["ingredients"]),
+        "productName": analysis["productName"]
+    }
+
+
+def check_product(product_data, profile, allergen_flags=None):
+    """Full verdict for a product against one profile (the /api/check response body)."""
+    verdict = evaluate_product(analyze_product(product_data), profile, allergen_flags)
+    if deadlines.exhausted():
+        # The budget ran out, e.g. waiting on a dataset: some ingredients went unchecked
+        verdict["partial"] = True
+    return verdict
+
+
+def check_household(product_data, profiles):
+    """
+    Check a product against several profiles, analyzing it only once.
+
+    Returns:
+        dict: productName, ingredientsChecked, the distinct issues found, one
+        entry per profile (id, name, flagged, hasIssues) and a matrix with a
+        row per profile and a column per issue (true = the issue applies).
+    """
+    analysis = analyze_product(product_data)
+    issues = []
+    issue_index = {}
+    results = []
+    for profile in profiles:
+        verdict = evaluate_product(analysis, profile)
+        columns = set()
+        for flag in verdict["flagged"]:
+            key = (flag.get("type"), flag.get("item", "").lower(), flag.get("ingredient", "").lower())
+            if key not in issue_index:
+                issue_index[key] = len(issues)
+                issues.append({"type": flag.get("type"), "item": flag.get("item"), "ingredient": flag.get("ingredient")})
+            columns.add(issue_index[key])
+        results.append((profile, verdict, columns))
+    
+    household = {
+        "productName": analysis["productName"],
+        "ingredientsChecked": len(analysis["ingredients"]),
+        "hasIssues": any(verdict["hasIssues"] for _, verdict, _ in results),
+        "issues": issues,
+        "profiles": [
+            {
+                "id": profile.get("id"),
+                "name": profile.get("name"),
+                "flagged": verdict["flagged"],
+                "hasIssues": verdict["hasIssues"]
+            }
+            for profile, verdict, _ in results
+        ],
+        "matrix": [[i in columns for i in range(len(issues))] for _, _, columns in results]
+    }
+    if deadlines.exhausted():
+        household["partial"] = True
+    return household
+
+
+def product_restriction_mask(barcode, product_data, compute=True):
+    """
+    The product's restriction bitmask (see restriction_masks.py), computed
+    with the full check the first time and stored. Masks are hashed and
+    computed over the product's PRODUCT_FIELDS, whichever fields the caller
+    fetched, so every path finds the same stored mask.
+
+    Returns:
+        tuple: (mask, whether it was computed now); without compute, the
+        mask is None when none is stored yet
+    """
+    import restriction_masks
+    from product_sources import PRODUCT_FIELDS, project_product
+    product_data = project_product(product_data, PRODUCT_FIELDS)
+    
+    def full_check_mask():
+        analysis = analyze_product(product_data)
+        return restriction_masks.compute_mask(lambda profile: evaluate_product(analysis, profile)["hasIssues"])
+    
+    return restriction_masks.product_mask(barcode, product_data, full_check_mask if compute else None)
+
+
+@app.route("/api/scan/<barcode>/safe", methods=["GET"])
+def scan_safe(barcode):
+    """
+    Is this product safe for the active profile? Answered from the product's
+    restriction bitmask with one AND; the full check only runs when the
+    profile names something the bits don't cover. GET /api/check has the details.
+    """
+    barcode, error_msg = normalize_barcode(barcode)
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+    
+    import restriction_masks
+    from product_sources import lookup_product
+    with metrics.stage("fetch"):
+        lookup = lookup_product(barcode)
+    product_data = lookup.product
+    if not product_data:
+        return jsonify({"error": lookup.error or "i cant find it :)"}), 404
+    
+    profile = load_profile()
+    mask, _ = product_restriction_mask(barcode, product_data)
+    wanted, exact = restriction_masks.profile_mask(profile)
+    conflicts = mask & wanted
+    if conflicts or exact:
+        safe = not conflicts
+    else:
+        # The profile has allergies/restrictions without a bit: only the full check can clear it
+        safe = not check_product(product_data, profile)["hasIssues"]
+    
+    return jsonify({
+        "barcode": barcode,
+        "productName": product_data.get("product_name") or product_data.get("product_name_en") or "Unknown",
+        "safe": safe,
+        "conflicts": restriction_masks.bit_names(conflicts),
+        "exact": exact,
+        "mask": mask,
+        "profileMask": wanted
+    })
+
+
+def safe_alternatives(barcode, product_data, profile, k=5):
+    """
+    Up to k locally known products with the most similar ingredients that
+    pass the profile, from the similarity index (no upstream calls). Only
+    products that already have a restriction mask are ranked; the others get
+    one in the background and show up in later answers. Returns None while
+    the index is still being built.
+    """
+    import restriction_masks
+    import similarity_index
+    from product_sources import local_product
+    similar = similarity_index.similar_products(product_data, exclude=barcode)
+    if similar is None:
+        return None
+    wanted, exact = restriction_masks.profile_mask(profile)
+    alternatives = []
+    full_checks = 0
+    for other, score, name, image_url in similar[:k * 20]:
+        other_data = local_product(other)
+        if other_data is None:
+            continue
+        mask, _ = product_restriction_mask(other, other_data, compute=False)
+        if mask is None:
+            restriction_masks.queue_product(other, other_data)
+            continue
+        if mask & wanted:
+            continue
+        if not exact:
+            # The bits can't clear this profile; a full check costs about as much as a mask, so bound them
+            if full_checks >= k * 2:
+                break
+            full_checks += 1
+            if check_product(other_data, profile)["hasIssues"]:
+                continue
+        alternatives.append({
+            "barcode": other,
+            "productName": name,
+            "imageUrl": image_url,
+            "similarity": round(score, 3)
+        })
+        if len(alternatives) >= k:
+            break
+    return alternatives
+
+
+@app.route("/api/scan/<barcode>/alternatives", methods=["GET"])
+def scan_alternatives(barcode):
+    """
+    Products with similar ingredients that are safe for the active profile,
+    ranked by ingredient similarity. ?k= sets how many (default 5, max 20).
+    """
+    barcode, error_msg = normalize_barcode(barcode)
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+    try:
+        k = min(max(int(request.args.get("k", 5)), 1), 20)
+    except ValueError:
+        return jsonify({"error": "k must be a number"}), 400
+    
+    from product_sources import lookup_product
+    with metrics.stage("fetch"):
+        lookup = lookup_product(barcode)
+    if not lookup.product:
+        return jsonify({"error": lookup.error or "i cant find it :)"}), 404
+    
+    alternatives = safe_alternatives(barcode, lookup.product, load_profile(), k)
+    return jsonify({
+        "barcode": barcode,
+        "alternatives": alternatives or [],
+        # False while the similarity index is still being built
+        "ready": alternatives is not None
     })
 
 
+@app.route("/api/safe-products", methods=["GET"])
+def safe_products():
+    """
+    Products in the local catalog that are safe for the active profile (or
+    ?profileId=), optionally filtered by ?name= and ?category= prefixes.
+    Pages of ?limit= (default 20, max 100) in barcode order; pass the
+    returned nextCursor as ?cursor= for the next page.
+    """
+    import time
+    import catalog_index
+    import restriction_masks
+    started = time.perf_counter()
+    
+    profile_id = request.args.get("profileId")
+    if profile_id:
+        profile_id = profile_id.strip()
+        if profile_id == "all" or "," in profile_id:
+            return jsonify({"error": "profileId takes a single profile id"}), 400
+        try:
+            profile = select_profiles(profile_id)[0]
+        except ProfileNotFound as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        profile = load_profile()
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    
+    index = catalog_index.get_index()
+    wanted, exact = restriction_masks.profile_mask(profile)
+    selected = index.select(wanted, request.args.get("name", "").strip(), request.args.get("category", "").strip())
+    rows = index.page_rows(selected, request.args.get("cursor"))
+    
+    accept = None
+    if not exact:
+        # Bits can't clear everything this profile names: confirm each candidate with the full check
+        from product_sources import PRODUCT_FIELDS, get_tier, project_product
+        store = get_tier("store")
+        
+        def accept(item):
+            entry = store.get(item["barcode"]) if store is not None else None
+            return entry is not None and not check_product(project_product(entry[0], PRODUCT_FIELDS), profile)["hasIssues"]
+    
+    page, next_cursor = catalog_index.first_rows(index, rows, limit, accept, max_scanned=None if exact else limit * 5)
+    for item in page:
+        del item["mask"]
+    
+    return jsonify({
+        "products": page,
+        "nextCursor": next_cursor,
+        # Candidates left from this cursor on (before full checks, for inexact profiles)
+        "remaining": int(len(rows)),
+        "exact": exact,
+        # False until the datasets are loaded; the catalog is empty until then
+        "ready": index.ready,
+        "catalogSize": len(index),
+        "tookMs": round((time.perf_counter() - started) * 1000, 2)
+    })
+
+
+# -------- Scan-and-check endpoint: progressive verdict as server-sent events --------
+def sse_event(name, payload):
+    """One server-sent event carrying a JSON payload."""
+    return f"event: {name}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+def view_context_stream(iterator):
+    """
+    Iterate in a copy of the view's context. Flask tears the request down
+    before a streamed body runs, and the teardown hooks reset the request's
+    stage timing; the copy keeps it, and the deadline, for the stream.
+    """
+    context = contextvars.copy_context()
+
+    def run():
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+
+    return run()
+
+
+def stream_timing():
+    """Deadline budget and stage timings of the current request, for the last event of a stream."""
+    timing = {}
+    budget = deadlines.report()
+    if budget is not None:
+        timing["budget"] = budget
+    stages = metrics.report()
+    if stages is not None:
+        timing.update(stages)
+    return timing
+
+
+@app.route("/api/scan/<barcode>/verdict", methods=["GET"])
+def scan_verdict(barcode):
+    """
+    Look a product up and check it against the active profile in one request,
+    streamed as server-sent events so the answer shows up as soon as it's known:
+
+        product       barcode, name, image, stale flag, ingredient names
+        allergens     allergen-tag verdict (cheap: tag set intersection)
+        verdict       full ingredient-level verdict, same body as /api/check
+        alternatives  only when flagged: similar products that pass the profile
+        notFound      instead of the above when there's no product, then
+        similar       barcode-prefix suggestions
+        done          always last; "timing" has the deadline budget spent and,
+                      with SERVER_TIMING or METRICS_ENABLED, the stage timings
+                      (headers go out before the work, so they can't)
+    """
+    barcode, error_msg = normalize_barcode(barcode)
+    if error_msg:
+        return jsonify({"error": error_msg}), 400
+    
+    from flask import Response, stream_with_context
+    from product_sources import lookup_product
+    profile = load_profile()
+    
+    def events():
+        with metrics.stage("fetch"):
+            lookup = lookup_product(barcode)
+        product_data = lookup.product
+        if product_data:
+            cache_warmer.record_scan(barcode, product_data, fetched=lookup.source == "remote")
+        if not product_data:
+            yield sse_event("notFound", {"barcode": barcode, "error": lookup.error or "i cant find it :)"})
+            with metrics.stage("similar"):
+                similar = search_similar_barcodes(barcode, prefix_length=8, max_results=10)
+            yield sse_event("similar", {
+                "similarProducts": similar,
+                "partial": deadlines.exhausted()
+            })
+            yield sse_event("done", {"found": False, "timing": stream_timing()})
+            return
+        
+        with metrics.stage("parse"):
+            ingredients_list, _ = extract_ingredients(product_data)
+        yield sse_event("product", {
+            "barcode": barcode,
+            "stale": lookup.stale,
+            "productName": product_data.get("product_name") or product_data.get("product_name_en") or product_data.get("abbreviated_product_name") or "Unknown Product",
+            "imageUrl": product_data.get("image_front_small_url") or product_data.get("image_small_url") or product_data.get("image_url"),
+            "ingredients": ingredients_list
+        })
+        
+        with metrics.stage("allergens"):
+            allergen_flags = check_allergens_from_product_data(product_data, profile)
+        yield sse_event("allergens", {
+            "flagged": allergen_flags,
+            "hasIssues": len(allergen_flags) > 0
+        })
+        
+        verdict = check_product(product_data, profile, allergen_flags)
+        yield sse_event("verdict", verdict)
+        if verdict["hasIssues"]:
+            alternatives = safe_alternatives(barcode, product_data, profile)
+            yield sse_event("alternatives", {"alternatives": alternatives or [], "ready": alternatives is not None})
+        yield sse_event("done", {"found": True, "timing": stream_timing()})
+    
+    response = Response(stream_with_context(view_context_stream(events())), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Don't let proxies (e.g. nginx) buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 # -------- History endpoints --------
 @app.route("/api/history", methods=["GET"])
 def get_history():
     """Get saved items history (last 2 items)."""
-    history = load_history()
-    return jsonify({"items": history})
+    return conditional_json(data_version(HISTORY_FILE), lambda: {"items": load_history()})
 
 
 @app.route("/api/history", methods=["POST"])
 def save_to_history():
     """Save an item to history (keep only last 2)."""
     data = request.get_json() or {}
+    barcode = data.get("barcode")
+    if barcode:
+        barcode, error_msg = normalize_barcode(barcode)
+        if error_msg:
+            return jsonify({"error": error_msg}), 400
     
     item = {
-        "barcode": data.get("barcode"),
+        "barcode": barcode,
         "productName": data.get("productName"),
         "imageUrl": data.get("imageUrl"),
         "productData": data.get("productData")
@@ -666,7 +1410,7 @@ def save_to_history():
     history = load_history()
     
     # Remove if already exists (to move to end)
-    history = [h for h in history if h.get("barcode") != item.get("barcode")]
+    history = [h for h in history if (canonical_barcode(h.get("barcode")) or h.get("barcode")) != item.get("barcode")]
     
     # Add new item
     history.append(item)
@@ -678,6 +1422,38 @@ def save_to_history():
         return jsonify({"error": "Failed to save history"}), 500
 
 
+# Gemini model, configured on first use and reused across requests
+_gemini_model = None
+_gemini_api_key = None
+
+
+def get_gemini_model():
+    """
+    Return the configured Gemini model, importing and configuring the client
+    on first use. Returns None if no API key is set.
+    Raises ImportError if google-generativeai isn't installed.
+    """
+    global _gemini_model, _gemini_api_key
+    
+    # Get API key from environment variable
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        # Fallback: try to read from .env file
+        from dotenv import load_dotenv
+        load_dotenv()
+        api_key = os.getenv("GEMINI_API_KEY")
+    
+    if not api_key:
+        return None
+    
+    if _gemini_model is None or api_key != _gemini_api_key:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _gemini_model = genai.GenerativeModel('gemini-pro')
+        _gemini_api_key = api_key
+    return _gemini_model
+
+
 # Meal Plan Management
 def load_meal_plans():
     """Load saved meal plans from file."""
@@ -702,43 +1478,34 @@ def save_meal_plan(meal_plan_data):
         print(f"Error saving meal plan: {e}")
         return False
 
-@app.route("/api/generate-meal-plan", methods=["POST"])
-def generate_meal_plan():
-    """Generate a meal plan using Gemini AI."""
-    try:
-        data = request.get_json()
-        user_prompt = data.get("prompt", "")
-        
-        if not user_prompt:
-            return jsonify({"error": "Prompt is required"}), 400
-        
-        # Get user's current restrictions for context
-        profiles_data = load_profiles()
-        active_profile_id = profiles_data.get("activeProfileId")
-        active_profile = None
-        
-        if active_profile_id:
-            for profile in profiles_data.get("profiles", []):
-                if profile.get("id") == active_profile_id:
-                    active_profile = profile
-                    break
-        
-        # Build context for Gemini
-        context = f"""You are a nutritionist and meal planning expert. Create a personalized meal plan based on the user's goals and preferences.
+def meal_plan_prompt(user_prompt):
+    """The Gemini prompt for a meal plan request, with the active profile's allergies and restrictions."""
+    profiles_data = profiles_snapshot()
+    active_profile_id = profiles_data.get("activeProfileId")
+    active_profile = None
+    
+    if active_profile_id:
+        for profile in profiles_data.get("profiles", []):
+            if profile.get("id") == active_profile_id:
+                active_profile = profile
+                break
+    
+    # Build context for Gemini
+    context = f"""You are a nutritionist and meal planning expert. Create a personalized meal plan based on the user's goals and preferences.
 
 User's Request: {user_prompt}
 """
+    
+    if active_profile:
+        allergies = active_profile.get("allergies", [])
+        restrictions = active_profile.get("restrictions", [])
         
-        if active_profile:
-            allergies = active_profile.get("allergies", [])
-            restrictions = active_profile.get("restrictions", [])
-            
-            if allergies:
-                context += f"\nUser's Allergies: {', '.join(allergies)}"
-            if restrictions:
-                context += f"\nUser's Dietary Restrictions: {', '.join(restrictions)}"
-        
-        context += """
+        if allergies:
+            context += f"\nUser's Allergies: {', '.join(allergies)}"
+        if restrictions:
+            context += f"\nUser's Dietary Restrictions: {', '.join(restrictions)}"
+    
+    context += """
 
 Please create a detailed meal plan that:
 1. Addresses the user's goals and preferences
@@ -748,29 +1515,34 @@ Please create a detailed meal plan that:
 5. Is practical and easy to follow
 
 Format the meal plan clearly with days and meals. Be specific about ingredients so they can be checked against dietary restrictions."""
+    return context
+
+
+@app.route("/api/generate-meal-plan", methods=["POST"])
+def generate_meal_plan():
+    """Generate a meal plan using Gemini AI."""
+    try:
+        data = request.get_json()
+        user_prompt = data.get("prompt", "")
+        
+        if not user_prompt:
+            return jsonify({"error": "Prompt is required"}), 400
+        
+        context = meal_plan_prompt(user_prompt)
 
         # Use Gemini AI (Google Generative AI)
         try:
-            import google.generativeai as genai
-            
-            # Get API key from environment variable
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                # Fallback: try to read from .env file
-                from dotenv import load_dotenv
-                load_dotenv()
-                api_key = os.getenv("GEMINI_API_KEY")
-            
-            if not api_key:
+            model = get_gemini_model()
+            if model is None:
                 return jsonify({
                     "error": "Gemini API key not found. Please set GEMINI_API_KEY environment variable."
                 }), 500
             
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-pro')
-            
-            response = model.generate_content(context)
-            meal_plan_text = response.text
+            # The async front end may already have generated it for this request
+            meal_plan_text = awaited.result(("meal-plan", context))
+            if meal_plan_text is None:
+                with metrics.stage("generate"):
+                    meal_plan_text = model.generate_content(context).text
             
             return jsonify({
                 "mealPlan": meal_plan_text,
@@ -818,6 +1590,56 @@ def get_meal_plans():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+def meal_plan_food_items(meal_plan_text):
+    """
+    Food item lines of a meal plan. Day and meal headers, bullet lines and
+    empty lines are skipped.
+    """
+    # Extract food items from meal plan (simple extraction)
+    # This is a basic implementation - you may want to improve the parsing
+    lines = meal_plan_text.split('\n')
+    food_items = []
+
+    for line in lines:
+        line = line.strip()
+        # Skip headers and empty lines
+        if not line or line.startswith('Day') or line.startswith('Monday') or line.startswith('Tuesday') or line.startswith('Wednesday') or line.startswith('Thursday') or line.startswith('Friday') or line.startswith('Saturday') or line.startswith('Sunday'):
+            continue
+        # Skip meal type headers
+        if line.startswith('Breakfast') or line.startswith('Lunch') or line.startswith('Dinner') or line.startswith('Snack'):
+            continue
+        # Extract food items (lines that aren't headers)
+        if line and not line.startswith('-') and not line.startswith('•'):
+            # Try to extract food names (simple approach)
+            food_items.append(line)
+    return food_items
+
+
+def check_meal_plan_items(food_items, profile):
+    """Check each meal plan item against a profile. Returns the flagged items with their issue."""
+    flagged_items = []
+    for item in food_items:
+        # Check food item name against classification dataset first
+        item_classification = None
+        try:
+            from dataset.food_classification import get_food_classification
+            with metrics.stage("classification"):
+                item_classification = get_food_classification(item)
+        except Exception as e:
+            print(f"Error checking item classification: {e}")
+        
+        # Check if item contains restricted ingredients
+        with metrics.stage("ingredients"):
+            result = check_ingredient_against_restrictions(item, profile, item_classification)
+        if result:
+            flagged_items.append({
+                "item": item,
+                "issue": result
+            })
+    return flagged_items
+
+
 @app.route("/api/check-meal-plan", methods=["POST"])
 def check_meal_plan():
     """Check meal plan items against restrictions."""
@@ -829,7 +1651,7 @@ def check_meal_plan():
             return jsonify({"error": "Meal plan text is required"}), 400
         
         # Get active profile
-        profiles_data = load_profiles()
+        profiles_data = profiles_snapshot()
         active_profile_id = profiles_data.get("activeProfileId")
         active_profile = None
         
@@ -842,47 +1664,13 @@ def check_meal_plan():
         if not active_profile:
             return jsonify({"error": "No active profile found"}), 400
         
-        # Extract food items from meal plan (simple extraction)
-        # This is a basic implementation - you may want to improve the parsing
-        lines = meal_plan_text.split('\n')
-        food_items = []
-        
-        for line in lines:
-            line = line.strip()
-            # Skip headers and empty lines
-            if not line or line.startswith('Day') or line.startswith('Monday') or line.startswith('Tuesday') or line.startswith('Wednesday') or line.startswith('Thursday') or line.startswith('Friday') or line.startswith('Saturday') or line.startswith('Sunday'):
-                continue
-            # Skip meal type headers
-            if line.startswith('Breakfast') or line.startswith('Lunch') or line.startswith('Dinner') or line.startswith('Snack'):
-                continue
-            # Extract food items (lines that aren't headers)
-            if line and not line.startswith('-') and not line.startswith('•'):
-                # Try to extract food names (simple approach)
-                food_items.append(line)
-        
-        # Check each food item against restrictions
         profile = {
             "allergies": active_profile.get("allergies", []),
             "restrictions": active_profile.get("restrictions", [])
         }
-        
-        flagged_items = []
-        for item in food_items:
-            # Check food item name against classification dataset first
-            item_classification = None
-            try:
-                from dataset.food_classification import get_food_classification
-                item_classification = get_food_classification(item)
-            except Exception as e:
-                print(f"Error checking item classification: {e}")
-            
-            # Check if item contains restricted ingredients
-            result = check_ingredient_against_restrictions(item, profile, item_classification)
-            if result:
-                flagged_items.append({
-                    "item": item,
-                    "issue": result
-                })
+        with metrics.stage("parse"):
+            food_items = meal_plan_food_items(meal_plan_text)
+        flagged_items = check_meal_plan_items(food_items, profile)
         
         return jsonify({
             "flaggedItems": flagged_items,
@@ -894,6 +1682,52 @@ def check_meal_plan():
         return jsonify({"error": str(e)}), 500
 
 
+# -------- CLI: product import and restriction masks --------
+@app.cli.command("import-products")
+@click.argument("path")
+def import_products_command(path):
+    """Import products from a JSON file (a list, or {barcode: product}) into the local store, with their masks."""
+    import product_sources
+    store = product_sources.get_tier("store")
+    if store is None:
+        raise click.ClickException("The local store tier isn't enabled (PRODUCT_SOURCES)")
+    with open(path, 'r') as f:
+        data = json.load(f)
+    products = data.values() if isinstance(data, dict) else data
+    
+    imported, skipped = 0, 0
+    for product in products:
+        barcode, error_msg = normalize_barcode(str(product.get("code") or ""))
+        if error_msg:
+            skipped += 1
+            continue
+        product = product_sources.project_product(product, product_sources.fetch_fields())
+        store.put(barcode, product)
+        product_restriction_mask(barcode, product)
+        imported += 1
+    click.echo(f"Imported {imported} products ({skipped} skipped: invalid barcode)")
+
+
+@app.cli.command("build-masks")
+def build_masks_command():
+    """Compute restriction masks for every stored product that lacks a current one."""
+    import product_sources
+    import restriction_masks
+    store = product_sources.get_tier("store")
+    if store is None:
+        raise click.ClickException("The local store tier isn't enabled (PRODUCT_SOURCES)")
+    computed, current = 0, 0
+    for barcode, product in store.items():
+        _, fresh = product_restriction_mask(barcode, product)
+        computed += fresh
+        current += not fresh
+    version = restriction_masks.datasets_version()
+    click.echo(f"Computed {computed} masks, {current} already current (datasets version {version})")
+
+
 if __name__ == "__main__":
-    # run dev server
+    # run dev server; production uses wsgi.py (see gunicorn.conf.py)
+    import threading
+    threading.Thread(target=preload_dataset, daemon=True).start()
+    cache_warmer.start()
     app.run(host="0.0.0.0", port=5000, debug=True)
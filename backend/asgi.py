@@ -0,0 +1,277 @@
+# backend/asgi.py
+"""
+ASGI entry point: async serving mode.
+
+    uvicorn asgi:app --port 5000 --workers 2
+
+The Flask app stays synchronous; this module puts an async front on it. For
+the I/O-bound routes the upstream calls are made here first, as coroutines on
+a pooled httpx client, so one process keeps hundreds of Open Food Facts or
+Gemini calls in flight without tying up a thread per call:
+
+    GET  /api/scan/<barcode>[/verdict|/safe|/alternatives]
+             product lookup, and the similar-barcode search when not found
+    POST /api/check                 product lookup, when given a barcode
+    POST /api/generate-meal-plan    Gemini generate_content_async
+
+The request is then handed to Flask on a thread pool, where the route finds
+those results already awaited (awaited.py) and only does the CPU-bound part:
+parsing, checking against the profile, serializing. Every other route goes
+straight to the pool. Responses are streamed back as Flask produces them, so
+the SSE verdict stream works unchanged.
+
+This pays off only when the upstream is slow and there are more requests in
+flight than a threaded worker has threads: a gthread worker with N threads
+serves at most N / latency requests per second while it waits on the
+remote. Below that, the hand-off costs more than it saves, and a threaded
+WSGI worker with enough threads is faster (benchmarks/asgi_throughput.py has
+the numbers for both cases).
+
+    ASGI_THREADS          Flask worker threads per process (32)
+    OFF_MAX_CONNECTIONS   pooled connections to the remote (200)
+
+(asgiref's WsgiToAsgi isn't used for the hand-off: it runs every request on
+one shared thread.)
+"""
+import asyncio
+import contextvars
+import io
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import parse_qs
+
+import app as app_module
+import awaited
+import cache_warmer
+import deadlines
+import metrics
+import product_sources
+from barcodes import normalize_barcode
+
+flask_app = app_module.app
+
+_SCAN_ROUTE = re.compile(r"^/api/scan/([^/]+)(?:/(verdict|safe|alternatives))?$")
+_SCAN_ENDPOINTS = {None: "scan_barcode", "verdict": "scan_verdict", "safe": "scan_safe", "alternatives": "scan_alternatives"}
+# Routes that show similar barcodes when the product isn't found
+_SIMILAR_ENDPOINTS = ("scan_barcode", "scan_verdict")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_THREADS", "32")), thread_name_prefix="asgi-flask")
+    return _executor
+
+
+# -------- Upstream calls, awaited before Flask sees the request --------
+async def _prefetch_scan(raw_barcode: str, endpoint: str, query: dict):
+    barcode, error_msg = normalize_barcode(raw_barcode)
+    if error_msg:
+        return  # Flask answers the 400
+    deadlines.start(deadlines.budget_for(endpoint), outside=True)
+    if endpoint == "scan_barcode":
+        fields = app_module.parse_fields(query.get("fields", [""])[0])
+    else:
+        fields = product_sources.PRODUCT_FIELDS
+    with metrics.stage("fetch"):
+        lookup = await product_sources.lookup_product_async(barcode, fields)
+    product_sources.provide_lookup(barcode, fields, lookup)
+    if lookup.product is None and endpoint in _SIMILAR_ENDPOINTS:
+        with metrics.stage("similar"):
+            similar = await app_module.search_similar_barcodes_async(barcode, prefix_length=8, max_results=10)
+        awaited.provide(("similar", barcode, 8, 10), similar)
+
+
+async def _prefetch_check(body: bytes):
+    data = json.loads(body or b"{}")
+    if not isinstance(data, dict) or not data.get("barcode"):
+        return
+    barcode, error_msg = normalize_barcode(data["barcode"])
+    if error_msg:
+        return
+    deadlines.start(deadlines.budget_for("check_ingredients"), outside=True)
+    with metrics.stage("fetch"):
+        lookup = await product_sources.lookup_product_async(barcode)
+    product_sources.provide_lookup(barcode, product_sources.PRODUCT_FIELDS, lookup)
+
+
+def _meal_plan_setup(prompt: str):
+    # Reads profiles and may import the Gemini client: not on the event loop
+    return app_module.get_gemini_model(), app_module.meal_plan_prompt(prompt)
+
+
+async def _prefetch_meal_plan(body: bytes):
+    data = json.loads(body or b"{}")
+    prompt = data.get("prompt") if isinstance(data, dict) else None
+    if not prompt:
+        return
+    try:
+        model, context = await asyncio.get_running_loop().run_in_executor(_pool(), _meal_plan_setup, prompt)
+    except ImportError:
+        return  # Flask reports the missing library
+    if model is None:
+        return
+    try:
+        with metrics.stage("generate"):
+            response = await model.generate_content_async(context)
+        awaited.provide(("meal-plan", context), response.text)
+    except Exception as e:
+        # Re-raised in the route, which reports it as usual
+        awaited.provide(("meal-plan", context), e)
+
+
+async def _prefetch(scope: dict, body: bytes):
+    method, path = scope["method"], scope["path"]
+    if method == "GET":
+        match = _SCAN_ROUTE.match(path)
+        if match:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            await _prefetch_scan(match.group(1), _SCAN_ENDPOINTS[match.group(2)], query)
+    elif method == "POST" and path == "/api/check":
+        await _prefetch_check(body)
+    elif method == "POST" and path == "/api/generate-meal-plan":
+        await _prefetch_meal_plan(body)
+
+
+# -------- Hand-off to Flask on the thread pool --------
+def _environ(scope: dict, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _call_flask(scope: dict, body: bytes, send):
+    """Run the request through Flask on the pool, in a copy of this context, streaming the body back."""
+    loop = asyncio.get_running_loop()
+    messages: asyncio.Queue = asyncio.Queue()
+
+    def put(message):
+        loop.call_soon_threadsafe(messages.put_nowait, message)
+
+    def run():
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["start"] = ("start", int(status.split(" ", 1)[0]), headers)
+            return lambda data: put(("body", data))
+
+        try:
+            result = flask_app(_environ(scope, body), start_response)
+            try:
+                put(response["start"])
+                for chunk in result:
+                    if chunk:
+                        put(("body", chunk))
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+            put(("end",))
+        except Exception as e:
+            put(("error", e, "start" in response))
+
+    future = loop.run_in_executor(_pool(), contextvars.copy_context().run, run)
+    started = False
+    while True:
+        message = await messages.get()
+        if message[0] == "start":
+            _, status, headers = message
+            await send({
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+            })
+            started = True
+        elif message[0] == "body":
+            await send({"type": "http.response.body", "body": message[1], "more_body": True})
+        elif message[0] == "end":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            break
+        else:
+            print(f"Error serving {scope['method']} {scope['path']}: {message[1]}")
+            if not started:
+                await send({"type": "http.response.start", "status": 500,
+                            "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+            await send({"type": "http.response.body", "body": b"" if started else b"Internal Server Error",
+                        "more_body": False})
+            break
+    await future
+
+
+async def _read_body(receive) -> bytes:
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return bytes(body)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # uvicorn's workers are separate processes with nothing to share: load the datasets
+            # in the background, as the dev server does (see /api/ready)
+            threading.Thread(target=app_module.preload_dataset, daemon=True).start()
+            cache_warmer.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+    body = await _read_body(receive)
+    # Time the request from here, so the awaited upstream calls show up as stages too
+    metrics.begin()
+    try:
+        await _prefetch(scope, body)
+    except Exception as e:
+        # Flask makes the calls itself instead
+        print(f"Error prefetching for {scope['method']} {scope['path']}: {e}")
+    await _call_flask(scope, body, send)
+
+
+__all__ = ["app"]
@@ -0,0 +1,34 @@
+# backend/awaited.py
+"""
+Upstream results the async front end (asgi.py) already awaited for the
+current request.
+
+In ASGI mode the network calls of an I/O-bound route (product lookup, similar
+barcode search, meal plan generation) are made as coroutines before the
+request is handed to Flask on a worker thread. The results are provided here,
+in the request's context, and the route picks them up instead of calling out
+again. Under WSGI nothing is ever provided and every lookup misses.
+"""
+import contextvars
+from typing import Any, Hashable
+
+# key -> result (or the exception the call raised), or None outside ASGI mode
+_results: contextvars.ContextVar = contextvars.ContextVar("awaited_results", default=None)
+
+
+def provide(key: Hashable, value: Any):
+    """Record a result for the rest of the current context. An exception is re-raised by result()."""
+    results = dict(_results.get() or {})
+    results[key] = value
+    _results.set(results)
+
+
+def result(key: Hashable, default: Any = None) -> Any:
+    """The result provided for key, or default."""
+    results = _results.get()
+    if not results or key not in results:
+        return default
+    value = results[key]
+    if isinstance(value, Exception):
+        raise value
+    return value
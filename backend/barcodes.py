@@ -0,0 +1,60 @@
+# backend/barcodes.py
+"""
+GTIN barcode normalization.
+
+Scanners report the same product as UPC-A (12 digits), EAN-13 with a leading
+zero, or GTIN-14, so every barcode-keyed path canonicalizes first: one product
+maps to one cache entry and one upstream fetch, and codes with a bad check
+digit are rejected before any network call.
+
+Canonical form follows Open Food Facts: EAN-8 stays 8 digits, UPC-A /
+EAN-13 / GTIN-14 with leading zeros become 13 digits, and GTIN-14 with a
+non-zero packaging indicator stays 14 digits.
+"""
+from typing import Optional, Tuple
+
+# GTIN-8, UPC-A (GTIN-12), EAN-13 (GTIN-13), GTIN-14
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+# Separators some scanners and users include
+_SEPARATORS = str.maketrans("", "", " -.\t")
+
+
+def gtin_check_digit(body: str) -> int:
+    """Check digit for a GTIN without its last digit (weights 3,1,3,… from the right)."""
+    total = 0
+    for i, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if i % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def normalize_barcode(raw) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Validate and canonicalize a barcode.
+
+    Args:
+        raw: Barcode as scanned or typed.
+
+    Returns:
+        tuple: (canonical barcode, None), or (None, error message) if the code
+               is not a valid GTIN.
+    """
+    code = str(raw or "").strip().translate(_SEPARATORS)
+    if not code:
+        return None, "Barcode is required"
+    if not code.isascii() or not code.isdigit():
+        return None, "Barcode must contain only digits"
+    if len(code) not in GTIN_LENGTHS:
+        return None, f"Barcode must be {', '.join(map(str, GTIN_LENGTHS[:-1]))} or {GTIN_LENGTHS[-1]} digits long"
+    if gtin_check_digit(code[:-1]) != int(code[-1]):
+        return None, "Invalid barcode check digit"
+
+    if len(code) == 8:
+        return code, None
+    full = code.zfill(14)
+    return (full[1:] if full[0] == "0" else full), None
+
+
+def canonical_barcode(raw) -> Optional[str]:
+    """Canonical form of a barcode, or None if it is not a valid GTIN."""
+    return normalize_barcode(raw)[0]
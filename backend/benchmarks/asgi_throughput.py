@@ -0,0 +1,217 @@
+# backend/benchmarks/asgi_throughput.py
+"""
+Throughput of the async (ASGI) serving mode against threaded WSGI.
+
+Starts the Open Food Facts stub in-process with injected latency, then for
+each server (one process each, fresh empty product store so every scan
+reaches the stub):
+
+  wsgi-N   the Flask app on a WSGI server with a pool of N threads, like one
+           gunicorn gthread worker (GUNICORN_THREADS, 4 by default)
+  asgi     uvicorn asgi:app, one process
+
+fires --requests scans of distinct barcodes at --concurrency and reports
+requests per second, latency percentiles, errors, and the upstream calls the
+stub served. Exits with status 1 if any request failed.
+
+While requests wait on the upstream, a WSGI process serves at most N / latency
+requests per second; the async mode is bounded by concurrency and CPU. The
+stub and the load generator run in this process, so on a small machine the
+numbers include their CPU time too.
+
+The defaults are the case the async mode is for: a slow upstream and more
+requests in flight than a WSGI process has threads. On one CPU, 400 scans at
+concurrency 200 with ~1000 ms upstream latency gave asgi 58.1 req/s (p99
+4.1 s) against wsgi-32 29.9 req/s (p99 7.0 s). With a fast upstream the
+threaded server wins: at --requests 200 --concurrency 50 --latency-ms 50,
+wsgi-32 did 117.8 req/s against asgi 87.5. At 300 ms they were about even.
+
+Run from the backend directory:
+
+    python benchmarks/asgi_throughput.py [--requests 400] [--concurrency 200] [--latency-ms 1000] [--threads 4,32] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.off_stub import make_corpus, start_stub  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_wsgi(port, threads):
+    """The Flask app on werkzeug's server, handling requests on a fixed pool of threads."""
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+    from app import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledWSGIServer(BaseWSGIServer):
+        multithread = True
+        request_queue_size = 1024
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process, request, client_address)
+
+        def _process(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledWSGIServer("127.0.0.1", port, app, handler=QuietHandler)
+    server.serve_forever()
+
+
+def _start_server(kind, threads, env):
+    port = _free_port()
+    if kind == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--lifespan", "off",
+                   "--log-level", "warning", "--no-access-log", "--backlog", "1024"]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), "--serve-wsgi", str(port), "--threads", str(threads)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{kind} server didn't start")
+
+
+async def _get(host, port, path):
+    # Plain HTTP/1.1 over asyncio streams: an HTTP client library costs more CPU per
+    # request than the servers under test, and would cap the load it can generate.
+    # One connection per request, so neither server can park a thread on an idle one.
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def _load(url, barcodes, concurrency):
+    host, port = url.rsplit("/", 1)[-1].split(":")
+    latencies, statuses = [], {}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(barcode):
+        async with gate:
+            started = time.perf_counter()
+            try:
+                status = str(await asyncio.wait_for(_get(host, int(port), f"/api/scan/{barcode}"), 60))
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(barcode) for barcode in barcodes))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(barcodes),
+        "seconds": elapsed,
+        "requestsPerSecond": len(barcodes) / elapsed,
+        "p50Ms": statistics.median(latencies),
+        "p95Ms": latencies[int(len(latencies) * 0.95) - 1],
+        "p99Ms": latencies[int(len(latencies) * 0.99) - 1],
+        "statuses": statuses,
+    }
+
+
+def run(requests, concurrency, latency_ms, thread_counts):
+    corpus = make_corpus(requests * (len(thread_counts) + 1), seed=3)
+    stub, stub_url, served = start_stub(corpus, latency_ms=latency_ms, seed=3)
+    barcodes = list(corpus)
+    store_dir = tempfile.mkdtemp(prefix="asgi-bench-")
+    servers = [(f"wsgi-{n}", "wsgi", n) for n in thread_counts] + [("asgi", "asgi", None)]
+    report = {"latencyMs": latency_ms, "concurrency": concurrency, "servers": {}}
+    try:
+        for i, (name, kind, threads) in enumerate(servers):
+            env = dict(os.environ,
+                       OFF_BASE_URL=stub_url,
+                       PRODUCT_STORE_PATH=os.path.join(store_dir, f"{name}.sqlite3"),
+                       PRODUCT_SOURCES="memory,store,remote",
+                       CACHE_WARM_DELAY_SECONDS="3600",
+                       REQUEST_BUDGETS="scan_barcode=60")
+            process, url = _start_server(kind, threads, env)
+            before = dict(served)
+            try:
+                # Each server gets its own barcodes, so every scan is a cache miss
+                result = asyncio.run(_load(url, barcodes[i * requests:(i + 1) * requests], concurrency))
+            finally:
+                process.terminate()
+                process.wait()
+            result["upstreamCalls"] = {k: served[k] - before[k] for k in served}
+            report["servers"][name] = result
+    finally:
+        stub.shutdown()
+    report["failures"] = [
+        f"{name}: {sum(n for s, n in r['statuses'].items() if s != '200')} of {r['requests']} requests failed"
+        for name, r in report["servers"].items() if r["statuses"].get("200", 0) != r["requests"]
+    ]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="scans per server")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=1000.0, help="mean stub latency")
+    parser.add_argument("--threads", default="4,32", help="WSGI thread pool sizes to compare")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--serve-wsgi", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_wsgi:
+        serve_wsgi(args.serve_wsgi, int(args.threads))
+        return
+
+    thread_counts = [int(n) for n in args.threads.split(",") if n.strip()]
+    report = run(args.requests, args.concurrency, args.latency_ms, thread_counts)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.requests} cold scans per server, concurrency {args.concurrency}, "
+              f"stub latency ~{args.latency_ms:.0f} ms")
+        for name, r in report["servers"].items():
+            print(f"  {name:<8} {r['requestsPerSecond']:>8.1f} req/s   p50 {r['p50Ms']:>7.0f} ms   "
+                  f"p95 {r['p95Ms']:>7.0f} ms   p99 {r['p99Ms']:>7.0f} ms   upstream {r['upstreamCalls']['product']}")
+        for failure in report["failures"]:
+            print(f"FAILED: {failure}")
+
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
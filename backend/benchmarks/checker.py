@@ -0,0 +1,284 @@
+# backend/benchmarks/checker.py
+"""
+Micro-benchmarks for the checking hot paths, on synthetic datasets.
+
+Writes stand-in food classification and allergens tables as dataset
+snapshots in a throwaway DATASET_SNAPSHOT_DIR and loads them through the
+dataset registry, the way a process start does, so no Kaggle download is
+needed. Then, for each dataset size, times:
+
+  get_food_classification                exact name, substring and miss lookups
+  get_ingredient_allergens               per ingredient name
+  parse_ingredients                      uncached tokenizer, per ingredient list
+  check_allergens_from_product_data      tagged (taxonomy ids) and free-text products
+  check_ingredient_against_restrictions  every ingredient of a product
+  meal plan check                        /api/check-meal-plan without the HTTP layer
+
+across ingredient counts (per product, or items per meal plan) and profile
+sizes (allergies plus diet restrictions). Every result is one row keyed by
+(case, datasetSize, ingredients, profileSize), with null for a dimension the
+case doesn't depend on, and microseconds per call.
+
+Save a run with --json and pass it as --baseline to a later run to compare:
+the run exits with status 1 if a case got slower than --tolerance times its
+baseline.
+
+Run from the backend directory:
+
+    python benchmarks/checker.py [--dataset-sizes 1000 10000 50000] [--ingredients 5 20 80]
+                                 [--profile-sizes 1 4 12] [--json] [--baseline old.json]
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Before the dataset package reads it
+os.environ["DATASET_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="checker-bench-")
+atexit.register(shutil.rmtree, os.environ["DATASET_SNAPSHOT_DIR"], True)
+os.environ["DATASET_SNAPSHOTS"] = "1"
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.ingredient_parser import WORDS, synthetic_text  # noqa: E402
+from dataset import allergens_dataset, food_classification, ingredient_parser, registry  # noqa: E402
+from dataset.allergens_dataset import get_ingredient_allergens  # noqa: E402
+from dataset.food_classification import get_food_classification  # noqa: E402
+from dataset.ingredient_checker import check_ingredient_against_restrictions  # noqa: E402
+from dataset.snapshot import save_snapshot  # noqa: E402
+
+ALLERGIES = ["Milk", "Peanuts", "Tree Nuts", "Eggs", "Soy", "Wheat", "Fish", "Shellfish", "Sesame",
+             "Mustard", "Celery", "Lupin"]
+RESTRICTIONS = ["Vegan", "Gluten-Free", "Halal", "Vegetarian", "Kosher"]
+# Allergen the stand-in allergens table gives an ingredient word, if any
+WORD_ALLERGENS = {"skimmed milk powder": "Milk", "whey": "Milk", "hazelnuts": "Tree Nuts", "soy lecithin": "Soy",
+                  "wheat flour": "Wheat", "egg yolk": "Eggs", "barley malt": "Gluten", "cocoa butter": None}
+QUALIFIERS = ["organic", "roasted", "dried", "powdered", "refined", "whole", "raw", "smoked", "sweetened"]
+DISHES = ["Oatmeal with milk", "Grilled chicken salad", "Lentil soup", "Peanut butter toast", "Rice and beans",
+          "Salmon with potatoes", "Tofu stir fry", "Greek yogurt with honey", "Pasta with tomato sauce"]
+MEAL_HEADERS = ["Breakfast:", "Lunch:", "Dinner:", "Snack:"]
+
+
+# -------- Synthetic datasets --------
+def classification_frame(size, seed=0):
+    """Food names with yes/no/missing diet flags, shaped like the Kaggle JSON after normalization."""
+    rng = random.Random(seed)
+    base = WORDS + [dish.lower() for dish in DISHES]
+    names = base[:size] + [f"{rng.choice(QUALIFIERS)} {rng.choice(base)} {i}" for i in range(max(size - len(base), 0))]
+
+    def flag():
+        return rng.choice(["Yes", "No", None])
+
+    return pd.DataFrame({
+        "food_name": names,
+        "vegan": [flag() for _ in names],
+        "vegetarian": [flag() for _ in names],
+        "halal": [flag() for _ in names],
+        "kosher": [flag() for _ in names],
+        "gluten free": [flag() for _ in names],
+    })
+
+
+def allergens_frame(size, seed=0):
+    """Ingredient rows with an allergen, most of them none."""
+    rng = random.Random(seed)
+    ingredients, allergens = [], []
+    for i in range(size):
+        word = rng.choice(WORDS)
+        ingredients.append(word if i < len(WORDS) else f"{rng.choice(QUALIFIERS)} {word} {i}")
+        allergens.append(WORD_ALLERGENS.get(word) or (rng.choice(ALLERGIES) if rng.random() < 0.05 else None))
+    return pd.DataFrame({"ingredient": ingredients, "allergen": allergens})
+
+
+def install_datasets(size, seed=0):
+    """Snapshot stand-in tables of `size` rows and (re)load them through the registry."""
+    # Snapshot and registry messages would end up in the JSON output
+    with contextlib.redirect_stdout(sys.stderr):
+        packed = food_classification._pack_classification(classification_frame(size, seed))
+        save_snapshot("food_classification", food_classification._SNAPSHOT_VERSION, {"data": packed},
+                      {"restrictions": list(food_classification.RESTRICTIONS)})
+
+        df = allergens_frame(size, seed)
+        name_lower = allergens_dataset._build_allergens_index(df)
+        save_snapshot("allergens", allergens_dataset._SNAPSHOT_VERSION,
+                      {"data": df, "index": name_lower.to_frame("name_lower")})
+
+        for name in ("food_classification", "allergens"):
+            registry.evict_dataset(name)
+            if registry.get_dataset(name) is None:
+                raise RuntimeError(f"Synthetic {name} dataset didn't load")
+
+
+# -------- Inputs --------
+def make_profile(size):
+    """`size` allergies and restrictions, alternating, most common first."""
+    allergies, restrictions = [], []
+    for i in range(size):
+        if i % 2 == 0 or len(restrictions) == len(RESTRICTIONS):
+            allergies.append(ALLERGIES[len(allergies) % len(ALLERGIES)])
+        else:
+            restrictions.append(RESTRICTIONS[len(restrictions)])
+    return {"allergies": allergies, "restrictions": restrictions}
+
+
+def make_products(count, seed=0):
+    """A tagged product (taxonomy ids) and an untagged one (free-text allergens) with about `count` ingredients."""
+    rng = random.Random(seed)
+    names = [rng.choice(WORDS) for _ in range(count)]
+    text = synthetic_text(count, seed=seed)
+    tagged = {
+        "product_name": "Synthetic Spread",
+        "ingredients_text": text,
+        "ingredients": [{"id": "en:" + name.replace(" ", "-"), "text": name} for name in names],
+        "allergens_tags": sorted({f"en:{WORD_ALLERGENS[n].lower()}" for n in names if WORD_ALLERGENS.get(n)}),
+    }
+    untagged = {
+        "product_name": "Synthetic Spread",
+        "ingredients_text": text,
+        "allergens": ", ".join(f"en:{n}" for n in names),
+        "allergens_from_ingredients": ", ".join(names[: count // 2]),
+    }
+    return tagged, untagged
+
+
+def make_meal_plan(items, seed=0):
+    """A meal plan text with day and meal headers around `items` food lines."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(items):
+        if i % 4 == 0:
+            lines.append(f"Day {i // 4 + 1}")
+        lines.append(MEAL_HEADERS[i % 4])
+        lines.append(rng.choice(DISHES))
+    return "\n".join(lines)
+
+
+def lookup_names(size, seed=0):
+    """Names that hit exactly, hit as a substring, and miss the classification table."""
+    rng = random.Random(seed)
+    exact = [rng.choice(WORDS) for _ in range(20)]
+    substring = [rng.choice(QUALIFIERS) for _ in range(20)] if size > len(WORDS) + len(DISHES) else exact
+    miss = [f"unlisted ingredient {i}" for i in range(20)]
+    return exact, substring, miss
+
+
+# -------- Timing --------
+def _per_call_us(func, calls, repeat):
+    """Microseconds per call: best of `repeat` runs, each long enough (~0.1 s) to time reliably."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * 0.1 / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number / calls * 1e6
+
+
+def _row(case, dataset_size, ingredients, profile_size, per_call_us, unit):
+    return {"case": case, "datasetSize": dataset_size, "ingredients": ingredients, "profileSize": profile_size,
+            "perCallUs": per_call_us, "per": unit}
+
+
+def _each(func, items):
+    def run():
+        for item in items:
+            func(item)
+    return run
+
+
+def run(dataset_sizes, ingredient_counts, profile_sizes, repeat):
+    results = []
+    with contextlib.redirect_stdout(sys.stderr):
+        profiles = {size: make_profile(size) for size in profile_sizes}
+        products = {count: make_products(count, seed=count) for count in ingredient_counts}
+
+        # Dataset-independent: parsing and the product allergen fields
+        for count in ingredient_counts:
+            text = products[count][0]["ingredients_text"]
+            results.append(_row("parse_ingredients", None, count, None,
+                                _per_call_us(lambda: ingredient_parser._tokenize(text), 1, repeat), "list"))
+            for size in profile_sizes:
+                profile = profiles[size]
+                for label, product in zip(("tagged", "untagged"), products[count]):
+                    results.append(_row(f"check_allergens_from_product_data[{label}]", None, count, size, _per_call_us(
+                        lambda: app.check_allergens_from_product_data(product, profile), 1, repeat), "product"))
+
+        for dataset_size in dataset_sizes:
+            install_datasets(dataset_size)
+            exact, substring, miss = lookup_names(dataset_size)
+            for label, names in (("exact", exact), ("substring", substring), ("miss", miss)):
+                results.append(_row(f"get_food_classification[{label}]", dataset_size, None, None,
+                                    _per_call_us(_each(get_food_classification, names), len(names), repeat), "lookup"))
+            names = exact + miss
+            results.append(_row("get_ingredient_allergens", dataset_size, None, None,
+                                _per_call_us(_each(get_ingredient_allergens, names), len(names), repeat), "lookup"))
+
+            for count in ingredient_counts:
+                ingredients, _ = app.extract_ingredients(products[count][0])
+                meal_plan = make_meal_plan(count, seed=count)
+                for size in profile_sizes:
+                    profile = profiles[size]
+                    results.append(_row("check_ingredient_against_restrictions", dataset_size, count, size, _per_call_us(
+                        _each(lambda ing: check_ingredient_against_restrictions(ing, profile), ingredients),
+                        1, repeat), "product"))
+                    results.append(_row("check_meal_plan", dataset_size, count, size, _per_call_us(
+                        lambda: app.check_meal_plan_items(app.meal_plan_food_items(meal_plan), profile),
+                        1, repeat), "meal plan"))
+    return results
+
+
+def _key(row):
+    return (row["case"], row["datasetSize"], row["ingredients"], row["profileSize"])
+
+
+def compare(results, baseline, tolerance):
+    """Failures for cases more than `tolerance` times slower than in the baseline report."""
+    before = {_key(row): row["perCallUs"] for row in baseline.get("results", [])}
+    failures = []
+    for row in results:
+        old = before.get(_key(row))
+        if old and row["perCallUs"] > old * tolerance:
+            failures.append(f"{row['case']} (dataset {row['datasetSize']}, ingredients {row['ingredients']}, "
+                            f"profile {row['profileSize']}): {old:.1f} -> {row['perCallUs']:.1f} us")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset-sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--ingredients", type=int, nargs="+", default=[5, 20, 80])
+    parser.add_argument("--profile-sizes", type=int, nargs="+", default=[1, 4, 12])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown factor that counts as a regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    results = run(args.dataset_sizes, args.ingredients, args.profile_sizes, args.repeat)
+    failures = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            failures = compare(results, json.load(f), args.tolerance)
+
+    if args.json:
+        print(json.dumps({"benchmark": "checker", "results": results, "failures": failures}, indent=2))
+    else:
+        print(f"{'case':<50} {'dataset':>8} {'ingr.':>6} {'profile':>8} {'us/call':>11}  per")
+        for r in results:
+            dims = [("-" if r[k] is None else r[k]) for k in ("datasetSize", "ingredients", "profileSize")]
+            print(f"{r['case']:<50} {dims[0]:>8} {dims[1]:>6} {dims[2]:>8} {r['perCallUs']:>11.1f}  {r['per']}")
+        for failure in failures:
+            print(f"FAILED: {failure}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# backend/benchmarks/ingredient_parser.py
+"""
+Micro-benchmark for ingredient parsing.
+
+Compares, on synthetic Open Food Facts-style ingredient texts of growing
+size, the old comma split used by /api/check against the single-pass
+tokenizer (uncached) and the memoized parse_ingredients() (cache hits).
+
+Run from the backend directory:
+
+    python benchmarks/ingredient_parser.py [--sizes 5 20 80 320] [--repeat 2000] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dataset import ingredient_parser  # noqa: E402
+
+WORDS = ["sugar", "palm oil", "hazelnuts", "skimmed milk powder", "cocoa butter", "soy lecithin",
+         "wheat flour", "salt", "vanillin", "whey", "glucose syrup", "rapeseed oil", "egg yolk",
+         "barley malt", "natural flavouring", "emulsifier", "acidity regulator", "citric acid"]
+
+
+def synthetic_text(count, seed=0):
+    """An ingredient list of about `count` items with nested groups and percentages."""
+    rng = random.Random(seed)
+    parts = []
+    remaining = count
+    while remaining > 0:
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < 0.2 and remaining > 3:
+            inner = ", ".join(rng.choice(WORDS) for _ in range(2))
+            nested = f"{rng.choice(WORDS)} ({rng.choice(WORDS)}, {rng.choice(WORDS)} [{inner}])"
+            parts.append(f"{word} {rng.randint(1, 40)}% ({nested})")
+            remaining -= 5
+        elif roll < 0.4:
+            parts.append(f"{word} ({rng.randint(1, 30)},{rng.randint(0, 9)}%)")
+            remaining -= 1
+        else:
+            parts.append(word)
+            remaining -= 1
+    return ", ".join(parts) + "."
+
+
+def legacy_split(ingredients_text):
+    """The comma split /api/check used before parse_ingredients()."""
+    ingredients_list = [ing.strip() for ing in str(ingredients_text).split(",") if ing.strip()]
+    for ing in ingredients_list[:]:
+        if "(" in ing and ")" in ing:
+            start = ing.find("(")
+            end = ing.find(")")
+            if start < end:
+                nested = ing[start+1:end].strip()
+                ingredients_list.extend([n.strip() for n in nested.split(",") if n.strip()])
+    return ingredients_list
+
+
+def _per_call_us(func, repeat):
+    return min(timeit.repeat(func, number=repeat, repeat=3)) / repeat * 1e6
+
+
+def run(sizes, repeat):
+    results = []
+    for size in sizes:
+        text = synthetic_text(size, seed=size)
+        ingredient_parser.parse_ingredients(text)  # warm the memo cache
+        results.append({
+            "ingredients": size,
+            "chars": len(text),
+            "legacyItems": len(legacy_split(text)),
+            "parsedItems": len(ingredient_parser.parse_ingredients(text)),
+            "legacySplitUs": _per_call_us(lambda: legacy_split(text), repeat),
+            "tokenizeUs": _per_call_us(lambda: ingredient_parser._tokenize(text), repeat),
+            "memoizedUs": _per_call_us(lambda: ingredient_parser.parse_ingredients(text), repeat),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 80, 320])
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.json:
+        print(json.dumps({"benchmark": "ingredient_parser", "results": results}, indent=2))
+        return
+
+    print(f"{'items':>6} {'chars':>7} {'legacy items':>13} {'parsed items':>13} "
+          f"{'legacy us':>10} {'tokenize us':>12} {'memoized us':>12}")
+    for r in results:
+        print(f"{r['ingredients']:>6} {r['chars']:>7} {r['legacyItems']:>13} {r['parsedItems']:>13} "
+              f"{r['legacySplitUs']:>10.1f} {r['tokenizeUs']:>12.1f} {r['memoizedUs']:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# backend/benchmarks/load_test.py
+"""
+End-to-end load test: one app instance against the Open Food Facts stub.
+
+Starts benchmarks/off_stub.py in-process (synthetic or --corpus products,
+injected latency and errors), then for each --rates step starts a fresh
+server process with an empty product store and scratch profile and history
+files, creates --profiles profiles and replays a request trace at that many
+requests per second:
+
+    scan     GET  /api/scan/<barcode>
+    check    POST /api/check {"barcode": ...} (?profiles=all when asked)
+    switch   POST /api/profiles/active
+
+Requests are sent on schedule whether or not earlier ones have finished,
+and latency is measured from the scheduled time, so a server that falls
+behind shows it in the percentiles instead of slowing the load down. Each
+step reports throughput, latency percentiles per operation, statuses, the
+upstream calls the stub served and the server's product source tier stats.
+The sustained rate is the highest step whose p99 stays under --max-p99-ms
+while keeping up with the target; the run exits with status 1 if no step
+does.
+
+Trace files are JSON lines, replayed in order (a line without "op" is a scan):
+
+    {"op": "scan", "barcode": "3017620422003"}
+    {"op": "check", "barcode": "3017620422003", "profiles": "all"}
+    {"op": "switch", "profile": 1}            (index or name of a created profile)
+
+Without --trace, a synthetic trace is drawn from the corpus with a skewed
+popularity (--skew) and some unknown barcodes (--missing-rate); save it with
+--write-trace to replay the same requests later.
+
+The datasets are synthetic stand-ins of --dataset-size rows (see
+benchmarks/checker.py); pass --dataset-size 0 to load the real ones from
+backend/.snapshots or Kaggle.
+
+Run from the backend directory:
+
+    python benchmarks/load_test.py [--rates 10 20 40] [--requests 600] [--server wsgi|asgi] [--threads 4]
+                                   [--latency-ms 100] [--error-rate 0.02] [--trace trace.jsonl] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.asgi_throughput import _free_port  # noqa: E402
+from benchmarks.off_stub import load_corpus, make_barcode, make_corpus, start_stub  # noqa: E402
+
+OPERATIONS = ("scan", "check", "switch")
+PROFILES = [
+    {"allergies": ["Milk"], "restrictions": []},
+    {"allergies": ["Peanuts", "Tree Nuts"], "restrictions": ["Vegan"]},
+    {"allergies": [], "restrictions": ["Gluten-Free", "Halal"]},
+    {"allergies": ["Eggs", "Soy", "Sesame"], "restrictions": ["Vegetarian", "Kosher"]},
+]
+
+
+# -------- Server process --------
+def serve(kind, port, threads, data_dir, dataset_size):
+    """The app on one process: a pooled WSGI server or uvicorn, with scratch data files."""
+    if dataset_size:
+        # Points DATASET_SNAPSHOT_DIR at a scratch directory before the dataset package loads
+        from benchmarks import checker
+        checker.install_datasets(dataset_size)
+    import app as app_module
+    # Profiles, history and meal plans live next to app.py; leave those alone
+    for attr in ("PROFILES_FILE", "PROFILE_FILE", "HISTORY_FILE", "MEAL_PLANS_FILE"):
+        setattr(app_module, attr, os.path.join(data_dir, os.path.basename(getattr(app_module, attr))))
+    # As gunicorn's master does before forking, so the port opens once datasets are in
+    app_module.preload_dataset()
+
+    if kind == "asgi":
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning",
+                    access_log=False, backlog=1024)
+    else:
+        from benchmarks.asgi_throughput import serve_wsgi
+        serve_wsgi(port, threads)
+
+
+def _start_server(kind, threads, dataset_size, env):
+    port = _free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--serve", kind, str(port), "--threads", str(threads),
+               "--data-dir", tempfile.mkdtemp(prefix="load-test-data-"), "--dataset-size", str(dataset_size)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{kind} server didn't start")
+
+
+# -------- Traces --------
+def read_trace(path):
+    """Trace entries from a JSON lines file; lines that aren't a known operation are skipped."""
+    entries, skipped = [], 0
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            op = entry.get("op", "scan") if isinstance(entry, dict) else None
+            if op not in OPERATIONS or (op != "switch" and not entry.get("barcode")):
+                skipped += 1
+                continue
+            entries.append(dict(entry, op=op))
+    if skipped:
+        print(f"Skipped {skipped} trace lines that aren't scan, check or switch requests", file=sys.stderr)
+    return entries
+
+
+def make_trace(count, barcodes, mix, missing_rate, skew, profiles, seed=0):
+    """`count` requests: operations drawn by `mix`, barcodes by a Zipf-like popularity over `barcodes`."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** skew for rank in range(len(barcodes))]
+    ops, op_weights = zip(*mix.items())
+    trace = []
+    for _ in range(count):
+        op = rng.choices(ops, op_weights)[0]
+        if op == "switch":
+            trace.append({"op": op, "profile": rng.randrange(profiles)})
+            continue
+        barcode = make_barcode(rng) if rng.random() < missing_rate else rng.choices(barcodes, weights)[0]
+        trace.append({"op": op, "barcode": barcode})
+    return trace
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation in --mix: {op}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+# -------- Client --------
+async def _http(port, method, path, body=None):
+    # Plain HTTP/1.1 over asyncio streams, one connection per request (see asgi_throughput.py)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        data = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nConnection: close\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+        writer.write(head.encode() + b"\r\n" + data)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split(b" ", 2)[1]), rest.partition(b"\r\n\r\n")[2]
+
+
+async def _create_profiles(port, count):
+    ids, names = [], []
+    for i in range(count):
+        name = f"Load test {i}"
+        status, body = await _http(port, "POST", "/api/profiles", dict(PROFILES[i % len(PROFILES)], name=name))
+        if status != 201:
+            raise RuntimeError(f"Creating profile {name} failed with status {status}")
+        ids.append(json.loads(body)["profile"]["id"])
+        names.append(name)
+    await _http(port, "POST", "/api/profiles/active", {"profileId": ids[0]})
+    return ids, names
+
+
+def _request_for(entry, profile_ids, profile_names):
+    op = entry["op"]
+    if op == "scan":
+        return "GET", f"/api/scan/{entry['barcode']}", None
+    if op == "check":
+        query = f"?profiles={entry['profiles']}" if entry.get("profiles") else ""
+        return "POST", f"/api/check{query}", {"barcode": entry["barcode"]}
+    profile = entry.get("profile", 0)
+    if isinstance(profile, int):
+        profile_id = profile_ids[profile % len(profile_ids)]
+    elif profile in profile_names:
+        profile_id = profile_ids[profile_names.index(profile)]
+    else:
+        profile_id = profile_ids[zlib.crc32(str(profile).encode()) % len(profile_ids)]
+    return "POST", "/api/profiles/active", {"profileId": profile_id}
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {"count": 0}
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "p50Ms": statistics.median(latencies),
+        "p90Ms": latencies[max(int(len(latencies) * 0.90) - 1, 0)],
+        "p99Ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)],
+        "maxMs": latencies[-1],
+    }
+
+
+async def _replay(port, trace, rate, max_in_flight, timeout, profile_ids, profile_names):
+    gate = asyncio.Semaphore(max_in_flight)
+    latencies = {op: [] for op in OPERATIONS}
+    statuses = {op: {} for op in OPERATIONS}
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def one(i, entry):
+        scheduled = started + i / rate
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        method, path, body = _request_for(entry, profile_ids, profile_names)
+        async with gate:
+            try:
+                status, _ = await asyncio.wait_for(_http(port, method, path, body), timeout)
+                status = str(status)
+            except Exception as e:
+                status = type(e).__name__
+        latencies[entry["op"]].append((loop.time() - scheduled) * 1000)
+        statuses[entry["op"]][status] = statuses[entry["op"]].get(status, 0) + 1
+
+    await asyncio.gather(*(one(i, entry) for i, entry in enumerate(trace)))
+    elapsed = loop.time() - started
+    everything = [ms for op in OPERATIONS for ms in latencies[op]]
+    return {
+        "targetRate": rate,
+        "requests": len(trace),
+        "seconds": elapsed,
+        "requestsPerSecond": len(trace) / elapsed,
+        "latency": _percentiles(everything),
+        "operations": {op: {**_percentiles(latencies[op]), "statuses": statuses[op]}
+                       for op in OPERATIONS if latencies[op]},
+        # Transport errors, timeouts and 5xx; a 404 for an unknown barcode is an answer
+        "failed": sum(n for op in OPERATIONS for s, n in statuses[op].items() if not s.isdigit() or int(s) >= 500),
+    }
+
+
+async def _step(port, trace, rate, profiles, max_in_flight, timeout):
+    profile_ids, profile_names = await _create_profiles(port, profiles)
+    result = await _replay(port, trace, rate, max_in_flight, timeout, profile_ids, profile_names)
+    status, body = await _http(port, "GET", "/api/admin/sources")
+    result["sources"] = json.loads(body).get("tiers") if status == 200 else None
+    return result
+
+
+def run(trace, corpus, rates, server, threads, profiles, latency_ms, error_rate, dataset_size,
+        max_in_flight=1000, timeout=30.0, max_p99_ms=1000.0):
+    stub, stub_url, served = start_stub(corpus, latency_ms=latency_ms, error_rate=error_rate, seed=5)
+    store_dir = tempfile.mkdtemp(prefix="load-test-")
+    report = {"server": server, "threads": threads, "latencyMs": latency_ms, "errorRate": error_rate,
+              "corpus": len(corpus), "requests": len(trace), "maxP99Ms": max_p99_ms, "steps": []}
+    try:
+        for rate in rates:
+            env = dict(os.environ,
+                       OFF_BASE_URL=stub_url,
+                       PRODUCT_STORE_PATH=os.path.join(store_dir, f"{server}-{rate}.sqlite3"),
+                       PRODUCT_SOURCES="memory,store,remote",
+                       CACHE_WARM_DELAY_SECONDS="3600",
+                       ASGI_THREADS=str(threads))
+            env.pop("ADMIN_TOKEN", None)
+            process, port = _start_server(server, threads, dataset_size, env)
+            before = dict(served)
+            try:
+                result = asyncio.run(_step(port, trace, rate, profiles, max_in_flight, timeout))
+            finally:
+                process.terminate()
+                process.wait()
+            result["upstreamCalls"] = {k: served[k] - before[k] for k in served}
+            result["sustained"] = (result["latency"].get("p99Ms", 0) <= max_p99_ms
+                                   and result["requestsPerSecond"] >= 0.9 * rate)
+            report["steps"].append(result)
+    finally:
+        stub.shutdown()
+    sustained = [step["targetRate"] for step in report["steps"] if step["sustained"]]
+    report["sustainedRate"] = max(sustained) if sustained else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=float, nargs="+", default=[10, 20, 40], help="target requests per second, one step each")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--threads", type=int, default=4, help="server threads (GUNICORN_THREADS / ASGI_THREADS)")
+    parser.add_argument("--trace", help="JSON lines trace to replay instead of a synthetic one")
+    parser.add_argument("--write-trace", help="save the synthetic trace to this file")
+    parser.add_argument("--requests", type=int, default=600, help="synthetic trace length")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("scan=0.7,check=0.25,switch=0.05"))
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of barcode popularity")
+    parser.add_argument("--missing-rate", type=float, default=0.05, help="fraction of unknown barcodes")
+    parser.add_argument("--profiles", type=int, default=3, help="profiles to create and switch between")
+    parser.add_argument("--products", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--corpus", help="JSON file with products instead of a synthetic corpus")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="mean stub latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests answered with 503")
+    parser.add_argument("--dataset-size", type=int, default=10000, help="rows per synthetic dataset; 0 for the real datasets")
+    parser.add_argument("--max-p99-ms", type=float, default=1000.0, help="p99 a sustained step stays under")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="client connection limit")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request client timeout, seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--serve", nargs=2, metavar=("KIND", "PORT"), help=argparse.SUPPRESS)
+    parser.add_argument("--data-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]), args.threads, args.data_dir, args.dataset_size)
+        return
+
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.products, args.seed)
+    if args.trace:
+        trace = read_trace(args.trace)
+    else:
+        trace = make_trace(args.requests, list(corpus), args.mix, args.missing_rate, args.skew, args.profiles, args.seed)
+        if args.write_trace:
+            with open(args.write_trace, 'w') as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in trace)
+
+    report = run(trace, corpus, args.rates, args.server, args.threads, args.profiles, args.latency_ms,
+                 args.error_rate, args.dataset_size, args.max_in_flight, args.timeout, args.max_p99_ms)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{len(trace)} requests per step on {args.server} ({args.threads} threads), "
+              f"stub latency ~{args.latency_ms:.0f} ms, error rate {args.error_rate:.0%}")
+        for step in report["steps"]:
+            latency = step["latency"]
+            print(f"  target {step['targetRate']:>6.1f}/s  achieved {step['requestsPerSecond']:>6.1f}/s   "
+                  f"p50 {latency['p50Ms']:>7.0f} ms   p90 {latency['p90Ms']:>7.0f} ms   p99 {latency['p99Ms']:>7.0f} ms   "
+                  f"failed {step['failed']:>4}   upstream {step['upstreamCalls']['product']:>5}"
+                  f"{'' if step['sustained'] else '   (not sustained)'}")
+            for op, stats in step["operations"].items():
+                print(f"      {op:<7} n={stats['count']:<5} p50 {stats['p50Ms']:>7.0f} ms   p99 {stats['p99Ms']:>7.0f} ms   "
+                      f"{stats['statuses']}")
+        rate = report["sustainedRate"]
+        print(f"sustained: {rate:.1f} requests/s with p99 under {args.max_p99_ms:.0f} ms" if rate is not None
+              else f"FAILED: no step kept p99 under {args.max_p99_ms:.0f} ms")
+
+    sys.exit(0 if report["sustainedRate"] is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
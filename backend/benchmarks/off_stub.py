@@ -0,0 +1,222 @@
+# backend/benchmarks/off_stub.py
+"""
+Local stand-in for the Open Food Facts API.
+
+Serves a synthetic (or JSON file) product corpus on the two endpoints the
+backend uses, with optional injected latency and errors:
+
+    GET /api/v0/product/<barcode>.json   {"status": 1, "product": {...}} or {"status": 0}
+    GET /cgi/search.pl?search_terms=...  {"products": [...]} (barcode prefix match)
+    GET /cgi/search.pl?tagtype_0=categories&tag_0=...  products in a category
+    GET /__stats                         requests served, by endpoint
+
+Point the backend at it with OFF_BASE_URL=http://127.0.0.1:<port>.
+
+Run from the backend directory:
+
+    python benchmarks/off_stub.py [--port 8081] [--products 1000] [--latency-ms 50] [--error-rate 0.05]
+    python benchmarks/off_stub.py --corpus products.json
+
+or import start_stub() to run it in a background thread.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from barcodes import gtin_check_digit  # noqa: E402
+
+INGREDIENTS = [
+    ("sugar", "en:sugar"), ("palm oil", "en:palm-oil"), ("hazelnuts", "en:hazelnut"),
+    ("skimmed milk powder", "en:skimmed-milk-powder"), ("cocoa", "en:cocoa"),
+    ("soy lecithin", "en:soya-lecithin"), ("wheat flour", "en:wheat-flour"), ("salt", "en:salt"),
+    ("whey", "en:whey"), ("egg yolk", "en:egg-yolk"), ("rapeseed oil", "en:rapeseed-oil"),
+    ("sesame seeds", "en:sesame-seeds"), ("peanuts", "en:peanuts"), ("water", "en:water"),
+    ("tomato", "en:tomato"), ("rice", "en:rice"), ("gelatin", "en:gelatin"), ("pork", "en:pork"),
+]
+# Ingredient id -> allergen tag it implies
+ALLERGENS = {
+    "en:hazelnut": "en:nuts", "en:skimmed-milk-powder": "en:milk", "en:whey": "en:milk",
+    "en:soya-lecithin": "en:soybeans", "en:wheat-flour": "en:gluten", "en:egg-yolk": "en:eggs",
+    "en:sesame-seeds": "en:sesame-seeds", "en:peanuts": "en:peanuts",
+}
+CATEGORIES = ["en:spreads", "en:biscuits", "en:sauces", "en:breakfast-cereals", "en:snacks", "en:beverages"]
+
+
+def make_barcode(rng):
+    """A random EAN-13 with a valid check digit."""
+    body = "".join(rng.choice("0123456789") for _ in range(12))
+    return body + str(gtin_check_digit(body))
+
+
+def make_product(barcode, rng):
+    """A product record shaped like an Open Food Facts v0 product."""
+    picked = rng.sample(INGREDIENTS, rng.randint(3, 9))
+    allergens = sorted({ALLERGENS[i] for _, i in picked if i in ALLERGENS})
+    name = f"{rng.choice(['Choco', 'Crunchy', 'Classic', 'Organic', 'Spicy'])} {rng.choice(['Spread', 'Bar', 'Sauce', 'Crackers', 'Drink'])}"
+    return {
+        "code": barcode,
+        "product_name": name,
+        "brands": rng.choice(["Acme", "Foodco", "Nordic", "Maison"]),
+        "categories_tags": [rng.choice(CATEGORIES)],
+        "ingredients_text": ", ".join(text for text, _ in picked),
+        "ingredients": [{"id": i, "text": text} for text, i in picked],
+        "allergens_tags": allergens,
+        "allergens": ",".join(allergens),
+        "image_url": f"https://images.example.invalid/{barcode}.jpg",
+        "image_front_small_url": f"https://images.example.invalid/{barcode}.200.jpg",
+        # Bulk that real records carry and the frontend never renders
+        "nutriments": {f"nutrient-{n}_100g": rng.random() * 10 for n in range(80)},
+        "images": {str(n): {"sizes": {"100": {"h": 100, "w": 75}, "400": {"h": 400, "w": 300}}} for n in range(12)},
+        "languages_codes": {lc: rng.randint(1, 9) for lc in ("en", "fr", "de", "es", "it", "nl")},
+        "product_name_fr": name, "product_name_de": name, "product_name_es": name,
+    }
+
+
+def make_corpus(count, seed=0):
+    """`count` synthetic products keyed by barcode."""
+    rng = random.Random(seed)
+    corpus = {}
+    while len(corpus) < count:
+        barcode = make_barcode(rng)
+        corpus[barcode] = make_product(barcode, rng)
+    return corpus
+
+
+def load_corpus(path):
+    """A JSON corpus file: a list of products or a {barcode: product} object."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {str(p["code"]): p for p in data}
+    return data
+
+
+def _project(product, fields):
+    if not fields:
+        return product
+    return {k: product[k] for k in fields if k in product}
+
+
+def make_handler(corpus, latency_ms=0.0, error_rate=0.0, seed=None):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    # Read on every request, so a caller can start or end a brownout (see start_stub)
+    faults = {"latency_ms": latency_ms, "error_rate": error_rate}
+    stats = {"product": 0, "search": 0, "errors": 0, "other": 0}
+    stats_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up (e.g. its timeout was shorter than the injected latency)
+                pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/__stats":
+                with stats_lock:
+                    return self._send(200, dict(stats))
+
+            endpoint = "product" if url.path.startswith("/api/") else "search" if url.path == "/cgi/search.pl" else "other"
+            with stats_lock:
+                stats[endpoint] += 1
+            with rng_lock:
+                latency_ms, error_rate = faults["latency_ms"], faults["error_rate"]
+                delay = latency_ms * (0.5 + rng.random()) / 1000 if latency_ms else 0
+                fail = error_rate and rng.random() < error_rate
+            if delay:
+                time.sleep(delay)
+            if fail:
+                with stats_lock:
+                    stats["errors"] += 1
+                return self._send(503, {"status": 0, "status_verbose": "injected error"})
+
+            fields = [f for f in ",".join(query.get("fields", [])).split(",") if f]
+            if endpoint == "product":
+                barcode = url.path.rsplit("/", 1)[-1].split(".", 1)[0]
+                product = corpus.get(barcode)
+                if product is None:
+                    return self._send(200, {"status": 0, "code": barcode, "status_verbose": "product not found"})
+                return self._send(200, {"status": 1, "code": barcode, "product": _project(product, fields)})
+            if endpoint == "search":
+                terms = (query.get("search_terms") or [""])[0]
+                page_size = int((query.get("page_size") or ["20"])[0])
+                category = (query.get("tag_0") or [""])[0] if (query.get("tagtype_0") or [""])[0] == "categories" else ""
+                matches = [_project(p, fields) for code, p in corpus.items()
+                           if (terms and code.startswith(terms)) or (category and category in p.get("categories_tags", []))]
+                return self._send(200, {"count": len(matches), "products": matches[:page_size]})
+            return self._send(404, {"error": "not found"})
+
+    return Handler, stats, faults
+
+
+class _StubServer(ThreadingHTTPServer):
+    # Concurrent clients open connections in bursts; socketserver's backlog of 5 drops them
+    request_queue_size = 1024
+
+
+def start_stub(corpus, latency_ms=0.0, error_rate=0.0, port=0, seed=None):
+    """
+    Serve `corpus` from a background thread.
+
+    Returns:
+        tuple: (server, base URL, request stats dict). Call server.shutdown() to stop.
+               Change server.faults["latency_ms"] / ["error_rate"] to change the
+               injected latency and errors while it runs.
+    """
+    handler, stats, faults = make_handler(corpus, latency_ms, error_rate, seed)
+    server = _StubServer(("127.0.0.1", port), handler)
+    server.faults = faults
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--products", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--corpus", help="JSON file with products instead of a synthetic corpus")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean injected latency (uniform 0.5x-1.5x)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dump-barcodes", type=int, default=0, help="print this many barcodes from the corpus and keep serving")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.products, args.seed)
+    server, url, _ = start_stub(corpus, args.latency_ms, args.error_rate, args.port, args.seed)
+    print(f"Open Food Facts stub serving {len(corpus)} products on {url}")
+    for barcode in list(corpus)[:args.dump_barcodes]:
+        print(barcode)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
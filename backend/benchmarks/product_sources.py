@@ -0,0 +1,111 @@
+# backend/benchmarks/product_sources.py
+"""
+End-to-end run of the product source chain against the Open Food Facts stub.
+
+Starts benchmarks/off_stub.py in-process, points the chain at it with a
+throwaway local store, and looks the same barcodes up three times:
+
+  cold    empty memory and store: every lookup reaches the remote
+  warm    same process: every lookup is a memory hit
+  store   fresh chain (as after a restart): store hits, written back to memory
+
+then prints per-tier hit rate and latency, and how many requests the stub
+actually served. Exits with status 1 if a phase doesn't hit the expected tier.
+
+Run from the backend directory:
+
+    python benchmarks/product_sources.py [--products 200] [--latency-ms 40] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.off_stub import make_corpus, start_stub  # noqa: E402
+import product_sources  # noqa: E402
+
+
+def _phase(barcodes):
+    started = time.perf_counter()
+    found = sum(1 for barcode in barcodes if product_sources.get_product(barcode)[0] is not None)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {"lookups": len(barcodes), "found": found, "totalMs": elapsed_ms, "perLookupMs": elapsed_ms / max(len(barcodes), 1)}
+
+
+def run(products, latency_ms, missing):
+    corpus = make_corpus(products, seed=1)
+    server, url, served = start_stub(corpus, latency_ms=latency_ms, seed=1)
+    store_dir = tempfile.mkdtemp(prefix="product-store-")
+    os.environ.update({
+        "OFF_BASE_URL": url,
+        "PRODUCT_STORE_PATH": os.path.join(store_dir, "products.sqlite3"),
+        "PRODUCT_SOURCES": "memory,store,remote",
+    })
+    # Known barcodes plus a few the stub doesn't have
+    barcodes = list(corpus) + [b for b in make_corpus(missing, seed=2) if b not in corpus]
+
+    try:
+        report = {}
+        product_sources.reset_chain()
+        report["cold"] = _phase(barcodes)
+        report["warm"] = _phase(barcodes)
+        report["coldWarmStats"] = product_sources.source_stats()
+        product_sources.reset_chain()
+        report["store"] = _phase(barcodes)
+        report["storeStats"] = product_sources.source_stats()
+        report["stubRequests"] = dict(served)
+    finally:
+        server.shutdown()
+
+    tiers = {t["name"]: t for t in report["coldWarmStats"]["tiers"]}
+    store_tiers = {t["name"]: t for t in report["storeStats"]["tiers"]}
+    failures = []
+    if tiers["memory"]["hits"] != products:
+        failures.append(f"warm pass: expected {products} memory hits, got {tiers['memory']['hits']}")
+    if store_tiers["store"]["hits"] != products:
+        failures.append(f"restart pass: expected {products} store hits, got {store_tiers['store']['hits']}")
+    # Misses aren't cached, so unknown barcodes reach the remote on every pass
+    expected_requests = products + 3 * missing
+    if report["stubRequests"]["product"] != expected_requests:
+        failures.append(f"stub served {report['stubRequests']['product']} product requests, expected {expected_requests}")
+    report["failures"] = failures
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--missing", type=int, default=10, help="barcodes the stub doesn't know")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="mean stub latency")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.products, args.latency_ms, args.missing)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for phase in ("cold", "warm", "store"):
+            r = report[phase]
+            print(f"{phase:<6} {r['found']:>5}/{r['lookups']:<5} found  {r['perLookupMs']:>8.3f} ms/lookup")
+        print()
+        print(f"{'tier':<8} {'hits':>6} {'misses':>7} {'errors':>7} {'hit rate':>9} {'avg ms':>9} {'max ms':>9}")
+        for label, stats in (("cold+warm", report["coldWarmStats"]), ("restart", report["storeStats"])):
+            print(label)
+            for t in stats["tiers"]:
+                hit_rate = f"{t['hitRate']:.2%}" if t["hitRate"] is not None else "-"
+                avg = f"{t['avgMs']:.3f}" if t["avgMs"] is not None else "-"
+                print(f"  {t['name']:<6} {t['hits']:>6} {t['misses']:>7} {t['errors']:>7} {hit_rate:>9} {avg:>9} {t['maxMs']:>9.3f}")
+        print()
+        print(f"stub requests served: {report['stubRequests']}")
+        for failure in report["failures"]:
+            print(f"FAILED: {failure}")
+
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
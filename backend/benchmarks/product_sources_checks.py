@@ -0,0 +1,185 @@
+# backend/benchmarks/product_sources_checks.py
+"""
+Behaviour checks for the product source chain, against the Open Food Facts stub.
+
+Each check builds a fresh chain (memory -> store -> remote) on a throwaway
+sqlite store, points the remote at benchmarks/off_stub.py, and asserts on
+what the chain returns and on the requests the stub actually served:
+
+  tier order     remote on a cold lookup, then memory; store after a restart
+  write-back     a store hit is copied into memory; a remote hit into both
+  stale          a copy past its TTL is served at once, marked stale, and
+                 refreshed from the remote in the background
+  breaker        failures open it and later calls don't reach the stub; after
+                 the cool-down one probe goes out: a failure reopens it, a
+                 success closes it
+
+Prints one line per check and exits with status 1 if any failed.
+
+Run from the backend directory:
+
+    python benchmarks/product_sources_checks.py
+"""
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.off_stub import make_corpus, start_stub  # noqa: E402
+import product_sources  # noqa: E402
+
+
+def _configure(url, **env):
+    """A fresh chain against `url` on an empty store, with extra environment settings."""
+    store_dir = tempfile.mkdtemp(prefix="product-source-checks-")
+    os.environ.update({
+        "OFF_BASE_URL": url,
+        "PRODUCT_STORE_PATH": os.path.join(store_dir, "products.sqlite3"),
+        "PRODUCT_SOURCES": "memory,store,remote",
+        "PRODUCT_CACHE_TTL_SECONDS": "3600",
+        "PRODUCT_STORE_TTL_SECONDS": "604800",
+        "OFF_BREAKER_MIN_CALLS": "5",
+        "OFF_BREAKER_WINDOW": "20",
+        "OFF_BREAKER_COOLDOWN_SECONDS": "30",
+        **env,
+    })
+    product_sources.reset_chain()
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def check_tier_order_and_write_back():
+    corpus = make_corpus(3, seed=11)
+    server, url, served = start_stub(corpus, seed=11)
+    try:
+        _configure(url)
+        barcode = next(iter(corpus))
+
+        cold = product_sources.lookup_product(barcode)
+        assert cold.source == "remote", f"cold lookup answered by {cold.source}"
+        assert served["product"] == 1, f"stub served {served['product']} product requests"
+        assert product_sources.get_tier("memory").get(barcode) is not None, "remote hit not written to memory"
+        assert product_sources.get_tier("store").get(barcode) is not None, "remote hit not written to the store"
+
+        warm = product_sources.lookup_product(barcode)
+        assert warm.source == "memory", f"warm lookup answered by {warm.source}"
+        assert warm.product == cold.product, "memory copy differs from the remote's"
+
+        # A restart: empty memory, same store
+        product_sources.reset_chain()
+        restarted = product_sources.lookup_product(barcode)
+        assert restarted.source == "store", f"lookup after restart answered by {restarted.source}"
+        assert product_sources.get_tier("memory").get(barcode) is not None, "store hit not written to memory"
+        assert product_sources.lookup_product(barcode).source == "memory", "store hit not served from memory next"
+        assert served["product"] == 1, f"stub served {served['product']} product requests, expected 1"
+
+        missing = product_sources.lookup_product("0000000000000")
+        assert missing.product is None and missing.source is None, "unknown barcode was found"
+        assert product_sources.get_tier("memory").get("0000000000000") is None, "a miss was cached"
+    finally:
+        server.shutdown()
+
+
+def check_stale_while_revalidate():
+    corpus = make_corpus(2, seed=12)
+    server, url, served = start_stub(corpus, seed=12)
+    try:
+        _configure(url, PRODUCT_CACHE_TTL_SECONDS="0.2", PRODUCT_STORE_TTL_SECONDS="0.2")
+        barcode = next(iter(corpus))
+        first = product_sources.lookup_product(barcode)
+        assert first.source == "remote" and not first.stale, "first lookup wasn't a fresh remote hit"
+        time.sleep(0.3)
+
+        requests_before = served["product"]
+        started = time.perf_counter()
+        stale = product_sources.lookup_product(barcode)
+        assert stale.stale, "copy past its TTL wasn't marked stale"
+        assert stale.source in ("memory", "store"), f"stale copy answered by {stale.source}"
+        assert stale.product == first.product, "stale lookup didn't return the cached copy"
+        assert time.perf_counter() - started < 0.1, "stale lookup waited on the remote"
+
+        refreshed = _wait_for(lambda: product_sources.source_stats()["refresh"]["refreshed"] >= 1)
+        assert refreshed, "no background refresh happened"
+        assert served["product"] == requests_before + 1, "background refresh didn't call the remote once"
+        entry = product_sources.get_tier("memory").get(barcode)
+        assert entry is not None and entry[1] > first.stored_at, "refreshed copy wasn't written back"
+    finally:
+        server.shutdown()
+
+
+def check_breaker_opens_and_half_opens():
+    corpus = make_corpus(20, seed=13)
+    barcodes = list(corpus)
+    server, url, served = start_stub(corpus, error_rate=1.0, seed=13)
+    try:
+        _configure(url, OFF_BREAKER_MIN_CALLS="3", OFF_BREAKER_WINDOW="3", OFF_BREAKER_COOLDOWN_SECONDS="0.5")
+        breaker = product_sources.get_tier("remote").breaker
+
+        for barcode in barcodes[:3]:
+            lookup = product_sources.lookup_product(barcode)
+            assert lookup.product is None and lookup.error, "lookup succeeded against a failing remote"
+        assert breaker.state == breaker.OPEN, f"breaker {breaker.state} after 3 failures of 3"
+        assert served["product"] == 3, f"stub served {served['product']} requests, expected 3"
+
+        fast = product_sources.lookup_product(barcodes[3])
+        assert fast.product is None, "lookup succeeded while the breaker was open"
+        assert served["product"] == 3, "a call reached the remote while the breaker was open"
+        assert breaker.report()["rejected"] >= 1, "open breaker didn't count the rejected call"
+
+        # Cool-down over: one probe goes out and fails, which reopens the breaker
+        time.sleep(0.6)
+        product_sources.lookup_product(barcodes[4])
+        assert served["product"] == 4, "no probe was let through after the cool-down"
+        assert breaker.state == breaker.OPEN and breaker.opened_count == 2, "failed probe didn't reopen the breaker"
+
+        # The upstream recovers; calls wait out the cool-down, then one probe closes the breaker
+        server.faults["error_rate"] = 0.0
+        product_sources.lookup_product(barcodes[5])
+        assert served["product"] == 4, "a call went out before the cool-down ended"
+        time.sleep(0.6)
+        recovered = product_sources.lookup_product(barcodes[6])
+        assert recovered.product is not None and recovered.source == "remote", "probe after recovery failed"
+        assert breaker.state == breaker.CLOSED, f"breaker {breaker.state} after a successful probe"
+        assert product_sources.lookup_product(barcodes[7]).product is not None, "closed breaker blocked a call"
+        assert served["product"] == 6, f"stub served {served['product']} requests, expected 6"
+    finally:
+        server.shutdown()
+
+
+CHECKS = [
+    ("tier order and write-back", check_tier_order_and_write_back),
+    ("stale-while-revalidate", check_stale_while_revalidate),
+    ("breaker opens and half-opens", check_breaker_opens_and_half_opens),
+]
+
+
+def main():
+    failures = 0
+    for name, check in CHECKS:
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"FAILED  {name}: {e}")
+        except Exception:
+            failures += 1
+            print(f"ERROR   {name}:")
+            traceback.print_exc()
+        else:
+            print(f"ok      {name}")
+    product_sources.reset_chain()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# backend/benchmarks/safe_products.py
+"""
+Query latency of the catalog index behind /api/safe-products.
+
+Builds a synthetic catalog straight into catalog_index.CatalogIndex (no
+sqlite), then times typical queries: mask only, name prefix, category
+prefix, both, and paging through with the cursor. Exits with status 1 if a
+query's median goes over --max-ms.
+
+Run from the backend directory:
+
+    python benchmarks/safe_products.py [--products 1000000] [--queries 20] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.off_stub import CATEGORIES, make_barcode  # noqa: E402
+import catalog_index  # noqa: E402
+import restriction_masks  # noqa: E402
+
+NAME_WORDS = ["Choco", "Crunchy", "Classic", "Organic", "Spicy", "Golden", "Fresh", "Nutty", "Sweet", "Smoky"]
+KIND_WORDS = ["Spread", "Bar", "Sauce", "Crackers", "Drink", "Cereal", "Soup", "Chips"]
+
+
+def make_catalog(count, seed=0):
+    rng = random.Random(seed)
+    barcodes, names, images, categories, masks = [], [], [], [], []
+    for _ in range(count):
+        barcode = make_barcode(rng)
+        barcodes.append(barcode)
+        names.append(f"{rng.choice(NAME_WORDS)} {rng.choice(KIND_WORDS)} {rng.randint(1, 999)}")
+        images.append(None)
+        categories.append(rng.sample(CATEGORIES, rng.randint(1, 2)))
+        # Each bit set with ~15% probability
+        masks.append(sum(1 << b for b in range(len(restriction_masks.BITS)) if rng.random() < 0.15))
+    return barcodes, names, images, categories, masks
+
+
+def _time(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"medianMs": statistics.median(samples), "maxMs": max(samples)}
+
+
+def run(products, queries, max_ms):
+    started = time.perf_counter()
+    columns = make_catalog(products)
+    generated_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    index = catalog_index.CatalogIndex(*columns)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    profile_mask, _ = restriction_masks.profile_mask({"allergies": ["Milk", "Peanuts"], "restrictions": ["Vegan"]})
+
+    def page(name="", category="", cursor=None):
+        selected = index.select(profile_mask, name, category)
+        rows = index.page_rows(selected, cursor)
+        return catalog_index.first_rows(index, rows, 20)
+
+    def walk_pages():
+        cursor = None
+        for _ in range(10):
+            _, cursor = page(category="snacks", cursor=cursor)
+
+    cases = {
+        "maskOnly": lambda: page(),
+        "namePrefix": lambda: page(name="choco"),
+        "categoryPrefix": lambda: page(category="break"),
+        "nameAndCategory": lambda: page(name="organic sp", category="spreads"),
+        "tenPages": walk_pages,
+    }
+    report = {
+        "products": products,
+        "generateMs": generated_ms,
+        "buildMs": build_ms,
+        "safeFraction": float(((index.masks & profile_mask) == 0).mean()),
+        "queries": {name: _time(fn, queries) for name, fn in cases.items()},
+    }
+    # Ten pages is ten queries; hold each to the limit
+    limits = {name: max_ms * (10 if name == "tenPages" else 1) for name in cases}
+    report["failures"] = [
+        f"{name}: median {r['medianMs']:.1f} ms > {limits[name]:.0f} ms"
+        for name, r in report["queries"].items() if r["medianMs"] > limits[name]
+    ]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20, help="repeats per query")
+    parser.add_argument("--max-ms", type=float, default=50.0, help="allowed median per query")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args.products, args.queries, args.max_ms)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['products']} products: generated in {report['generateMs']:.0f} ms, "
+              f"index built in {report['buildMs']:.0f} ms, {report['safeFraction']:.1%} safe for the test profile")
+        for name, r in report["queries"].items():
+            print(f"  {name:<16} median {r['medianMs']:>8.2f} ms   max {r['maxMs']:>8.2f} ms")
+        for failure in report["failures"]:
+            print(f"FAILED: {failure}")
+
+    sys.exit(1 if report["failures"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# backend/benchmarks/startup.py
+"""
+Startup benchmark and budget check for the backend.
+
+Reports:
+  - per-module import time for `import app` (from python -X importtime)
+  - time to import the app and to serve the first GET /api/profiles in a
+    fresh process, and whether pandas had been imported by then
+
+Run from the backend directory:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 5 --budget-import-ms 300 --budget-first-response-ms 400 --json
+
+Exits with status 1 if a budget is exceeded or if pandas was imported before
+/api/profiles responded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter; prints one JSON line
+_FIRST_RESPONSE_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/api/profiles")
+responded = time.perf_counter()
+print(json.dumps({{
+    "importMs": (imported - started) * 1000,
+    "firstResponseMs": (responded - started) * 1000,
+    "status": response.status_code,
+    "pandasImported": "pandas" in sys.modules,
+    "heavyModules": sorted(m for m in ("pandas", "numpy", "kagglehub", "requests", "pyarrow", "google.generativeai") if m in sys.modules),
+}}))
+"""
+
+
+def _child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_profile(top):
+    """Per-module import times for `import app`, slowest (cumulative) first."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, env=_child_env(), capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "selfMs": int(self_us) / 1000,
+            "cumulativeMs": int(cumulative_us) / 1000,
+        })
+    modules.sort(key=lambda m: m["cumulativeMs"], reverse=True)
+    return modules[:top]
+
+
+def first_response(runs):
+    """Import and first-response timings for /api/profiles over several fresh processes."""
+    samples = []
+    script = _FIRST_RESPONSE_SCRIPT.format(backend=BACKEND_DIR)
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=BACKEND_DIR, env=_child_env(), capture_output=True, text=True, check=True,
+        )
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample["processMs"] = (time.perf_counter() - started) * 1000
+        samples.append(sample)
+    return {
+        "runs": runs,
+        "importMs": statistics.median(s["importMs"] for s in samples),
+        "firstResponseMs": statistics.median(s["firstResponseMs"] for s in samples),
+        "processMs": statistics.median(s["processMs"] for s in samples),
+        "status": samples[-1]["status"],
+        "pandasImported": any(s["pandasImported"] for s in samples),
+        "heavyModules": samples[-1]["heavyModules"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to time (median is reported)")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--budget-import-ms", type=float, default=300.0)
+    parser.add_argument("--budget-first-response-ms", type=float, default=400.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = {
+        "modules": import_profile(args.top),
+        "firstResponse": first_response(args.runs),
+        "budget": {"importMs": args.budget_import_ms, "firstResponseMs": args.budget_first_response_ms},
+    }
+    timing = report["firstResponse"]
+    failures = []
+    if timing["importMs"] > args.budget_import_ms:
+        failures.append(f"import took {timing['importMs']:.0f} ms (budget {args.budget_import_ms:.0f} ms)")
+    if timing["firstResponseMs"] > args.budget_first_response_ms:
+        failures.append(f"first response took {timing['firstResponseMs']:.0f} ms (budget {args.budget_first_response_ms:.0f} ms)")
+    if timing["pandasImported"]:
+        failures.append("pandas was imported before /api/profiles responded")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'module':<50} {'self ms':>9} {'cum ms':>9}")
+        for m in report["modules"]:
+            print(f"{'  ' * m['depth'] + m['module']:<50} {m['selfMs']:>9.1f} {m['cumulativeMs']:>9.1f}")
+        print()
+        print(f"import app:              {timing['importMs']:.1f} ms (median of {timing['runs']})")
+        print(f"first /api/profiles:     {timing['firstResponseMs']:.1f} ms (status {timing['status']})")
+        print(f"process start to reply:  {timing['processMs']:.1f} ms")
+        print(f"heavy modules loaded:    {', '.join(timing['heavyModules']) or 'none'}")
+        for failure in failures:
+            print(f"OVER BUDGET: {failure}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# backend/cache_warmer.py
+"""
+Cache warming and predictive prefetch for the product source chain.
+
+The warmer looks products up through product_sources shortly after startup
+and then every CACHE_WARM_INTERVAL_SECONDS, so popular products are already
+cached when the first scan for them arrives. The barcodes come from:
+
+    - recent history (history.json)
+    - the most frequently scanned barcodes: each process counts scans in a
+      space-saving top-k counter and adds its counts to a table in the
+      product store's sqlite file every cycle, so the ranking survives restarts
+      and is shared by all workers
+    - an optional SKU list: CACHE_WARM_SKUS (comma-separated) and/or
+      CACHE_WARM_SKU_FILE (one barcode per line)
+
+With CACHE_PREFETCH_SIMILAR=1, every product that a scan fetched from the
+remote also queues a prefetch: one search for popular products in the same
+category, whose results are written straight into the cache tiers.
+
+Both jobs run in background threads that are rate limited, and they wait
+for a moment with no request in flight in this process before each call, so
+they stay out of the way of live requests. A server that is never idle
+would starve them; after CACHE_IDLE_WAIT_SECONDS they go ahead anyway, still
+at their rate limit.
+
+    CACHE_WARM_INTERVAL_SECONDS   between warm cycles, 0 = startup only (900)
+    CACHE_WARM_DELAY_SECONDS      before the first cycle (5)
+    CACHE_WARM_TOP_N              most-scanned barcodes warmed per cycle (100)
+    CACHE_WARM_RATE               remote lookups per second (5)
+    CACHE_PREFETCH_SIMILAR        1 to enable prefetch (0)
+    CACHE_PREFETCH_COUNT          products fetched per prefetch (5)
+    CACHE_PREFETCH_RATE           prefetch searches per second (1)
+    CACHE_PREFETCH_QUEUE_SIZE     queued prefetches; more are dropped (100)
+    CACHE_IDLE_WAIT_SECONDS       longest wait for an idle moment (10)
+"""
+import heapq
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TOP_K_CAPACITY = 512
+# Recently prefetched categories remembered at most
+PREFETCHED_CAPACITY = 1024
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+class TopK:
+    """
+    Space-saving heavy-hitters counter: at most `capacity` keys. A new key
+    that finds the counter full replaces the least counted one and inherits
+    its count, so frequent keys are never undercounted.
+
+    The least counted key comes off a min-heap of (count, key) entries. An
+    entry goes stale when its key is counted again or evicted; stale entries
+    are skipped when they surface, and the heap is rebuilt once it holds
+    several times `capacity` of them. add() is O(log capacity) amortized.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def add(self, key: str, n: int = 1):
+        with self._lock:
+            if key in self.counts:
+                self.counts[key] += n
+            elif len(self.counts) < self.capacity:
+                self.counts[key] = n
+            else:
+                victim = self._pop_least()
+                self.counts[key] = self.counts.pop(victim) + n
+            heapq.heappush(self._heap, (self.counts[key], key))
+            if len(self._heap) > 4 * self.capacity:
+                self._heap = [(count, k) for k, count in self.counts.items()]
+                heapq.heapify(self._heap)
+
+    def _pop_least(self) -> str:
+        # Caller holds _lock and the counter is full, so a current entry exists
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def drain(self) -> Dict[str, int]:
+        """Counts so far, resetting the counter."""
+        with self._lock:
+            counts, self.counts = self.counts, {}
+            self._heap = []
+        return counts
+
+
+# -------- Scan counts shared through the product store --------
+def _store_path() -> str:
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".product_store.sqlite3")
+    return os.getenv("PRODUCT_STORE_PATH", default_path)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(_store_path(), timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scan_counts "
+        "(barcode TEXT PRIMARY KEY, count INTEGER NOT NULL, last_flushed REAL NOT NULL)"
+    )
+    return conn
+
+
+def flush_counts():
+    """Add this process's scan counts to the shared table."""
+    counts = _scans.drain()
+    if not counts:
+        return
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.executemany(
+            "INSERT INTO scan_counts (barcode, count, last_flushed) VALUES (?, ?, ?) "
+            "ON CONFLICT(barcode) DO UPDATE SET count = count + excluded.count, last_flushed = excluded.last_flushed",
+            [(barcode, count, now) for barcode, count in counts.items()],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def popular_barcodes(n: int) -> List[str]:
+    """The n most scanned barcodes across restarts and workers."""
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT barcode FROM scan_counts ORDER BY count DESC, barcode LIMIT ?", (n,)).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+def sku_barcodes() -> List[str]:
+    """Barcodes from CACHE_WARM_SKUS and CACHE_WARM_SKU_FILE."""
+    barcodes = [b.strip() for b in os.getenv("CACHE_WARM_SKUS", "").split(",") if b.strip()]
+    path = os.getenv("CACHE_WARM_SKU_FILE", "").strip()
+    if path:
+        try:
+            with open(path, 'r') as f:
+                barcodes += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            print(f"Error reading CACHE_WARM_SKU_FILE: {e}")
+    return barcodes
+
+
+# -------- Staying out of the way of live requests --------
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+# Notified when the last in-flight request finishes
+_idle = threading.Condition(_in_flight_lock)
+
+
+def _wait_for_idle() -> bool:
+    """Wait until no request is in flight, at most CACHE_IDLE_WAIT_SECONDS. Returns False if it gave up."""
+    with _idle:
+        idle = _idle.wait_for(lambda: _in_flight == 0, timeout=_env_float("CACHE_IDLE_WAIT_SECONDS", 10))
+    if not idle:
+        with _stats_lock:
+            _stats["idleWaitsTimedOut"] += 1
+    return idle
+
+
+class _RateLimiter:
+    """At most `rate` calls per second, one thread at a time."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = time.monotonic() + self.interval
+
+
+# -------- Warming --------
+_scans = TopK(TOP_K_CAPACITY)
+_history_source: Optional[Callable[[], Iterable[str]]] = None
+_stats = {
+    "cycles": 0, "lastRunAt": None, "lastRunMs": None, "lastRun": None,
+    "prefetchQueued": 0, "prefetchDropped": 0, "prefetchRuns": 0, "prefetchCached": 0, "prefetchErrors": 0,
+    "idleWaitsTimedOut": 0,
+}
+_stats_lock = threading.Lock()
+
+
+def record_scan(barcode: str, product: Optional[dict] = None, fetched: bool = False):
+    """Count a scan; a product the scan had to fetch from the remote also queues a prefetch."""
+    _scans.add(barcode)
+    if fetched and product and _prefetch_queue is not None:
+        try:
+            _prefetch_queue.put_nowait((barcode, product))
+            key = "prefetchQueued"
+        except queue.Full:
+            key = "prefetchDropped"
+        with _stats_lock:
+            _stats[key] += 1
+
+
+def warm_barcodes() -> List[str]:
+    """Barcodes to warm this cycle: history, then most scanned, then the SKU list (canonical, deduplicated)."""
+    from barcodes import canonical_barcode
+    candidates = []
+    if _history_source is not None:
+        try:
+            candidates += [b for b in _history_source() if b]
+        except Exception as e:
+            print(f"Error reading history for cache warming: {e}")
+    top_n = int(_env_float("CACHE_WARM_TOP_N", 100))
+    if top_n > 0:
+        candidates += popular_barcodes(top_n)
+    candidates += sku_barcodes()
+    return list(dict.fromkeys(b for b in (canonical_barcode(c) for c in candidates) if b))
+
+
+def warm_once() -> dict:
+    """Look every warm barcode up through the chain. Returns counts by outcome."""
+    import product_sources
+    started = time.perf_counter()
+    flush_counts()
+    limiter = _RateLimiter(_env_float("CACHE_WARM_RATE", 5))
+    outcome = {"barcodes": 0, "cached": 0, "fetched": 0, "missing": 0}
+    for barcode in warm_barcodes():
+        outcome["barcodes"] += 1
+        if product_sources.local_product(barcode) is not None:
+            # Already in the store: reading it through the chain fills memory without a remote call
+            product_sources.lookup_product(barcode)
+            outcome["cached"] += 1
+            continue
+        _wait_for_idle()
+        limiter.wait()
+        lookup = product_sources.lookup_product(barcode)
+        outcome["fetched" if lookup.product else "missing"] += 1
+    with _stats_lock:
+        _stats["cycles"] += 1
+        _stats["lastRunAt"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        _stats["lastRunMs"] = round((time.perf_counter() - started) * 1000, 1)
+        _stats["lastRun"] = outcome
+    return outcome
+
+
+def _warm_loop():
+    time.sleep(_env_float("CACHE_WARM_DELAY_SECONDS", 5))
+    interval = _env_float("CACHE_WARM_INTERVAL_SECONDS", 900)
+    while True:
+        try:
+            warm_once()
+        except Exception as e:
+            print(f"Error warming product cache: {e}")
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+
+# -------- Prefetch --------
+_prefetch_queue: Optional[queue.Queue] = None
+# Categories prefetched recently: category -> time, oldest first
+_prefetched: Dict[str, float] = {}
+
+
+def _remember_prefetch(category: str, now: float, interval: float):
+    _prefetched.pop(category, None)
+    _prefetched[category] = now
+    # Drop the ones old enough to be prefetched again, and the oldest past the cap
+    for oldest in list(_prefetched):
+        if len(_prefetched) <= PREFETCHED_CAPACITY and now - _prefetched[oldest] < interval:
+            break
+        del _prefetched[oldest]
+
+
+def prefetch_similar(product: dict) -> int:
+    """Cache the most popular products in the product's first category. Returns how many were new."""
+    import product_sources
+    categories = product.get("categories_tags") or []
+    category = next((c for c in categories if isinstance(c, str) and c), None)
+    if category is None:
+        return 0
+    now = time.time()
+    interval = _env_float("CACHE_WARM_INTERVAL_SECONDS", 900)
+    if now - _prefetched.get(category, 0) < interval:
+        return 0
+    _remember_prefetch(category, now, interval)
+    fields = product_sources.fetch_fields()
+    params = {
+        "action": "process", "json": "1",
+        "tagtype_0": "categories", "tag_contains_0": "contains", "tag_0": category,
+        "sort_by": "unique_scans_n",
+        "page_size": int(_env_float("CACHE_PREFETCH_COUNT", 5)),
+    }
+    if fields is not None:
+        params["fields"] = ",".join(fields)
+    data = product_sources.remote_request("/cgi/search.pl", params=params)
+    return product_sources.cache_products((data or {}).get("products", []))
+
+
+def _prefetch_loop(jobs: queue.Queue):
+    limiter = _RateLimiter(_env_float("CACHE_PREFETCH_RATE", 1))
+    while True:
+        _, product = jobs.get()
+        _wait_for_idle()
+        limiter.wait()
+        try:
+            cached = prefetch_similar(product)
+            with _stats_lock:
+                _stats["prefetchRuns"] += 1
+                _stats["prefetchCached"] += cached
+        except Exception as e:
+            print(f"Error prefetching similar products: {e}")
+            with _stats_lock:
+                _stats["prefetchErrors"] += 1
+
+
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def start():
+    """Start the warm loop (and prefetch worker, if enabled) once per process."""
+    global _started_pid, _prefetch_queue
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        threading.Thread(target=_warm_loop, name="cache-warmer", daemon=True).start()
+        if os.getenv("CACHE_PREFETCH_SIMILAR", "0").lower() in ("1", "true", "yes", "on"):
+            _prefetch_queue = queue.Queue(maxsize=int(_env_float("CACHE_PREFETCH_QUEUE_SIZE", 100)))
+            threading.Thread(target=_prefetch_loop, args=(_prefetch_queue,), name="cache-prefetch", daemon=True).start()
+
+
+def stats() -> dict:
+    with _stats_lock:
+        report = dict(_stats)
+    report["topScanned"] = _scans.top(10)
+    report["prefetchPending"] = _prefetch_queue.qsize() if _prefetch_queue is not None else None
+    return report
+
+
+def init_app(app, history: Optional[Callable[[], Iterable[str]]] = None):
+    """
+    Track in-flight requests, so background work waits for idle moments.
+    history() returns recently scanned barcodes. Warming itself is started
+    by the server entry point (wsgi.py, gunicorn.conf.py post_fork, the ASGI
+    lifespan or the dev server), not per request.
+    """
+    global _history_source
+    _history_source = history
+
+    @app.before_request
+    def _request_started():
+        global _in_flight
+        from flask import g
+        with _in_flight_lock:
+            _in_flight += 1
+        g.counted_in_flight = True
+
+    @app.teardown_request
+    def _request_finished(exc=None):
+        global _in_flight
+        from flask import g
+        if g.pop("counted_in_flight", False):
+            with _idle:
+                _in_flight -= 1
+                if _in_flight == 0:
+                    _idle.notify_all()
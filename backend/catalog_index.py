@@ -0,0 +1,230 @@
+# backend/catalog_index.py
+"""
+In-memory columnar index of the local catalog, for "safe products" queries.
+
+Built from the product store and its restriction masks (restriction_masks.py)
+into NumPy arrays: barcodes sorted ascending, one uint32 mask per product,
+and sorted name / category keys for prefix lookups. A query is then a few
+vectorized operations (mask AND, searchsorted ranges) over the whole catalog,
+tens of milliseconds at a million products, and pages are cut by barcode
+cursor.
+
+Only products with a mask for the current dataset version are indexed; run
+`flask --app app build-masks` after imports so the rest get one (products
+cached by lookups get theirs in the background, and join at the next
+rebuild). The index is rebuilt in the background once it's older than
+CATALOG_INDEX_TTL_SECONDS (300); queries keep using the previous one
+meanwhile. Until the datasets the masks derive from are loaded there is no
+current version: queries get an empty index (ready False), which isn't kept,
+while a background build waits for the datasets.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Sorts after every real character, for prefix ranges
+_PREFIX_END = "\U0010ffff"
+
+
+def _category_name(tag: str) -> str:
+    # "en:breakfast-cereals" -> "breakfast cereals"
+    tag = str(tag).strip().lower()
+    if len(tag) > 3 and tag[2] == ":":
+        tag = tag[3:]
+    return tag.replace("-", " ").replace("_", " ")
+
+
+class CatalogIndex:
+    """Products as parallel arrays, in barcode order."""
+
+    def __init__(self, barcodes: Sequence[str], names: Sequence[str], images: Sequence[Optional[str]],
+                 categories: Sequence[Sequence[str]], masks: Sequence[int]):
+        order = np.argsort(np.asarray(barcodes, dtype=object), kind="stable")
+        self.barcodes = np.asarray(barcodes, dtype=object)[order]
+        self.names = np.asarray(names, dtype=object)[order]
+        self.images = np.asarray(images, dtype=object)[order]
+        self.masks = np.asarray(masks, dtype=np.uint32)[order]
+        self.built_at = time.time()
+        self.ready = True
+
+        # Name prefix lookups: lower-cased names sorted, with their rows
+        lowered = np.array([(n or "").lower() for n in self.names], dtype=object)
+        self._name_rows = np.argsort(lowered, kind="stable").astype(np.int64)
+        self._name_keys = lowered[self._name_rows]
+
+        # Category prefix lookups: one (category name, row) pair per tag
+        category_lists = [categories[i] or () for i in order]
+        counts = np.fromiter((len(c) for c in category_lists), dtype=np.int64, count=len(category_lists))
+        keys = np.array([_category_name(t) for c in category_lists for t in c], dtype=object)
+        rows = np.repeat(np.arange(len(category_lists), dtype=np.int64), counts)
+        by_key = np.argsort(keys, kind="stable")
+        self._category_keys = keys[by_key]
+        self._category_rows = rows[by_key]
+        self._categories = category_lists
+
+    def __len__(self) -> int:
+        return len(self.barcodes)
+
+    @staticmethod
+    def _prefix_rows(keys: np.ndarray, rows: np.ndarray, prefix: str) -> np.ndarray:
+        lo, hi = np.searchsorted(keys, [prefix, prefix + _PREFIX_END])
+        return rows[lo:hi]
+
+    def select(self, profile_mask: int, name_prefix: str = "", category_prefix: str = "") -> np.ndarray:
+        """Boolean selection of products whose mask clears the profile and match the prefixes."""
+        selected = (self.masks & np.uint32(profile_mask)) == 0
+        if name_prefix:
+            matches = np.zeros(len(self), dtype=bool)
+            matches[self._prefix_rows(self._name_keys, self._name_rows, name_prefix.lower())] = True
+            selected &= matches
+        if category_prefix:
+            matches = np.zeros(len(self), dtype=bool)
+            matches[self._prefix_rows(self._category_keys, self._category_rows, _category_name(category_prefix))] = True
+            selected &= matches
+        return selected
+
+    def page_rows(self, selected: np.ndarray, cursor: Optional[str]) -> np.ndarray:
+        """Selected rows after the cursor barcode, in barcode order."""
+        start = int(np.searchsorted(self.barcodes, cursor, side="right")) if cursor else 0
+        return np.flatnonzero(selected[start:]) + start
+
+    def row(self, i: int) -> dict:
+        return {
+            "barcode": self.barcodes[i],
+            "productName": self.names[i] or "Unknown",
+            "imageUrl": self.images[i],
+            "categories": [_category_name(t) for t in self._categories[i]],
+            "mask": int(self.masks[i]),
+        }
+
+
+def load_rows(path: str, version: str) -> Tuple[List[str], List[str], List[Optional[str]], List[List[str]], List[int]]:
+    """Stored products that have a mask for this dataset version, as columns."""
+    import json
+    barcodes, names, images, categories, masks = [], [], [], [], []
+    conn = sqlite3.connect(path, timeout=5)
+    try:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not {"products", "restriction_masks"} <= tables:
+            return barcodes, names, images, categories, masks
+        rows = conn.execute(
+            "SELECT p.barcode, m.mask, "
+            "COALESCE(json_extract(p.data, '$.product_name'), json_extract(p.data, '$.product_name_en')), "
+            "COALESCE(json_extract(p.data, '$.image_front_small_url'), json_extract(p.data, '$.image_small_url')), "
+            "json_extract(p.data, '$.categories_tags') "
+            "FROM products p JOIN restriction_masks m ON m.barcode = p.barcode WHERE m.version = ?",
+            (version,),
+        )
+        for barcode, mask, name, image, tags in rows:
+            barcodes.append(barcode)
+            masks.append(mask)
+            names.append(name if isinstance(name, str) else "")
+            images.append(image)
+            try:
+                tags = json.loads(tags) if tags else []
+            except ValueError:
+                tags = []
+            categories.append([t for t in tags if isinstance(t, str)] if isinstance(tags, list) else [])
+    finally:
+        conn.close()
+    return barcodes, names, images, categories, masks
+
+
+def build_index(wait: bool = False) -> CatalogIndex:
+    """
+    Index the stored products that have a current mask. Returns an empty,
+    not ready index while the mask datasets aren't loaded, unless `wait`
+    loads them first.
+    """
+    import restriction_masks
+    if wait:
+        restriction_masks.wait_for_datasets()
+    if not restriction_masks.datasets_ready():
+        index = CatalogIndex([], [], [], [], [])
+        index.ready = False
+        return index
+    started = time.perf_counter()
+    columns = load_rows(restriction_masks.get_store().path, restriction_masks.datasets_version())
+    index = CatalogIndex(*columns)
+    print(f"Catalog index built: {len(index)} products in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return index
+
+
+_index: Optional[CatalogIndex] = None
+_build_lock = threading.Lock()
+_rebuilding = False
+
+
+def _ttl() -> float:
+    return float(os.getenv("CATALOG_INDEX_TTL_SECONDS", "300"))
+
+
+def _rebuild_in_background():
+    global _index, _rebuilding
+    try:
+        index = build_index(wait=True)
+        if index.ready:
+            _index = index
+        else:
+            print("Catalog index not rebuilt: the datasets didn't load")
+    except Exception as e:
+        print(f"Error rebuilding catalog index: {e}")
+    finally:
+        _rebuilding = False
+
+
+def _start_rebuild():
+    # Caller holds _build_lock
+    global _rebuilding
+    if not _rebuilding:
+        _rebuilding = True
+        threading.Thread(target=_rebuild_in_background, daemon=True).start()
+
+
+def get_index() -> CatalogIndex:
+    """The current index; built on first use, refreshed in the background when old."""
+    global _index
+    index = _index
+    if index is None:
+        with _build_lock:
+            if _index is not None:
+                return _index
+            index = build_index()
+            if not index.ready:
+                _start_rebuild()
+                return index
+            _index = index
+            return index
+    if time.time() - index.built_at > _ttl() and not _rebuilding:
+        with _build_lock:
+            _start_rebuild()
+    return index
+
+
+def invalidate():
+    """Drop the index; the next query rebuilds it."""
+    global _index
+    with _build_lock:
+        _index = None
+
+
+def first_rows(index: CatalogIndex, rows: np.ndarray, limit: int, accept=None,
+               max_scanned: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Up to `limit` of the given rows, optionally only those accept(row dict)
+    passes, and the cursor for the next page (None when there are no more).
+    With accept, stops early after max_scanned rows and returns a cursor there.
+    """
+    page = []
+    for scanned, i in enumerate(rows, 1):
+        item = index.row(int(i))
+        if accept is None or accept(item):
+            page.append(item)
+        more = scanned < len(rows)
+        if len(page) == limit or (max_scanned and scanned >= max_scanned):
+            return page, (item["barcode"] if more else None)
+    return page, None
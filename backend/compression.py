@@ -0,0 +1,102 @@
+# backend/compression.py
+"""
+Response compression negotiated via Accept-Encoding.
+
+JSON (and other text) responses of at least COMPRESSION_MIN_BYTES are
+compressed with brotli when the client accepts it and the brotli package is
+installed, otherwise with gzip. Streamed and file responses are left alone.
+
+A compressed body is a different representation, so a strong ETag on it gets
+the coding appended ("v1" -> "v1-gzip"); strip_etag_coding() undoes that when
+matching If-None-Match.
+
+    COMPRESSION_MIN_BYTES   smallest body worth compressing (500)
+    COMPRESSION_GZIP_LEVEL  1-9 (6)
+    COMPRESSION_BR_QUALITY  0-11 (5; higher costs much more CPU per response)
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "500"))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BR_QUALITY = int(os.getenv("COMPRESSION_BR_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+CODINGS = ("br", "gzip")
+
+
+def strip_etag_coding(etag: str) -> str:
+    """An ETag without the content-coding suffix added here."""
+    for coding in CODINGS:
+        if etag.endswith(f"-{coding}"):
+            return etag[:-len(coding) - 1]
+    return etag
+
+
+def _accepted(header: str) -> dict:
+    """Accept-Encoding as {coding: q}."""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header: str):
+    """Best supported coding for an Accept-Encoding header, or None for identity."""
+    accepted = _accepted(header or "")
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BR_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def init_app(app):
+    """Compress eligible responses after each request."""
+
+    @app.after_request
+    def _compress_response(response):
+        from flask import request
+        if (response.direct_passthrough or response.is_streamed
+                or not 200 <= response.status_code < 300
+                or "Content-Encoding" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < MIN_BYTES:
+            return response
+        response.set_data(compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
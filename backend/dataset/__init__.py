@@ -1,19 +1,39 @@
 # backend/dataset/__init__.py
 """
 Dataset package for loading and managing food-related datasets.
+
+Submodules are imported on first attribute access, so importing the package
+(or dataset.ingredient_checker) doesn't pull in pandas or kagglehub.
 """
-from .allergens_dataset import load_allergens_dataset, get_ingredient_allergens
-from .daily_nutrition_dataset import load_daily_nutrition_dataset
-from .food_nutrition_dataset import load_food_nutrition_dataset
-from .food_classification import load_food_classification_dataset
-from .ingredient_checker import check_ingredient_against_restrictions
+import importlib
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'load_allergens_dataset': 'allergens_dataset',
+    'get_ingredient_allergens': 'allergens_dataset',
+    'load_daily_nutrition_dataset': 'daily_nutrition_dataset',
+    'load_food_nutrition_dataset': 'food_nutrition_dataset',
+    'load_food_classification_dataset': 'food_classification',
+    'check_ingredient_against_restrictions': 'ingredient_checker',
+    'analyze_ingredient': 'ingredient_checker',
+    'evaluate_ingredient': 'ingredient_checker',
+    'get_dataset': 'registry',
+    'preload_datasets': 'registry',
+    'evict_dataset': 'registry',
+    'dataset_status': 'registry',
+    'memory_report': 'registry',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value  # cache for next time
+    return value
 
-__all__ = [
-    'load_allergens_dataset',
-    'get_ingredient_allergens',
-    'load_daily_nutrition_dataset',
-    'load_food_nutrition_dataset',
-    'load_food_classification_dataset',
-    'check_ingredient_against_restrictions'
-]
 
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,148 @@
+# backend/dataset/allergen_vocabulary.py
+"""
+Canonical allergen vocabulary keyed by Open Food Facts taxonomy ids.
+
+Open Food Facts already normalizes a product's allergens into tag ids
+(allergens_tags, e.g. "en:milk") and its ingredients into ingredient ids
+(ingredients[].id, e.g. "en:skimmed-milk-powder"). This module maps user
+allergy names and their synonyms onto those ids once, so checking a product
+is a set intersection instead of free-text matching.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+# Allergen tag id -> synonyms users type, and ingredient ids that imply it.
+# Covers the 14 major (EU) allergens that Open Food Facts tags.
+CANONICAL_ALLERGENS = {
+    "en:gluten": {
+        "synonyms": ["gluten", "wheat", "barley", "rye", "oats", "spelt", "kamut"],
+        "ingredients": ["en:gluten", "en:wheat", "en:wheat-flour", "en:wheat-starch", "en:barley",
+                        "en:barley-malt", "en:rye", "en:oat", "en:spelt"],
+    },
+    "en:crustaceans": {
+        "synonyms": ["crustaceans", "crustacean", "shrimp", "prawn", "prawns", "crab", "lobster", "crayfish"],
+        "ingredients": ["en:crustaceans", "en:shrimp", "en:prawn", "en:crab", "en:lobster"],
+    },
+    "en:eggs": {
+        "synonyms": ["egg", "eggs"],
+        "ingredients": ["en:egg", "en:whole-egg", "en:egg-yolk", "en:egg-white", "en:dried-egg"],
+    },
+    "en:fish": {
+        "synonyms": ["fish"],
+        "ingredients": ["en:fish", "en:anchovy", "en:tuna", "en:salmon", "en:cod"],
+    },
+    "en:peanuts": {
+        "synonyms": ["peanut", "peanuts", "groundnut", "groundnuts", "arachis"],
+        "ingredients": ["en:peanut", "en:peanuts", "en:peanut-oil", "en:peanut-butter"],
+    },
+    "en:soybeans": {
+        "synonyms": ["soy", "soya", "soybean", "soybeans", "soy beans"],
+        "ingredients": ["en:soya", "en:soy", "en:soybean", "en:soya-lecithin", "en:soy-lecithin",
+                        "en:soya-protein", "en:soy-sauce"],
+    },
+    "en:milk": {
+        "synonyms": ["milk", "dairy", "lactose", "casein", "whey"],
+        "ingredients": ["en:milk", "en:whole-milk", "en:skimmed-milk", "en:milk-powder",
+                        "en:skimmed-milk-powder", "en:whole-milk-powder", "en:whey", "en:whey-powder",
+                        "en:lactose", "en:butter", "en:cream", "en:cheese", "en:casein"],
+    },
+    "en:nuts": {
+        "synonyms": ["nuts", "tree nuts", "tree nut", "almond", "almonds", "hazelnut", "hazelnuts",
+                     "walnut", "walnuts", "cashew", "cashews", "pecan", "pecans", "pistachio",
+                     "pistachios", "macadamia", "brazil nut", "brazil nuts"],
+        "ingredients": ["en:nut", "en:almond", "en:hazelnut", "en:walnut", "en:cashew-nuts",
+                        "en:pecan-nut", "en:pistachio", "en:macadamia-nut", "en:brazil-nut"],
+    },
+    "en:celery": {
+        "synonyms": ["celery", "celeriac"],
+        "ingredients": ["en:celery", "en:celeriac"],
+    },
+    "en:mustard": {
+        "synonyms": ["mustard"],
+        "ingredients": ["en:mustard", "en:mustard-seed"],
+    },
+    "en:sesame-seeds": {
+        "synonyms": ["sesame", "sesame seeds", "sesame seed"],
+        "ingredients": ["en:sesame", "en:sesame-seeds", "en:sesame-oil", "en:tahini"],
+    },
+    "en:sulphur-dioxide-and-sulphites": {
+        "synonyms": ["sulphites", "sulfites", "sulphite", "sulfite", "sulphur dioxide", "sulfur dioxide"],
+        "ingredients": ["en:sulphite", "en:sulphur-dioxide", "en:e220", "en:e221", "en:e223", "en:e224"],
+    },
+    "en:lupin": {
+        "synonyms": ["lupin", "lupine", "lupins"],
+        "ingredients": ["en:lupin", "en:lupin-flour"],
+    },
+    "en:molluscs": {
+        "synonyms": ["molluscs", "mollusks", "mollusc", "mollusk", "mussels", "oysters", "squid",
+                     "clams", "scallops", "octopus"],
+        "ingredients": ["en:molluscs", "en:mussel", "en:oyster", "en:squid", "en:clam", "en:scallop"],
+    },
+}
+
+# User allergy names that cover more than one allergen tag
+_GROUP_SYNONYMS = {
+    "shellfish": ["en:crustaceans", "en:molluscs"],
+    "seafood": ["en:fish", "en:crustaceans", "en:molluscs"],
+}
+
+_LANGUAGE_PREFIX_RE = re.compile(r"^[a-z]{2,3}:")
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join(str(name).lower().replace("-", " ").replace("_", " ").split())
+
+
+def _build_synonym_index() -> Dict[str, Tuple[str, ...]]:
+    """Normalized user allergy name -> every tag and ingredient id it stands for."""
+    index = {}
+    for tag, entry in CANONICAL_ALLERGENS.items():
+        ids = (tag,) + tuple(entry["ingredients"])
+        for synonym in entry["synonyms"] + [tag_to_name(tag)]:
+            index[_normalize_name(synonym)] = index.get(_normalize_name(synonym), ()) + ids
+    for synonym, tags in _GROUP_SYNONYMS.items():
+        ids = ()
+        for tag in tags:
+            ids += (tag,) + tuple(CANONICAL_ALLERGENS[tag]["ingredients"])
+        index[_normalize_name(synonym)] = ids
+    return index
+
+
+def tag_to_name(tag: str) -> str:
+    """Human-readable name for a taxonomy id ("en:sesame-seeds" -> "sesame seeds")."""
+    return _LANGUAGE_PREFIX_RE.sub("", str(tag).strip().lower()).replace("-", " ").replace("_", " ").strip()
+
+
+def allergy_ids(allergy: str) -> FrozenSet[str]:
+    """
+    Taxonomy ids that mean a user allergy is present.
+    Names outside the vocabulary fall back to the Open Food Facts id
+    convention, e.g. "kiwi" -> {"en:kiwi"}.
+    """
+    name = _normalize_name(allergy)
+    ids = _SYNONYMS.get(name)
+    if ids is None:
+        ids = (f"en:{name.replace(' ', '-')}",) if name else ()
+    return frozenset(ids)
+
+
+@lru_cache(maxsize=1024)
+def _profile_index(allergies: Tuple[str, ...]) -> Dict[str, Tuple[str, ...]]:
+    index: Dict[str, Tuple[str, ...]] = {}
+    for allergy in allergies:
+        for taxonomy_id in allergy_ids(allergy):
+            if allergy not in index.get(taxonomy_id, ()):
+                index[taxonomy_id] = index.get(taxonomy_id, ()) + (allergy,)
+    return index
+
+
+def profile_allergy_index(allergies: Iterable[str]) -> Dict[str, Tuple[str, ...]]:
+    """
+    Canonical id -> user allergies it triggers, for a profile's allergy list.
+    Memoized per allergy list; treat the result as read-only.
+    """
+    return _profile_index(tuple(a for a in allergies if a))
+
+
+_SYNONYMS = _build_synonym_index()
@@ -3,42 +3,82 @@
 Food Ingredients and Allergens Dataset
 Dataset: uom190346a/food-ingredients-and-allergens
 """
-import kagglehub
-from kagglehub import KaggleDatasetAdapter
 import pandas as pd
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
+from .registry import get_dataset
+from .snapshot import kaggle_source, load_snapshot, save_snapshot
 
-# Cache for dataset
-_allergens_dataset = None
+# Bump when the normalization or index changes, to invalidate snapshots
+_SNAPSHOT_VERSION = 1
 
 
-def load_allergens_dataset() -> Optional[pd.DataFrame]:
+class AllergensData(NamedTuple):
+    df: pd.DataFrame
+    # Lowercased ingredient/name column, built once at load
+    name_lower: Optional[pd.Series]
+
+
+def _load_allergens() -> Optional[AllergensData]:
     """
-    Load food ingredients and allergens dataset from Kaggle.
-    
-    Returns:
-        pandas.DataFrame: The loaded dataset, or None if loading fails.
+    Load food ingredients and allergens dataset from its snapshot, or from Kaggle
+    on first use (writing the snapshot for next time).
+    Called once by the dataset registry; use load_allergens_dataset() instead.
     """
-    global _allergens_dataset
-    
-    if _allergens_dataset is not None:
-        return _allergens_dataset
+    snapshot = load_snapshot("allergens", _SNAPSHOT_VERSION)
+    if snapshot is not None:
+        tables, _ = snapshot
+        name_lower = tables["index"]["name_lower"] if "index" in tables else None
+        return AllergensData(tables["data"], name_lower)
     
     try:
         print("Loading food ingredients and allergens dataset...")
+        import kagglehub
+        from kagglehub import KaggleDatasetAdapter
         df = kagglehub.load_dataset(
             KaggleDatasetAdapter.PANDAS,
             "uom190346a/food-ingredients-and-allergens",
             "",
         )
-        _allergens_dataset = df
+        name_lower = _build_allergens_index(df)
         print(f"Allergens dataset loaded. Shape: {df.shape}")
-        return df
+        
+        tables = {"data": df}
+        if name_lower is not None:
+            tables["index"] = name_lower.to_frame("name_lower")
+        save_snapshot("allergens", _SNAPSHOT_VERSION, tables,
+                      sources=[kaggle_source("uom190346a/food-ingredients-and-allergens")])
+        return AllergensData(df, name_lower)
     except Exception as e:
         print(f"Error loading allergens dataset: {e}")
         return None
 
 
+def load_allergens_dataset() -> Optional[pd.DataFrame]:
+    """
+    Load food ingredients and allergens dataset.
+    Loaded once per process; concurrent callers wait for that load.
+    
+    Returns:
+        pandas.DataFrame: The loaded dataset, or None if loading fails.
+    """
+    data = get_dataset("allergens")
+    return data.df if data is not None else None
+
+
+def _build_allergens_index(df: pd.DataFrame) -> Optional[pd.Series]:
+    """
+    Lowercase the searchable name column once so lookups don't redo it per call.
+    
+    Returns:
+        pandas.Series: Lowercased ingredient (or name) column, or None if neither exists.
+    """
+    if 'ingredient' in df.columns and 'allergen' in df.columns:
+        return df['ingredient'].str.lower()
+    if 'name' in df.columns:
+        return df['name'].str.lower()
+    return None
+
+
 def get_ingredient_allergens(ingredient_name: str) -> List[str]:
     """
     Get allergens associated with an ingredient from the dataset.
@@ -49,9 +89,10 @@ def get_ingredient_allergens(ingredient_name: str) -> List[str]:
     Returns:
         List[str]: List of allergen names associated with the ingredient.
     """
-    df = load_allergens_dataset()
-    if df is None:
+    data = get_dataset("allergens")
+    if data is None:
         return []
+    df = data.df
     
     # Normalize ingredient name for matching
     ingredient_lower = ingredient_name.lower().strip()
@@ -59,15 +100,10 @@ def get_ingredient_allergens(ingredient_name: str) -> List[str]:
     # Search for ingredient in dataset (adjust column names based on actual dataset structure)
     allergens = []
     try:
-        # Try different possible column names
-        if 'ingredient' in df.columns and 'allergen' in df.columns:
-            matches = df[df['ingredient'].str.lower().str.contains(ingredient_lower, na=False)]
+        # Index is built from 'ingredient' or 'name', whichever the dataset has
+        if data.name_lower is not None and 'allergen' in df.columns:
+            matches = df[data.name_lower.str.contains(ingredient_lower, na=False)]
             allergens = matches['allergen'].dropna().unique().tolist()
-        elif 'name' in df.columns:
-            # Try to find ingredient and get associated allergens
-            matches = df[df['name'].str.lower().str.contains(ingredient_lower, na=False)]
-            if 'allergen' in df.columns:
-                allergens = matches['allergen'].dropna().unique().tolist()
     except Exception as e:
         print(f"Error searching allergens: {e}")
     
@@ -3,38 +3,50 @@
 Daily Food and Nutrition Dataset
 Dataset: adilshamim8/daily-food-and-nutrition-dataset
 """
-import kagglehub
-from kagglehub import KaggleDatasetAdapter
 import pandas as pd
 from typing import Optional
+from .registry import get_dataset
+from .snapshot import kaggle_source, load_snapshot, save_snapshot
 
-# Cache for dataset
-_daily_nutrition_dataset = None
+# Bump when the normalization changes, to invalidate snapshots
+_SNAPSHOT_VERSION = 1
 
 
-def load_daily_nutrition_dataset() -> Optional[pd.DataFrame]:
+def _load_daily_nutrition() -> Optional[pd.DataFrame]:
     """
-    Load daily food and nutrition dataset from Kaggle.
-    
-    Returns:
-        pandas.DataFrame: The loaded dataset, or None if loading fails.
+    Load daily food and nutrition dataset from its snapshot, or from Kaggle
+    on first use (writing the snapshot for next time).
+    Called once by the dataset registry; use load_daily_nutrition_dataset() instead.
     """
-    global _daily_nutrition_dataset
-    
-    if _daily_nutrition_dataset is not None:
-        return _daily_nutrition_dataset
+    snapshot = load_snapshot("daily_nutrition", _SNAPSHOT_VERSION)
+    if snapshot is not None:
+        tables, _ = snapshot
+        return tables["data"]
     
     try:
         print("Loading daily food and nutrition dataset...")
+        import kagglehub
+        from kagglehub import KaggleDatasetAdapter
         df = kagglehub.load_dataset(
             KaggleDatasetAdapter.PANDAS,
             "adilshamim8/daily-food-and-nutrition-dataset",
             "",
         )
-        _daily_nutrition_dataset = df
+        save_snapshot("daily_nutrition", _SNAPSHOT_VERSION, {"data": df},
+                      sources=[kaggle_source("adilshamim8/daily-food-and-nutrition-dataset")])
         print(f"Daily nutrition dataset loaded. Shape: {df.shape}")
         return df
     except Exception as e:
         print(f"Error loading daily nutrition dataset: {e}")
         return None
 
+
+def load_daily_nutrition_dataset() -> Optional[pd.DataFrame]:
+    """
+    Load daily food and nutrition dataset.
+    Loaded once per process; concurrent callers wait for that load.
+    
+    Returns:
+        pandas.DataFrame: The loaded dataset, or None if loading fails.
+    """
+    return get_dataset("daily_nutrition")
@@ -2,36 +2,187 @@
 """
 Food Classification Dataset
 Dataset: theriley106/foodclassification
+
+The raw dataset keeps one column per dietary flag, holding a mix of bools,
+"Yes"/"No", 1/0 and NaN. At load time those flags are normalized once into a
+packed matrix: two bits per restriction per food (unknown / compliant /
+non-compliant), aligned to an interned table of lowercased food names.
 """
-import kagglehub
-from kagglehub import KaggleDatasetAdapter
+import numpy as np
 import pandas as pd
-from typing import Optional
+import sys
+from typing import Dict, List, NamedTuple, Optional
+from .registry import get_dataset
+from .snapshot import load_snapshot, save_snapshot
 
-# Cache for dataset
-_food_classification_dataset = None
+# Bump when the normalization or index changes, to invalidate snapshots
+_SNAPSHOT_VERSION = 2
 
 
 import os
 
-def load_food_classification_dataset() -> Optional[pd.DataFrame]:
+# Restrictions in bit order: restriction i lives in bits 2*i and 2*i+1 of a code
+RESTRICTIONS = ('vegan', 'vegetarian', 'halal', 'kosher', 'gluten-free')
+UNKNOWN = 0
+COMPLIANT = 1
+NON_COMPLIANT = 2
+
+# Separates names in the search haystack; never part of a lookup
+_NAME_SEPARATOR = "\x00"
+
+
+class FoodClassificationData(NamedTuple):
+    # Lowercased, interned food names in dataset order
+    names: tuple
+    # One uint16 per food: two bits per restriction (see RESTRICTIONS)
+    codes: np.ndarray
+    # Lowercased name -> row of its first occurrence
+    exact: Dict[str, int]
+    # All names joined by _NAME_SEPARATOR, and the start offset of each name
+    haystack: str
+    offsets: np.ndarray
+    # Code -> ready-made classification dict (only codes that occur)
+    decoded: Dict[int, dict]
+
+
+def _flag_value(val) -> Optional[bool]:
+    """
+    Normalize one raw flag (bool, "Yes"/"No", 1/0, None/NaN) to True/False,
+    or None if the value is missing.
+    """
+    if val is None:
+        return None
+    if isinstance(val, (bool, np.bool_)):
+        return bool(val)
+    if isinstance(val, (int, float, np.integer, np.floating)):
+        if pd.isna(val):
+            return None
+        return bool(val)
+    if isinstance(val, str):
+        val_lower = val.lower().strip()
+        if val_lower in ['', 'na', 'n/a', 'none', 'null']:
+            return None
+        return val_lower in ['yes', 'true', '1', 'y']
+    # Unrecognized value types count as non-compliant
+    return False
+
+
+def _column_restriction(col: str) -> List[tuple]:
+    """
+    Map a dataset column to the restrictions it describes.
+
+    Returns:
+        list: (restriction, inverted) pairs; inverted when True means NOT compliant
+        (a "contains gluten" column, as opposed to "gluten free").
+    """
+    col_lower = col.lower()
+    targets = []
+    for keyword in ['vegan', 'vegetarian', 'halal', 'kosher', 'gluten']:
+        if keyword in col_lower:
+            if keyword == 'gluten':
+                targets.append(('gluten-free', 'free' not in col_lower))
+            else:
+                targets.append((keyword, False))
+    return targets
+
+
+def _food_column(columns) -> Optional[str]:
+    """Pick the column holding the food name."""
+    possible_food_cols = ['food', 'product', 'food product', 'item', 'name', 'ingredient']
+
+    for col in columns:
+        if col.lower() in possible_food_cols:
+            return col
+
+    # Fallback: check for columns containing keywords
+    for col in columns:
+        if 'food' in col.lower() or 'product' in col.lower() or 'item' in col.lower():
+            return col
+    return None
+
+
+def _pack_classification(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """
+    Normalize the raw flag columns into one packed code per food.
+    Later columns override earlier ones for the same restriction; missing
+    values leave the restriction unknown.
+
+    Returns:
+        pandas.DataFrame: Columns 'name' (lowercased) and 'code' (uint16), or None if no food column exists.
+    """
+    food_col = _food_column(df.columns)
+    if not food_col:
+        return None
+
+    codes = [0] * len(df)
+    for col in df.columns:
+        for restriction, inverted in _column_restriction(col):
+            shift = 2 * RESTRICTIONS.index(restriction)
+            clear = 0xFFFF ^ (3 << shift)
+            for row, val in enumerate(df[col].tolist()):
+                flag = _flag_value(val)
+                if flag is None:
+                    continue
+                if inverted:
+                    flag = not flag
+                code = COMPLIANT if flag else NON_COMPLIANT
+                codes[row] = (codes[row] & clear) | (code << shift)
+
+    names = df[food_col].astype(str).str.lower()
+    return pd.DataFrame({"name": names.to_numpy(dtype=object), "code": np.array(codes, dtype=np.uint16)})
+
+
+def decode_classification(code: int) -> Optional[dict]:
     """
-    Load food classification dataset from Kaggle.
-    
+    Expand a packed code into a classification dict.
+
     Returns:
-        pandas.DataFrame: The loaded dataset, or None if loading fails.
+        dict: e.g. {'vegan': True, 'halal': False}, or None if every restriction is unknown.
     """
-    global _food_classification_dataset
-    
-    if _food_classification_dataset is not None:
-        return _food_classification_dataset
-    
+    classification = {}
+    for i, restriction in enumerate(RESTRICTIONS):
+        value = (code >> (2 * i)) & 3
+        if value == COMPLIANT:
+            classification[restriction] = True
+        elif value == NON_COMPLIANT:
+            classification[restriction] = False
+    return classification or None
+
+
+def _build_lookup(packed: pd.DataFrame) -> FoodClassificationData:
+    """Build the interned name table and lookup structures from the packed table."""
+    names = tuple(sys.intern(str(name)) for name in packed["name"].tolist())
+    codes = np.ascontiguousarray(packed["code"].to_numpy(), dtype=np.uint16)
+
+    # Built back to front so the first occurrence of a duplicate name wins
+    exact = dict(zip(reversed(names), range(len(names) - 1, -1, -1)))
+
+    lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names)) + 1
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(names) else lengths
+    haystack = _NAME_SEPARATOR.join(names)
+
+    decoded = {int(code): decode_classification(int(code)) for code in np.unique(codes)}
+    return FoodClassificationData(names, codes, exact, haystack, offsets, decoded)
+
+
+def _load_food_classification() -> Optional[FoodClassificationData]:
+    """
+    Load food classification dataset from its snapshot, or from Kaggle
+    on first use (writing the snapshot for next time).
+    Called once by the dataset registry; use load_food_classification_dataset() instead.
+    """
+    snapshot = load_snapshot("food_classification", _SNAPSHOT_VERSION)
+    if snapshot is not None:
+        tables, _ = snapshot
+        return _build_lookup(tables["data"])
+
     try:
         print("Loading food classification dataset (theriley106/foodclassification)...")
         # Download the dataset
+        import kagglehub
         path = kagglehub.dataset_download("theriley106/foodclassification")
         print(f"Dataset downloaded to: {path}")
-        
+
         # Find the JSON file
         json_file = None
         for root, dirs, files in os.walk(path):
@@ -41,125 +192,97 @@ def load_food_classification_dataset() -> Optional[pd.DataFrame]:
                     break
             if json_file:
                 break
-        
+
         if not json_file:
             print("No JSON file found in the dataset.")
             return None
-            
+
         import json
         with open(json_file, 'r') as f:
             data = json.load(f)
-            
+
         # Convert dictionary to DataFrame
         # Structure: {'FoodName': {'Vegan': True, ...}, ...}
         df = pd.DataFrame.from_dict(data, orient='index')
-        
+
         # Make the index (food name) a column
         df.reset_index(inplace=True)
         df.rename(columns={'index': 'food_name'}, inplace=True)
-        
+
         # Normalize column names
         df.columns = [str(c).lower().strip() for c in df.columns]
-        
+
         print(f"Food classification dataset loaded. Shape: {df.shape}")
         print(f"Columns: {df.columns.tolist()}")
-        
-        _food_classification_dataset = df
-        return df
+
+        packed = _pack_classification(df)
+        if packed is None:
+            print("No food name column found in the classification dataset.")
+            return None
+
+        save_snapshot("food_classification", _SNAPSHOT_VERSION, {"data": packed},
+                      {"restrictions": list(RESTRICTIONS)}, sources=[path])
+        return _build_lookup(packed)
     except Exception as e:
         print(f"Error loading food classification dataset: {e}")
         return None
 
+
+def load_food_classification_dataset() -> Optional[FoodClassificationData]:
+    """
+    Load food classification dataset.
+    Loaded once per process; concurrent callers wait for that load.
+
+    Returns:
+        FoodClassificationData: The packed classification table, or None if loading fails.
+    """
+    return get_dataset("food_classification")
+
+
+def find_food_row(data: FoodClassificationData, food_name: str) -> Optional[int]:
+    """
+    Find a food's row: exact (lowercased) name match first, then the first
+    name that contains it.
+
+    Returns:
+        int: Row index into data.names / data.codes, or None if not found.
+    """
+    food_lower = food_name.lower().strip()
+
+    row = data.exact.get(food_lower)
+    if row is not None:
+        return row
+
+    # Partial match: one C-level scan over all names instead of a per-row loop.
+    # The needle can't contain the separator, so a hit lies within one name.
+    if _NAME_SEPARATOR in food_lower or not data.names:
+        return None
+    position = data.haystack.find(food_lower)
+    if position < 0:
+        return None
+    return int(np.searchsorted(data.offsets, position, side='right')) - 1
+
+
 def get_food_classification(food_name: str) -> Optional[dict]:
     """
     Get dietary classification for a food product from the dataset.
-    
+
     Args:
         food_name: The name of the food to search for.
-    
+
     Returns:
         dict: Dictionary with dietary flags (e.g., {'vegan': True, 'halal': False}), or None if not found.
+              The dict is shared between lookups; don't modify it.
     """
-    df = load_food_classification_dataset()
-    if df is None:
+    data = get_dataset("food_classification")
+    if data is None:
         return None
-    
-    # Normalize food name for matching
-    food_lower = food_name.lower().strip()
-    
+
     try:
-        # Identify food column
-        food_col = None
-        possible_food_cols = ['food', 'product', 'food product', 'item', 'name', 'ingredient']
-        
-        for col in df.columns:
-            if col.lower() in possible_food_cols:
-                food_col = col
-                break
-        
-        if not food_col:
-            # Fallback: check for columns containing keywords
-            for col in df.columns:
-                if 'food' in col.lower() or 'product' in col.lower() or 'item' in col.lower():
-                    food_col = col
-                    break
-        
-        if food_col:
-            # Search for food in dataset
-            matches = df[df[food_col].astype(str).str.lower() == food_lower]
-            
-            if matches.empty:
-                # Try partial match
-                matches = df[df[food_col].astype(str).str.lower().str.contains(food_lower, na=False)]
-            
-            if not matches.empty:
-                # Get the first match
-                match = matches.iloc[0]
-                
-                # Extract classification columns
-                classification = {}
-                dietary_keywords = ['vegan', 'vegetarian', 'halal', 'kosher', 'gluten']
-                
-                for col in df.columns:
-                    col_lower = col.lower()
-                    for keyword in dietary_keywords:
-                        if keyword in col_lower:
-                            # Normalize key
-                            key = keyword
-                            if keyword == 'gluten':
-                                key = 'gluten-free'
-                            
-                            # Normalize value (handle boolean, "Yes"/"No", 1/0, None/NaN)
-                            val = match[col]
-                            
-                            # Check if value is missing/NaN
-                            if pd.isna(val) or val is None:
-                                # Skip this classification - don't assume False
-                                continue
-                            
-                            is_compliant = False
-                            
-                            if isinstance(val, bool):
-                                is_compliant = val
-                            elif isinstance(val, (int, float)):
-                                is_compliant = bool(val)
-                            elif isinstance(val, str):
-                                val_lower = val.lower().strip()
-                                if val_lower in ['', 'na', 'n/a', 'none', 'null']:
-                                    # Skip missing string values
-                                    continue
-                                is_compliant = val_lower in ['yes', 'true', '1', 'y']
-                            
-                            # Special handling for "gluten" column which usually means "contains gluten"
-                            if keyword == 'gluten' and 'free' not in col_lower:
-                                # If column is "Contains Gluten", then True means NOT Gluten-Free
-                                classification['gluten-free'] = not is_compliant
-                            else:
-                                classification[key] = is_compliant
-                                
-                return classification if classification else None
-                        
+        row = find_food_row(data, food_name)
+        if row is not None:
+            return data.decoded[int(data.codes[row])]
     except Exception as e:
         print(f"Error searching food classification: {e}")
-    
+
     return None
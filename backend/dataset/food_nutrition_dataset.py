@@ -3,38 +3,50 @@
 Food Nutrition Dataset
 Dataset: utsavdey1410/food-nutrition-dataset
 """
-import kagglehub
-from kagglehub import KaggleDatasetAdapter
 import pandas as pd
 from typing import Optional
+from .registry import get_dataset
+from .snapshot import kaggle_source, load_snapshot, save_snapshot
 
-# Cache for dataset
-_food_nutrition_dataset = None
+# Bump when the normalization changes, to invalidate snapshots
+_SNAPSHOT_VERSION = 1
 
 
-def load_food_nutrition_dataset() -> Optional[pd.DataFrame]:
+def _load_food_nutrition() -> Optional[pd.DataFrame]:
     """
-    Load food nutrition dataset from Kaggle.
-    
-    Returns:
-        pandas.DataFrame: The loaded dataset, or None if loading fails.
+    Load food nutrition dataset from its snapshot, or from Kaggle
+    on first use (writing the snapshot for next time).
+    Called once by the dataset registry; use load_food_nutrition_dataset() instead.
     """
-    global _food_nutrition_dataset
-    
-    if _food_nutrition_dataset is not None:
-        return _food_nutrition_dataset
+    snapshot = load_snapshot("food_nutrition", _SNAPSHOT_VERSION)
+    if snapshot is not None:
+        tables, _ = snapshot
+        return tables["data"]
     
     try:
         print("Loading food nutrition dataset...")
+        import kagglehub
+        from kagglehub import KaggleDatasetAdapter
         df = kagglehub.load_dataset(
             KaggleDatasetAdapter.PANDAS,
             "utsavdey1410/food-nutrition-dataset",
             "",
         )
-        _food_nutrition_dataset = df
+        save_snapshot("food_nutrition", _SNAPSHOT_VERSION, {"data": df},
+                      sources=[kaggle_source("utsavdey1410/food-nutrition-dataset")])
         print(f"Food nutrition dataset loaded. Shape: {df.shape}")
         return df
     except Exception as e:
         print(f"Error loading food nutrition dataset: {e}")
         return None
 
+
+def load_food_nutrition_dataset() -> Optional[pd.DataFrame]:
+    """
+    Load food nutrition dataset.
+    Loaded once per process; concurrent callers wait for that load.
+    
+    Returns:
+        pandas.DataFrame: The loaded dataset, or None if loading fails.
+    """
+    return get_dataset("food_nutrition")
@@ -4,8 +4,54 @@ Ingredient checking functionality that uses all datasets to check ingredients
 against user-defined restrictions and allergies.
 """
 import re
-from typing import Dict, Optional
-from .allergens_dataset import get_ingredient_allergens
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+STRICT_RESTRICTIONS = ('vegan', 'vegetarian', 'halal', 'kosher', 'gluten-free')
+
+RESTRICTION_PATTERNS = {
+    "vegan": ["milk", "egg", "cheese", "butter", "honey", "gelatin", "whey"],
+    "vegetarian": ["meat", "chicken", "beef", "pork", "fish", "gelatin"],
+    "gluten-free": ["wheat", "gluten", "barley", "rye", "malt"],
+    "halal": ["pork", "alcohol", "gelatin"],
+    "kosher": ["pork", "shellfish", "mixing meat dairy"]
+}
+
+
+class IngredientFacts(NamedTuple):
+    """Everything about an ingredient the checks need that doesn't depend on the profile."""
+    ingredient: str
+    lower: str
+    dataset_available: bool
+    classification: Optional[Dict]
+    allergens: Tuple[str, ...]
+
+
+@lru_cache(maxsize=1024)
+def _word_pattern(term: str):
+    return re.compile(r'\b' + re.escape(term) + r'\b')
+
+
+def analyze_ingredient(ingredient: str) -> IngredientFacts:
+    """
+    Look an ingredient up in the classification and allergens datasets once,
+    so it can be checked against any number of profiles with evaluate_ingredient().
+    """
+    dataset_available = False
+    classification = None
+    try:
+        from .food_classification import get_food_classification, load_food_classification_dataset
+        if load_food_classification_dataset() is not None:
+            classification = get_food_classification(ingredient)
+            dataset_available = True
+    except Exception as e:
+        print(f"Error checking classification dataset: {e}")
+        # On error, checks fall through to pattern matching
+        classification = None
+
+    from .allergens_dataset import get_ingredient_allergens
+    allergens = tuple(str(a).lower().strip() for a in get_ingredient_allergens(ingredient))
+    return IngredientFacts(ingredient, ingredient.lower().strip(), dataset_available, classification, allergens)
 
 
 def check_ingredient_against_restrictions(ingredient: str, restrictions: Dict, product_classification: Optional[Dict] = None) -> Optional[Dict]:
@@ -28,7 +74,16 @@ def check_ingredient_against_restrictions(ingredient: str, restrictions: Dict, p
             "source": optional source indicator
         }
     """
-    ingredient_lower = ingredient.lower().strip()
+    return evaluate_ingredient(analyze_ingredient(ingredient), restrictions, product_classification)
+
+
+def evaluate_ingredient(facts: IngredientFacts, restrictions: Dict, product_classification: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    check_ingredient_against_restrictions() for an ingredient already analyzed
+    with analyze_ingredient(). Only does profile-dependent matching.
+    """
+    ingredient = facts.ingredient
+    ingredient_lower = facts.lower
     
     # Check allergies
     for allergy in restrictions.get("allergies", []):
@@ -43,9 +98,7 @@ def check_ingredient_against_restrictions(ingredient: str, restrictions: Dict, p
             }
         
         # Word boundary matching (e.g., "milk" matches "milk", "milk powder", "contains milk", but not "milky")
-        # Create word boundary pattern
-        pattern = r'\b' + re.escape(allergy_lower) + r'\b'
-        if re.search(pattern, ingredient_lower):
+        if _word_pattern(allergy_lower).search(ingredient_lower):
             return {
                 "type": "allergy",
                 "item": allergy,
@@ -83,82 +136,62 @@ def check_ingredient_against_restrictions(ingredient: str, restrictions: Dict, p
         # 1. Check against new classification dataset (for ingredient itself)
         # Stricter approach: if ingredient is not in dataset, flag as non-compliant
         classification_checked = False
-        dataset_available = False
-        try:
-            from .food_classification import get_food_classification, load_food_classification_dataset
-            # Check if dataset is available
-            dataset_df = load_food_classification_dataset()
-            dataset_available = dataset_df is not None
+        if facts.dataset_available:
+            classification = facts.classification
             
-            if dataset_available:
-                classification = get_food_classification(ingredient)
+            if classification is not None:
+                # Ingredient exists in dataset - check its classification
+                # Map user restriction to dataset key
+                # e.g. "Vegan" -> "vegan", "Gluten-Free" -> "gluten-free"
+                is_compliant = classification.get(restriction_lower)
                 
-                if classification is not None:
-                    # Ingredient exists in dataset - check its classification
-                    # Map user restriction to dataset key
-                    # e.g. "Vegan" -> "vegan", "Gluten-Free" -> "gluten-free"
-                    is_compliant = classification.get(restriction_lower)
-                    
-                    # If dataset explicitly says False (not compliant), flag it
-                    if is_compliant is False:
-                        return {
-                            "type": "restriction",
-                            "item": restriction,
-                            "ingredient": ingredient,
-                            "source": "classification_dataset"
-                        }
-                    # If True, trust the dataset and skip fallback pattern matching for this restriction
-                    elif is_compliant is True:
-                        classification_checked = True
-                        # Skip to next restriction - this one is compliant according to dataset
-                        continue
-                    # If classification exists but doesn't have this restriction key, flag as non-compliant
-                    elif restriction_lower in ['vegan', 'vegetarian', 'halal', 'kosher', 'gluten-free']:
-                        # Ingredient is in dataset but doesn't have this classification, so it's not compliant
-                        return {
-                            "type": "restriction",
-                            "item": restriction,
-                            "ingredient": ingredient,
-                            "source": "classification_dataset_not_found"
-                        }
-                else:
-                    # Ingredient not found in classification dataset at all - flag as non-compliant
-                    # Only apply this strict check for standard dietary restrictions
-                    if restriction_lower in ['vegan', 'vegetarian', 'halal', 'kosher', 'gluten-free']:
-                        return {
-                            "type": "restriction",
-                            "item": restriction,
-                            "ingredient": ingredient,
-                            "source": "classification_dataset_not_in_list"
-                        }
-        except Exception as e:
-            print(f"Error checking classification dataset: {e}")
-            # On error, fall through to pattern matching
+                # If dataset explicitly says False (not compliant), flag it
+                if is_compliant is False:
+                    return {
+                        "type": "restriction",
+                        "item": restriction,
+                        "ingredient": ingredient,
+                        "source": "classification_dataset"
+                    }
+                # If True, trust the dataset and skip fallback pattern matching for this restriction
+                elif is_compliant is True:
+                    classification_checked = True
+                    # Skip to next restriction - this one is compliant according to dataset
+                    continue
+                # If classification exists but doesn't have this restriction key, flag as non-compliant
+                elif restriction_lower in STRICT_RESTRICTIONS:
+                    # Ingredient is in dataset but doesn't have this classification, so it's not compliant
+                    return {
+                        "type": "restriction",
+                        "item": restriction,
+                        "ingredient": ingredient,
+                        "source": "classification_dataset_not_found"
+                    }
+            else:
+                # Ingredient not found in classification dataset at all - flag as non-compliant
+                # Only apply this strict check for standard dietary restrictions
+                if restriction_lower in STRICT_RESTRICTIONS:
+                    return {
+                        "type": "restriction",
+                        "item": restriction,
+                        "ingredient": ingredient,
+                        "source": "classification_dataset_not_in_list"
+                    }
 
         # 2. Check against known restriction patterns (Fallback/Augmentation)
         # Only use fallback if classification dataset check didn't resolve the issue
         if not classification_checked:
-            restriction_patterns = {
-                "vegan": ["milk", "egg", "cheese", "butter", "honey", "gelatin", "whey"],
-                "vegetarian": ["meat", "chicken", "beef", "pork", "fish", "gelatin"],
-                "gluten-free": ["wheat", "gluten", "barley", "rye", "malt"],
-                "halal": ["pork", "alcohol", "gelatin"],
-                "kosher": ["pork", "shellfish", "mixing meat dairy"]
-            }
-            
-            if restriction_lower in restriction_patterns:
-                for pattern in restriction_patterns[restriction_lower]:
+            if restriction_lower in RESTRICTION_PATTERNS:
+                for pattern in RESTRICTION_PATTERNS[restriction_lower]:
                     # Use word boundary matching for better accuracy
-                    pattern_re = r'\b' + re.escape(pattern) + r'\b'
-                    if re.search(pattern_re, ingredient_lower):
+                    if _word_pattern(pattern).search(ingredient_lower):
                         return {
                             "type": "restriction",
                             "item": restriction,
                             "ingredient": ingredient
                         }
             # Direct match with word boundary
-            pattern_re = r'\b' + re.escape(restriction_lower) + r'\b'
-            if re.search(pattern_re, ingredient_lower):
+            if _word_pattern(restriction_lower).search(ingredient_lower):
                 return {
                     "type": "restriction",
                     "item": restriction,
@@ -166,18 +199,7 @@ def check_ingredient_against_restrictions(ingredient: str, restrictions: Dict, p
                 }
     
     # Check dataset for allergens
-    allergens = get_ingredient_allergens(ingredient)
-    
-    # Also check the new food allergens dataset
-    try:
-        from .food_allergens_dataset import get_food_allergens
-        more_allergens = get_food_allergens(ingredient)
-        allergens.extend(more_allergens)
-    except Exception as e:
-        print(f"Error checking food allergens dataset: {e}")
-        
-    for allergen in allergens:
-        allergen_lower = str(allergen).lower().strip()
+    for allergen_lower in facts.allergens:
         # Check if this allergen is in user's restrictions
         for allergy in restrictions.get("allergies", []):
             if allergy.lower().strip() in allergen_lower or allergen_lower in allergy.lower().strip():
@@ -189,4 +211,3 @@ def check_ingredient_against_restrictions(ingredient: str, restrictions: Dict, p
                 }
     
     return None
-
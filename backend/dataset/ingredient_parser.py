@@ -0,0 +1,160 @@
+# backend/dataset/ingredient_parser.py
+"""
+Ingredient list parsing shared by the scan and check endpoints.
+
+Open Food Facts ingredient text nests sub-ingredients in brackets, sometimes
+several levels deep, and annotates amounts with percentages:
+
+    "chocolate 20% (sugar, cocoa butter (soy lecithin)), hazelnuts (13%)"
+
+parse_ingredients() tokenizes that in a single pass into a flat,
+deduplicated list where each ingredient links to the one it belongs to,
+and memoizes the result by a hash of the text.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+# Parsed results kept, keyed by a hash of the ingredients text
+CACHE_SIZE = int(os.getenv("INGREDIENT_PARSE_CACHE_SIZE", "4096"))
+
+_OPENING = "([{"
+_CLOSING = ")]}"
+# Every character the tokenizer acts on; the text between them is skipped in C
+_DELIMITER_RE = re.compile(r"[()\[\]{},;]")
+# Percentage annotation, e.g. "13%", "8,7 %", "<2%"
+_PERCENT_RE = re.compile(r"[<>~≤≥]?\s*(\d+(?:[.,]\d+)?)\s*%")
+# Trimmed from both ends of every ingredient name
+_STRIP_CHARS = " \t\r\n.:*_•·"
+
+
+class Ingredient(NamedTuple):
+    name: str
+    # Position of the enclosing ingredient in the parsed list, or None at top level
+    parent: Optional[int]
+    percent: Optional[float]
+
+
+def _clean(raw: str) -> Tuple[str, Optional[float]]:
+    """Split a raw token into (ingredient name, percentage or None)."""
+    percent = None
+    match = _PERCENT_RE.search(raw) if "%" in raw else None
+    if match:
+        percent = float(match.group(1).replace(",", "."))
+        raw = raw[:match.start()] + " " + raw[match.end():]
+    name = " ".join(raw.split()).strip(_STRIP_CHARS)
+    return name, percent
+
+
+def _tokenize(text: str) -> List[Ingredient]:
+    """
+    Single left-to-right pass over the text, visiting only delimiters.
+    Commas/semicolons end an ingredient, an opening bracket makes the text
+    before it the parent of everything up to the matching closing bracket.
+    Unbalanced brackets are tolerated: a stray closer just ends the token and
+    unclosed groups end with the text.
+    """
+    names: List[str] = []
+    parents: List[Optional[int]] = []
+    percents: List[Optional[float]] = []
+    seen = {}           # lowercased name -> position
+    stack = []          # parent position for each open bracket
+    start = 0           # start of the current token
+    closed = None       # ingredient whose bracket group just closed
+    length = len(text)
+
+    def emit(end: int) -> Optional[int]:
+        parent = stack[-1] if stack else None
+        name, percent = _clean(text[start:end])
+        if not name:
+            # A bare percentage annotates the ingredient it follows / sits inside
+            target = closed if closed is not None else parent
+            if percent is not None and target is not None and percents[target] is None:
+                percents[target] = percent
+            return None
+        key = name.lower()
+        position = seen.get(key)
+        if position is None:
+            position = seen[key] = len(names)
+            names.append(name)
+            parents.append(parent)
+            percents.append(percent)
+        elif percent is not None and percents[position] is None:
+            percents[position] = percent
+        return position
+
+    for match in _DELIMITER_RE.finditer(text):
+        i = match.start()
+        ch = text[i]
+        if ch in _OPENING:
+            position = emit(i)
+            if position is None:
+                # "(sugar, salt)" with nothing before it: children belong to the current parent
+                position = stack[-1] if stack else None
+            stack.append(position)
+            start, closed = i + 1, None
+        elif ch in _CLOSING:
+            emit(i)
+            closed = stack.pop() if stack else None
+            start = i + 1
+        else:
+            # Decimal comma inside a number ("8,7%") doesn't separate
+            if ch == "," and 0 < i < length - 1 and text[i - 1].isdigit() and text[i + 1].isdigit():
+                continue
+            emit(i)
+            start, closed = i + 1, None
+
+    emit(length)
+    return [Ingredient(n, p, pc) for n, p, pc in zip(names, parents, percents)]
+
+
+_cache: "OrderedDict[bytes, Tuple[Ingredient, ...]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def parse_ingredients(text: str) -> Tuple[Ingredient, ...]:
+    """
+    Parse an ingredients text into a flat, deduplicated list with parent links.
+
+    Args:
+        text: Raw ingredients text (e.g. Open Food Facts ingredients_text).
+
+    Returns:
+        tuple: Ingredient entries in order of first appearance. Shared between
+               callers through the memo cache, so treat it as read-only.
+    """
+    if not text:
+        return ()
+    text = str(text)
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    with _cache_lock:
+        parsed = _cache.get(key)
+        if parsed is not None:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return parsed
+        _cache_stats["misses"] += 1
+
+    parsed = tuple(_tokenize(text))
+
+    with _cache_lock:
+        _cache[key] = parsed
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return parsed
+
+
+def ingredient_names(text: str) -> List[str]:
+    """Just the ingredient names from parse_ingredients(), in order."""
+    return [ingredient.name for ingredient in parse_ingredients(text)]
+
+
+def parse_cache_info() -> dict:
+    """Memo cache size and hit/miss counts."""
+    with _cache_lock:
+        return {"size": len(_cache), "maxSize": CACHE_SIZE, **_cache_stats}
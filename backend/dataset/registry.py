@@ -0,0 +1,313 @@
+# backend/dataset/registry.py
+"""
+Dataset registry: the single owner of every loaded dataset.
+
+Every dataset is registered here by name, together with the function that
+loads it from its snapshot or from Kaggle. Datasets load lazily on first use
+(or at startup, if marked preload), and at most once per process: the first
+caller runs the loader, and any caller that arrives while that load is in
+progress waits on a readiness event instead of starting a second load.
+That wait is capped by set_wait_limit() (the app passes its request
+deadline), and a caller that gives up gets None like a failed load.
+
+The registry also tracks each dataset's resident memory and last access.
+Datasets declared cold are evicted, least recently used first, whenever the
+total goes over DATASET_MEMORY_BUDGET_MB; they reload (from their snapshot)
+the next time they're used.
+"""
+import gc
+import importlib
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .snapshot import snapshot_hash
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# How long a caller waits for a load started by someone else (seconds)
+WAIT_TIMEOUT = float(os.getenv("DATASET_WAIT_SECONDS", "30"))
+# A failed load is retried by the next caller after this many seconds
+RETRY_AFTER = float(os.getenv("DATASET_RETRY_SECONDS", "300"))
+
+# Seconds the current caller can still afford to wait, or None (see set_wait_limit)
+_wait_limit: Optional[Callable[[], Optional[float]]] = None
+
+# Evict cold datasets once resident memory goes over this (0 disables eviction)
+MEMORY_BUDGET = int(float(os.getenv("DATASET_MEMORY_BUDGET_MB", "512")) * 1024 * 1024)
+
+# Modules are imported on first load, so the registry itself stays cheap to import.
+#   preload: loaded at startup (see preload_datasets)
+#   cold: rarely used; may be evicted to stay under MEMORY_BUDGET
+DATASETS = {
+    "allergens": {"module": "allergens_dataset", "loader": "_load_allergens", "preload": True, "cold": False},
+    "food_classification": {"module": "food_classification", "loader": "_load_food_classification", "preload": True, "cold": False},
+    "daily_nutrition": {"module": "daily_nutrition_dataset", "loader": "_load_daily_nutrition", "preload": False, "cold": True},
+    "food_nutrition": {"module": "food_nutrition_dataset", "loader": "_load_food_nutrition", "preload": False, "cold": True},
+}
+
+_lock = threading.Lock()
+_entries: Dict[str, dict] = {}
+# Bumped on every state change (load started/finished, eviction), under _lock
+_generation = 0
+
+
+def _new_entry() -> dict:
+    return {
+        "state": PENDING,
+        "event": threading.Event(),
+        "value": None,
+        "error": None,
+        "startedAt": None,
+        "finishedAt": None,
+        "loadMs": None,
+        "snapshot": None,
+        "residentBytes": 0,
+        "lastAccess": None,
+        "loads": 0,
+        "evictions": 0,
+    }
+
+
+def _reset_entry(entry: dict) -> dict:
+    # Fresh entry (new event) that keeps the lifetime counters
+    fresh = _new_entry()
+    fresh["loads"] = entry["loads"]
+    fresh["evictions"] = entry["evictions"]
+    fresh["lastAccess"] = entry["lastAccess"]
+    return fresh
+
+
+def _entry(name: str) -> dict:
+    # Caller holds _lock
+    entry = _entries.get(name)
+    if entry is None:
+        if name not in DATASETS:
+            raise KeyError(f"Unknown dataset: {name}")
+        entry = _entries[name] = _new_entry()
+    return entry
+
+
+def resident_bytes(value: Any) -> int:
+    """Approximate memory held by a dataset value (DataFrames, arrays and containers of them)."""
+    if value is None:
+        return 0
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage):
+        # pandas DataFrame / Series, including object (string) contents
+        usage = memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(resident_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(resident_bytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _run_loader(name: str, entry: dict) -> None:
+    spec = DATASETS[name]
+    value, error = None, None
+    started = time.perf_counter()
+    try:
+        module = importlib.import_module(f".{spec['module']}", __package__)
+        value = getattr(module, spec["loader"])()
+        if value is None:
+            error = "Loader returned no data"
+    except Exception as e:
+        error = str(e)
+        print(f"Error loading dataset {name}: {e}")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    snapshot = snapshot_hash(name) if value is not None else None
+    size = resident_bytes(value)
+
+    with _lock:
+        entry["value"] = value
+        entry["error"] = error
+        entry["state"] = READY if value is not None else FAILED
+        entry["finishedAt"] = entry["lastAccess"] = time.time()
+        entry["loadMs"] = round(elapsed_ms, 1)
+        entry["snapshot"] = snapshot
+        entry["residentBytes"] = size
+        entry["loads"] += 1
+        _bump_generation()
+        event = entry["event"]
+    event.set()
+
+    if value is not None:
+        enforce_budget(keep=name)
+
+
+def set_wait_limit(limit: Optional[Callable[[], Optional[float]]]) -> None:
+    """
+    Cap waits for a load in progress at limit() seconds, when it returns a
+    number (e.g. what is left of the request's deadline).
+    """
+    global _wait_limit
+    _wait_limit = limit
+
+
+def _wait_seconds(timeout: Optional[float]) -> float:
+    wait = WAIT_TIMEOUT if timeout is None else timeout
+    left = _wait_limit() if _wait_limit is not None else None
+    return wait if left is None else max(0.0, min(wait, left))
+
+
+def get_dataset(name: str, timeout: Optional[float] = None) -> Any:
+    """
+    Return a loaded dataset, loading it first if nobody has yet.
+
+    Args:
+        name: Registered dataset name (see DATASETS).
+        timeout: Seconds to wait for a load already in progress (default
+            WAIT_TIMEOUT), capped by the wait limit.
+
+    Returns:
+        The dataset value, or None if loading failed or did not finish in time.
+    """
+    with _lock:
+        entry = _entry(name)
+        state = entry["state"]
+        if state == READY:
+            entry["lastAccess"] = time.time()
+            return entry["value"]
+        if state == FAILED and time.time() - entry["finishedAt"] >= RETRY_AFTER:
+            entry = _entries[name] = _reset_entry(entry)
+            state = PENDING
+        if state == PENDING:
+            entry["state"] = LOADING
+            entry["startedAt"] = time.time()
+            _bump_generation()
+            owner = True
+        else:
+            owner = False
+        event = entry["event"]
+
+    if owner:
+        _run_loader(name, entry)
+    elif state == LOADING:
+        wait = _wait_seconds(timeout)
+        if not event.wait(wait) and wait > 0:
+            print(f"Gave up waiting for dataset {name} to load after {wait:.1f} s")
+
+    with _lock:
+        return entry["value"] if entry["state"] == READY else None
+
+
+def _bump_generation() -> None:
+    # Caller holds _lock
+    global _generation
+    _generation += 1
+
+
+def generation() -> int:
+    """A number that changes whenever any dataset's state does; cheap enough to poll per call."""
+    return _generation
+
+
+def is_ready(name: str) -> bool:
+    """True if the dataset is loaded, without triggering or waiting for a load."""
+    with _lock:
+        entry = _entries.get(name)
+        return entry is not None and entry["state"] == READY
+
+
+def preload_datasets(names: Optional[Iterable[str]] = None) -> None:
+    """Load the given datasets (default: those marked for preload), in order."""
+    if names is None:
+        names = [name for name, spec in DATASETS.items() if spec["preload"]]
+    for name in names:
+        get_dataset(name)
+
+
+def evict_dataset(name: str) -> bool:
+    """
+    Drop a loaded dataset from memory; it reloads on next use.
+
+    Returns:
+        bool: True if the dataset was loaded and has been evicted.
+    """
+    with _lock:
+        entry = _entry(name)
+        if entry["state"] != READY:
+            return False
+        fresh = _reset_entry(entry)
+        fresh["evictions"] += 1
+        _entries[name] = fresh
+        _bump_generation()
+    print(f"Evicted dataset {name} ({entry['residentBytes'] / 1048576:.1f} MB)")
+    gc.collect()
+    return True
+
+
+def enforce_budget(keep: Optional[str] = None) -> List[str]:
+    """
+    Evict cold datasets, least recently used first, until resident memory
+    fits MEMORY_BUDGET. Hot datasets and `keep` are never evicted.
+
+    Returns:
+        list: Names of the evicted datasets.
+    """
+    if MEMORY_BUDGET <= 0:
+        return []
+    with _lock:
+        loaded = [(name, e) for name, e in _entries.items() if e["state"] == READY]
+        total = sum(e["residentBytes"] for _, e in loaded)
+        candidates = sorted(
+            ((name, e) for name, e in loaded if DATASETS[name]["cold"] and name != keep),
+            key=lambda item: item[1]["lastAccess"] or 0,
+        )
+    evicted = []
+    for name, entry in candidates:
+        if total <= MEMORY_BUDGET:
+            break
+        if evict_dataset(name):
+            total -= entry["residentBytes"]
+            evicted.append(name)
+    return evicted
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+def dataset_status() -> Dict[str, dict]:
+    """Per-dataset load state, timings and memory, for the readiness and admin endpoints."""
+    status = {}
+    with _lock:
+        for name, spec in DATASETS.items():
+            entry = _entries.get(name) or _new_entry()
+            status[name] = {
+                "state": entry["state"],
+                "preload": spec["preload"],
+                "cold": spec["cold"],
+                "loadMs": entry["loadMs"],
+                "startedAt": _iso(entry["startedAt"]),
+                "finishedAt": _iso(entry["finishedAt"]),
+                "lastAccessAt": _iso(entry["lastAccess"]),
+                "residentBytes": entry["residentBytes"] if entry["state"] == READY else 0,
+                "loads": entry["loads"],
+                "evictions": entry["evictions"],
+                "snapshot": entry["snapshot"],
+                "error": entry["error"],
+            }
+    return status
+
+
+def memory_report() -> dict:
+    """Registry-wide memory totals plus per-dataset status."""
+    datasets = dataset_status()
+    return {
+        "budgetBytes": MEMORY_BUDGET,
+        "residentBytes": sum(d["residentBytes"] for d in datasets.values()),
+        "datasets": datasets,
+    }
@@ -0,0 +1,250 @@
+# backend/dataset/snapshot.py
+"""
+On-disk snapshots of the normalized Kaggle datasets.
+
+The first load of a dataset goes through kagglehub and pandas parsing, then
+writes the normalized tables (plus any derived lookup indexes) to a snapshot
+directory. Later process starts read the snapshot back in, with no Kaggle
+access and no CSV/JSON parsing.
+
+Layout (under DATASET_SNAPSHOT_DIR, default backend/.snapshots):
+    <name>.json              pointer: hash, loader version, tables, source files
+    <name>-<hash>/<table>.feather  (or .pkl when pyarrow can't store a column)
+
+Tables are written as uncompressed Feather (Arrow IPC) files and read back
+into pandas in one pass; the DataFrames live in the process heap like any
+other. Without pyarrow, or for columns Arrow can't type (e.g. mixed bool/str
+object columns), the table falls back to a pickle.
+
+The hash covers the downloaded source files (plus the loader version and
+meta), so it names the upstream content the snapshot came from. The pointer
+also records each source file's size and mtime: when the download on disk
+changes (kagglehub fetched a new copy into the same place), the snapshot is
+ignored and rebuilt. If the downloads have been deleted, the snapshot is
+used as is.
+
+Set DATASET_SNAPSHOTS=0 to disable snapshots. Delete the directory, or bump
+the loader's version, to force a fresh download.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SNAPSHOT_DIR = os.getenv(
+    "DATASET_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".snapshots"),
+)
+
+# Bump when the snapshot layout itself changes
+SNAPSHOT_FORMAT = 1
+
+
+def snapshots_enabled() -> bool:
+    return os.getenv("DATASET_SNAPSHOTS", "1").lower() not in ("0", "false", "no", "off")
+
+
+def _pointer_path(name: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{name}.json")
+
+
+def _read_pointer(name: str) -> Optional[dict]:
+    try:
+        with open(_pointer_path(name), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_table(df: "pd.DataFrame", directory: str, table: str) -> str:
+    """Write one table, preferring Feather. Returns the file name used."""
+    df = df.reset_index(drop=True)
+    df.columns = [str(c) for c in df.columns]
+    try:
+        import pyarrow.feather as feather
+        file_name = f"{table}.feather"
+        feather.write_feather(df, os.path.join(directory, file_name), compression="uncompressed")
+        return file_name
+    except Exception:
+        # pyarrow missing, or a column Arrow can't type: keep the exact objects
+        file_name = f"{table}.pkl"
+        df.to_pickle(os.path.join(directory, file_name))
+        return file_name
+
+
+def _read_table(path: str) -> "pd.DataFrame":
+    if path.endswith(".feather"):
+        import pyarrow.feather as feather
+        return feather.read_feather(path)
+    import pandas as pd
+    return pd.read_pickle(path)
+
+
+def _hash_files(paths: Iterable[str], header: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(json.dumps(header, sort_keys=True, default=str).encode())
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _source_files(sources: Iterable[str]) -> List[str]:
+    """Every file under the given files/directories, sorted."""
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, names in os.walk(source):
+                files += [os.path.join(root, n) for n in names]
+        elif os.path.isfile(source):
+            files.append(source)
+    return sorted(files)
+
+
+def _source_stats(files: Iterable[str]) -> Dict[str, list]:
+    stats = {}
+    for path in files:
+        st = os.stat(path)
+        stats[path] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def _sources_unchanged(pointer: dict) -> bool:
+    recorded = pointer.get("sourceFiles")
+    sources = pointer.get("sources") or []
+    if not recorded or not any(os.path.exists(s) for s in sources):
+        # Written without sources, or the downloads are gone: nothing to compare against
+        return True
+    try:
+        return _source_stats(_source_files(sources)) == recorded
+    except OSError:
+        return False
+
+
+def kaggle_source(handle: str) -> Optional[str]:
+    """Local directory kagglehub downloaded a dataset to (already cached after a load), or None."""
+    try:
+        import kagglehub
+        return kagglehub.dataset_download(handle)
+    except Exception as e:
+        print(f"Error locating {handle} download, hashing the snapshot instead: {e}")
+        return None
+
+
+def load_snapshot(name: str, version: int) -> Optional[Tuple[Dict[str, "pd.DataFrame"], dict]]:
+    """
+    Load a dataset snapshot written by save_snapshot.
+
+    Args:
+        name: Dataset name (e.g. 'allergens').
+        version: Loader version; a snapshot written by another version is ignored.
+
+    Returns:
+        tuple: (tables by name, meta dict), or None if there is no usable snapshot.
+    """
+    if not snapshots_enabled():
+        return None
+
+    pointer = _read_pointer(name)
+    if not pointer or pointer.get("format") != SNAPSHOT_FORMAT or pointer.get("version") != version:
+        return None
+    if not _sources_unchanged(pointer):
+        print(f"Source files of the {name} snapshot changed, reloading from source")
+        return None
+
+    directory = os.path.join(SNAPSHOT_DIR, pointer.get("dir", ""))
+    try:
+        started = time.perf_counter()
+        tables = {
+            table: _read_table(os.path.join(directory, file_name))
+            for table, file_name in pointer.get("tables", {}).items()
+        }
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"Loaded {name} snapshot {pointer['hash'][:12]} in {elapsed_ms:.1f} ms")
+        return tables, pointer.get("meta", {})
+    except Exception as e:
+        print(f"Error reading {name} snapshot, reloading from source: {e}")
+        return None
+
+
+def save_snapshot(name: str, version: int, tables: Dict[str, "pd.DataFrame"], meta: Optional[dict] = None,
+                  sources: Optional[Iterable[Optional[str]]] = None) -> Optional[str]:
+    """
+    Write a dataset snapshot, keyed by the hash of its source files.
+
+    Args:
+        name: Dataset name (e.g. 'allergens').
+        version: Loader version, checked again by load_snapshot.
+        tables: Normalized tables and derived index tables to store.
+        meta: Small JSON-serializable extras (e.g. the name of the food column).
+        sources: Downloaded files or directories the tables were built from
+            (None entries are skipped). Without any, the written tables are
+            hashed instead, and nothing is checked on load.
+
+    Returns:
+        str: The content hash, or None if snapshots are disabled or writing failed.
+    """
+    if not snapshots_enabled():
+        return None
+
+    meta = meta or {}
+    sources = [os.path.abspath(s) for s in (sources or []) if s]
+    try:
+        source_files = _source_files(sources)
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{name}-", dir=SNAPSHOT_DIR)
+        files = {table: _write_table(df, tmp_dir, table) for table, df in tables.items()}
+        header = {"version": version, "meta": meta}
+        if source_files:
+            content_hash = _hash_files(source_files, header)
+        else:
+            content_hash = _hash_files([os.path.join(tmp_dir, files[t]) for t in sorted(files)], header)
+
+        dir_name = f"{name}-{content_hash[:16]}"
+        final_dir = os.path.join(SNAPSHOT_DIR, dir_name)
+        if os.path.exists(final_dir):
+            # Same content already on disk (e.g. written by another worker)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, final_dir)
+
+        pointer = {
+            "format": SNAPSHOT_FORMAT,
+            "version": version,
+            "hash": content_hash,
+            "dir": dir_name,
+            "tables": files,
+            "meta": meta,
+            "sources": sources,
+            "sourceFiles": _source_stats(source_files),
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        fd, tmp_pointer = tempfile.mkstemp(prefix=f".{name}-", suffix=".json", dir=SNAPSHOT_DIR)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(pointer, f, indent=2)
+        os.replace(tmp_pointer, _pointer_path(name))
+
+        # Drop older snapshots of this dataset
+        for entry in os.listdir(SNAPSHOT_DIR):
+            if entry.startswith(f"{name}-") and entry != dir_name:
+                shutil.rmtree(os.path.join(SNAPSHOT_DIR, entry), ignore_errors=True)
+
+        print(f"Wrote {name} snapshot {content_hash[:12]}")
+        return content_hash
+    except Exception as e:
+        print(f"Error writing {name} snapshot: {e}")
+        return None
+
+
+def snapshot_hash(name: str) -> Optional[str]:
+    """Content hash of the current snapshot of a dataset, or None."""
+    pointer = _read_pointer(name)
+    return pointer.get("hash") if pointer else None
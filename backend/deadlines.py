@@ -0,0 +1,138 @@
+# backend/deadlines.py
+"""
+Per-request deadline budgets.
+
+Each request to a budgeted endpoint gets a deadline when it starts. Every
+downstream call draws its timeout from what is left (timeout_for), so one
+request can no longer stack a 10 s product fetch on top of several 10 s
+search calls. When the budget is spent, callers skip the remaining work and
+return partial results.
+
+Budgets are set per Flask endpoint name, in seconds:
+
+    REQUEST_BUDGETS="scan_barcode=5,check_ingredients=6"
+    REQUEST_BUDGET_DEFAULT_SECONDS=0    (0 = no budget for other endpoints)
+
+Responses to budgeted requests carry X-Request-Budget-Ms,
+X-Request-Budget-Spent-Ms and, when it ran out, X-Request-Budget-Exhausted.
+Streamed responses only carry X-Request-Budget-Ms: their headers go out
+before the work is done. Such endpoints report report() at the end of the
+stream instead.
+"""
+import contextvars
+import os
+import time
+from typing import Optional
+
+DEFAULT_BUDGETS = {
+    "scan_barcode": 5.0,
+    "check_ingredients": 6.0,
+    "scan_verdict": 6.0,
+    "scan_safe": 5.0,
+}
+
+# Below this, a downstream call isn't worth starting
+MIN_CALL_SECONDS = 0.05
+
+# (started, budget seconds) for the current request, or None
+_current: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+# True when the deadline was started before Flask saw the request (asgi.py)
+_started_outside: contextvars.ContextVar = contextvars.ContextVar("request_deadline_started_outside", default=False)
+
+
+class DeadlineExceeded(Exception):
+    """The request's budget is spent; the call was not attempted."""
+
+
+def _configured_budgets() -> dict:
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in os.getenv("REQUEST_BUDGETS", "").split(","):
+        name, _, seconds = item.partition("=")
+        try:
+            budgets[name.strip()] = float(seconds)
+        except ValueError:
+            continue
+    return budgets
+
+
+_budgets = _configured_budgets()
+
+
+def budget_for(endpoint: Optional[str]) -> Optional[float]:
+    """Budget in seconds for a Flask endpoint, or None if it has none."""
+    budget = _budgets.get(endpoint) if endpoint else None
+    if budget is None:
+        try:
+            budget = float(os.getenv("REQUEST_BUDGET_DEFAULT_SECONDS", "0"))
+        except ValueError:
+            budget = 0.0
+    return budget if budget and budget > 0 else None
+
+
+def start(budget: Optional[float], outside: bool = False):
+    """
+    Start (or, with None, clear) the current request's deadline. With
+    outside=True the request's Flask handling keeps it instead of starting its own.
+    """
+    _current.set((time.perf_counter(), budget) if budget else None)
+    _started_outside.set(outside)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None when there is no budget."""
+    current = _current.get()
+    if current is None:
+        return None
+    started, budget = current
+    return budget - (time.perf_counter() - started)
+
+
+def exhausted() -> bool:
+    left = remaining()
+    return left is not None and left < MIN_CALL_SECONDS
+
+
+def timeout_for(timeout: Optional[float]) -> Optional[float]:
+    """
+    A downstream call's timeout, capped by what is left of the budget.
+    Raises DeadlineExceeded when too little is left to start the call.
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left < MIN_CALL_SECONDS:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if timeout is None else min(timeout, left)
+
+
+def report() -> Optional[dict]:
+    """The current budget and how much of it is spent, or None when there is no budget."""
+    current = _current.get()
+    if current is None:
+        return None
+    started, budget = current
+    spent = time.perf_counter() - started
+    return {"budgetMs": int(budget * 1000), "spentMs": int(spent * 1000), "exhausted": budget - spent < MIN_CALL_SECONDS}
+
+
+def init_app(app):
+    """Start a deadline for each request and report the budget spent in the response headers."""
+
+    @app.before_request
+    def _start_deadline():
+        from flask import request
+        if not _started_outside.get():
+            start(budget_for(request.endpoint))
+
+    @app.after_request
+    def _report_deadline(response):
+        budget = report()
+        if budget is not None:
+            response.headers["X-Request-Budget-Ms"] = str(budget["budgetMs"])
+            if response.is_streamed:
+                # Nothing has been spent yet: the stream does the work after these headers
+                return response
+            response.headers["X-Request-Budget-Spent-Ms"] = str(budget["spentMs"])
+            if budget["exhausted"]:
+                response.headers["X-Request-Budget-Exhausted"] = "1"
+        return response
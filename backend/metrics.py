@@ -0,0 +1,297 @@
+# backend/metrics.py
+"""
+Per-stage request timing, Server-Timing headers and Prometheus metrics.
+
+Handlers wrap the parts of a request worth telling apart in named stages:
+
+    with metrics.stage("fetch"):
+        product_data, _ = fetch_product_from_api(barcode)
+
+Stages of the scan, check and meal plan pipelines:
+
+    fetch           product source chain (memory, local store, Open Food Facts)
+    similar         similar-barcode search for a product that wasn't found
+    parse           ingredient extraction, meal plan line parsing
+    classification  get_food_classification
+    allergens       check_allergens_from_product_data
+    ingredients     per-ingredient dataset lookups and restriction checks
+    generate        Gemini meal plan generation
+
+A stage that runs more than once in a request (once per profile, once per
+meal plan item) is summed.
+
+    SERVER_TIMING=1     add a Server-Timing header to responses: each stage's
+                        milliseconds, plus "total"
+    METRICS_ENABLED=1   keep request latency histograms per endpoint and per
+                        (endpoint, stage), and request counts, and serve them
+                        with the cache hit/miss counters at GET /metrics
+                        (Prometheus text format)
+
+Streamed responses (the SSE verdict stream) send their headers before any
+work is done, so they get no Server-Timing header; the stream reports
+report() in its last event instead, and the metrics are recorded when it
+closes.
+
+Both are off by default: stage() then hands out one shared no-op context
+manager, no request hooks are installed and /metrics doesn't exist. Metrics
+are kept per process; with several gunicorn workers each scrape sees the
+worker that answered it.
+"""
+import bisect
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def _flag(name: str) -> bool:
+    return os.getenv(name, "0").lower() in ("1", "true", "yes", "on")
+
+
+SERVER_TIMING = _flag("SERVER_TIMING")
+METRICS_ENABLED = _flag("METRICS_ENABLED")
+_enabled = SERVER_TIMING or METRICS_ENABLED
+
+# Upper bounds in seconds (plus +Inf)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NOOP = contextlib.nullcontext()
+
+
+class _Timing:
+    """Start time and (stage, ms) pairs of the current request."""
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def totals(self) -> Dict[str, float]:
+        """Milliseconds per stage, summed, in order of first use."""
+        totals: Dict[str, float] = {}
+        for name, ms in self.stages:
+            totals[name] = totals.get(name, 0.0) + ms
+        return totals
+
+
+_timing: contextvars.ContextVar = contextvars.ContextVar("request_timing", default=None)
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timing = _timing.get()
+        if timing is not None:
+            timing.stages.append((self.name, (time.perf_counter() - self.started) * 1000))
+        return False
+
+
+def stage(name: str):
+    """Context manager timing a named stage of the current request (a no-op when disabled)."""
+    if not _enabled:
+        return _NOOP
+    return _Stage(name)
+
+
+def begin():
+    """Start timing a request, if enabled. Called before Flask sees the request (asgi.py) or by the hooks below."""
+    if _enabled:
+        _timing.set(_Timing())
+
+
+# -------- Aggregates --------
+class Histogram:
+    """Latency histogram per label set, in seconds, with cumulative buckets as Prometheus expects."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        # label values -> bucket counts (non-cumulative, +Inf last), then the sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple[str, ...], seconds: float):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(BUCKETS) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            pairs = list(zip(self.labels, label_values))
+            labels = _labels(pairs)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: Tuple[str, ...], n: int = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + n
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = dict(self._values)
+        return _counter_lines(self.name, self.help, [(dict(zip(self.labels, k)), v) for k, v in sorted(snapshot.items())])
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _counter_lines(name: str, help_text: str, samples) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    lines += [f"{name}{_labels(labels.items())} {value}" for labels, value in samples]
+    return lines
+
+
+request_seconds = Histogram("http_request_duration_seconds", "Request latency by endpoint.", ("endpoint",))
+stage_seconds = Histogram("http_request_stage_duration_seconds", "Time spent in each request stage.", ("endpoint", "stage"))
+requests_total = Counter("http_requests_total", "Requests by endpoint, method and status.", ("endpoint", "method", "status"))
+
+# (metric label, module, attribute) of functools.lru_cache'd functions, reported once their module is loaded
+LRU_CACHES = (
+    ("allergen_profile_index", "dataset.allergen_vocabulary", "_profile_index"),
+    ("restriction_word_pattern", "dataset.ingredient_checker", "_word_pattern"),
+    ("profile_mask", "restriction_masks", "_profile_mask"),
+    ("ingredient_token_hash", "similarity_index", "_token_hash"),
+)
+
+
+def _cache_lines() -> List[str]:
+    """Hit/miss counters of the caches, read from their own stats at scrape time."""
+    lines = []
+    product_sources = sys.modules.get("product_sources")
+    if product_sources is not None:
+        samples = []
+        for tier in product_sources.source_stats()["tiers"]:
+            for key, outcome in (("hits", "hit"), ("misses", "miss"), ("stale", "stale"), ("errors", "error")):
+                samples.append(({"tier": tier["name"], "outcome": outcome}, tier[key]))
+        lines += _counter_lines("product_source_lookups_total", "Product lookups by source tier and outcome.", samples)
+
+    parser = sys.modules.get("dataset.ingredient_parser")
+    if parser is not None:
+        info = parser.parse_cache_info()
+        lines += _counter_lines("ingredient_parse_cache_total", "Ingredient parse memo lookups by outcome.",
+                                [({"outcome": "hit"}, info["hits"]), ({"outcome": "miss"}, info["misses"])])
+
+    samples = []
+    for label, module_name, attribute in LRU_CACHES:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        function = getattr(module, attribute, None)
+        if not hasattr(function, "cache_info"):
+            # A renamed or unwrapped function would otherwise just vanish from the metrics
+            raise AttributeError(f"LRU_CACHES: {module_name}.{attribute} is not an lru_cache'd function")
+        info = function.cache_info()
+        samples += [({"cache": label, "outcome": "hit"}, info.hits), ({"cache": label, "outcome": "miss"}, info.misses)]
+    if samples:
+        lines += _counter_lines("function_cache_total", "In-process function cache lookups by outcome.", samples)
+    return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = request_seconds.render() + stage_seconds.render() + requests_total.render() + _cache_lines()
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(totals: Dict[str, float], total_ms: float) -> str:
+    return ", ".join([f"{name};dur={ms:.1f}" for name, ms in totals.items()] + [f"total;dur={total_ms:.1f}"])
+
+
+def report() -> Optional[dict]:
+    """Milliseconds per stage so far and in total for the current request, or None when not timing."""
+    timing: Optional[_Timing] = _timing.get()
+    if timing is None:
+        return None
+    stages = {name: round(ms, 1) for name, ms in timing.totals().items()}
+    return {"stages": stages, "totalMs": round((time.perf_counter() - timing.started) * 1000, 1)}
+
+
+def _observe(timing: _Timing, endpoint: str, method: str, status: int):
+    request_seconds.observe((endpoint,), time.perf_counter() - timing.started)
+    for name, ms in timing.totals().items():
+        stage_seconds.observe((endpoint, name), ms / 1000)
+    requests_total.inc((endpoint, method, str(status)))
+
+
+def init_app(app):
+    """Time each request and serve /metrics, if enabled; otherwise install nothing."""
+    if not _enabled:
+        return
+
+    @app.before_request
+    def _begin_timing():
+        # The async front end may have started timing before the request reached Flask
+        if _timing.get() is None:
+            begin()
+
+    @app.after_request
+    def _record_timing(response):
+        from flask import request
+        timing: Optional[_Timing] = _timing.get()
+        if timing is None:
+            return response
+        endpoint, method, status = request.endpoint or "other", request.method, response.status_code
+        if response.is_streamed:
+            # The stream hasn't run yet; record it once it has been sent
+            if METRICS_ENABLED:
+                response.call_on_close(lambda: _observe(timing, endpoint, method, status))
+            return response
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(timing.totals(), (time.perf_counter() - timing.started) * 1000)
+        if METRICS_ENABLED:
+            _observe(timing, endpoint, method, status)
+        return response
+
+    @app.teardown_request
+    def _end_timing(exc=None):
+        # Threads serve many requests; don't leave this one's timing behind. A stream
+        # keeps timing in its own copy of the context (see app.view_context_stream).
+        _timing.set(None)
+
+    if METRICS_ENABLED:
+        @app.route("/metrics", methods=["GET"])
+        def metrics():
+            from flask import Response
+            return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,945 @@
+# backend/product_sources.py
+"""
+Tiered product lookup: in-memory cache -> local store -> remote endpoint.
+
+Each lookup walks the chain in order and stops at the first tier that has the
+product. A hit is written back into every faster tier, so the next lookup for
+the same barcode is served from memory. Each tier has its own timeout, and its
+hit/miss/error counts and latency are kept for /api/admin/sources.
+
+Cached products past their tier's TTL are stale, not gone: a stale copy is
+served immediately and refreshed from the remote in the background
+(stale-while-revalidate). The remote sits behind a circuit breaker; once its
+recent failure rate crosses the threshold, remote calls fail fast until a
+cool-down probe succeeds, and lookups are answered from stale copies. So
+during an upstream brownout, scan latency is bounded by the cache instead of
+by OFF_TIMEOUT_SECONDS.
+
+Configuration (environment):
+    PRODUCT_SOURCES               tier order, default "memory,store,remote"
+    PRODUCT_CACHE_SIZE            products kept in memory (1024)
+    PRODUCT_CACHE_TTL_SECONDS     memory cache freshness (3600)
+    PRODUCT_STORE_PATH            sqlite file, default backend/.product_store.sqlite3
+    PRODUCT_STORE_TTL_SECONDS     local store freshness, 0 = always fresh (604800)
+    PRODUCT_STORE_TIMEOUT_SECONDS sqlite lock wait (0.5)
+    PRODUCT_STALE_MAX_SECONDS     oldest copy served as stale, 0 = no limit (2592000)
+    OFF_BASE_URL                  Open Food Facts or mirror (https://world.openfoodfacts.org)
+    OFF_TIMEOUT_SECONDS           remote timeout (10)
+    OFF_FETCH_FIELDS              fields fetched and cached, comma-separated or "all"
+                                  (default PRODUCT_FIELDS)
+    OFF_BREAKER_FAILURE_RATE      failure rate that opens the breaker (0.5)
+    OFF_BREAKER_MIN_CALLS         calls in the window before it can open (5)
+    OFF_BREAKER_WINDOW            recent calls considered (20)
+    OFF_BREAKER_COOLDOWN_SECONDS  open time before a probe is let through (30)
+    OFF_MAX_CONNECTIONS           connections to the remote from the async client (200)
+
+Inside a request with a deadline budget (see deadlines.py), each tier's
+timeout is capped by what is left of the budget, and tiers are skipped once
+it is spent.
+
+Tiers return (product, stored_at) or None on a miss, and raise on failure
+(timeout, connection error, open breaker).
+"""
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Generator, List, NamedTuple, Optional, Sequence, Tuple
+
+import awaited
+import deadlines
+
+DEFAULT_SOURCES = "memory,store,remote"
+DEFAULT_OFF_BASE_URL = "https://world.openfoodfacts.org"
+USER_AGENT = "datathon-app/1.0 (ingredient checker)"
+
+# Product fields the backend and frontend use. Full Open Food Facts records
+# are 50-200 KB of nutriments, images and translations; these are a few KB.
+PRODUCT_FIELDS = (
+    "code", "product_name", "product_name_en", "abbreviated_product_name", "brands",
+    "categories_tags", "image_front_small_url", "image_small_url", "image_url", "image_front_url",
+    "ingredients_text", "ingredients_text_en", "ingredients",
+    "allergens", "allergens_tags", "allergens_from_ingredients",
+)
+# Keys kept on each (nested) entry of a projected "ingredients" array
+INGREDIENT_FIELDS = ("id", "text", "percent", "ingredients")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def fetch_fields() -> Optional[Tuple[str, ...]]:
+    """Fields requested from the remote and kept in the cache tiers; None means full records."""
+    configured = os.getenv("OFF_FETCH_FIELDS", "").strip()
+    if not configured:
+        return PRODUCT_FIELDS
+    if configured.lower() == "all":
+        return None
+    return tuple(f.strip() for f in configured.split(",") if f.strip())
+
+
+def _project_ingredients(ingredients):
+    if not isinstance(ingredients, list):
+        return ingredients
+    projected = []
+    for ingredient in ingredients:
+        if isinstance(ingredient, dict):
+            ingredient = {k: ingredient[k] for k in INGREDIENT_FIELDS if k in ingredient}
+            if "ingredients" in ingredient:
+                ingredient["ingredients"] = _project_ingredients(ingredient["ingredients"])
+        projected.append(ingredient)
+    return projected
+
+
+def project_product(product: Optional[dict], fields: Optional[Sequence[str]]) -> Optional[dict]:
+    """
+    Just the given top-level fields of a product (None = all of it).
+    A projected "ingredients" array keeps only INGREDIENT_FIELDS on each entry.
+    """
+    if product is None or fields is None:
+        return product
+    projected = {k: product[k] for k in fields if k in product}
+    if "ingredients" in projected:
+        projected["ingredients"] = _project_ingredients(projected["ingredients"])
+    return projected
+
+
+class TierStats:
+    """Lookup counts and latency for one tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.errors = 0
+        self.total_ms = self.max_ms = 0.0
+
+    def record(self, outcome: str, elapsed_ms: float):
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "miss":
+                self.misses += 1
+            elif outcome == "stale":
+                self.stale += 1
+            else:
+                self.errors += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def report(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale + self.errors
+            return {
+                "lookups": lookups,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "errors": self.errors,
+                "hitRate": round(self.hits / lookups, 4) if lookups else None,
+                "avgMs": round(self.total_ms / lookups, 3) if lookups else None,
+                "maxMs": round(self.max_ms, 3),
+            }
+
+
+class MemoryTier:
+    """LRU cache of products; entries older than the TTL are kept as stale copies."""
+    name = "memory"
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timeout = None
+        self._items: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, barcode: str, timeout: Optional[float] = None) -> Optional[Tuple[dict, float]]:
+        with self._lock:
+            item = self._items.get(barcode)
+            if item is None:
+                return None
+            self._items.move_to_end(barcode)
+            stored_at, product = item
+            return product, stored_at
+
+    def put(self, barcode: str, product: dict, stored_at: Optional[float] = None):
+        with self._lock:
+            self._items[barcode] = (stored_at or time.time(), product)
+            self._items.move_to_end(barcode)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._items)
+
+
+class StoreTier:
+    """Products persisted in a local sqlite file, shared by all workers."""
+    name = "store"
+
+    def __init__(self, path: str, ttl: float, timeout: float):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+        self._create_lock = threading.Lock()
+        self._created = False
+
+    def _connection(self, timeout: Optional[float]) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with self._create_lock:
+                if not self._created:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS products "
+                        "(barcode TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)"
+                    )
+                    conn.commit()
+                    self._created = True
+            self._local.conn = conn
+        # sqlite's busy timeout is the only wait a local read can hit
+        wait_ms = int(1000 * (timeout if timeout is not None else self.timeout))
+        conn.execute(f"PRAGMA busy_timeout={max(wait_ms, 0)}")
+        return conn
+
+    def get(self, barcode: str, timeout: Optional[float] = None) -> Optional[Tuple[dict, float]]:
+        row = self._connection(timeout).execute(
+            "SELECT data, fetched_at FROM products WHERE barcode = ?", (barcode,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, barcode: str, product: dict, stored_at: Optional[float] = None):
+        conn = self._connection(None)
+        conn.execute(
+            "INSERT OR REPLACE INTO products (barcode, data, fetched_at) VALUES (?, ?, ?)",
+            (barcode, json.dumps(product, separators=(",", ":")), stored_at or time.time()),
+        )
+        conn.commit()
+
+    def size(self) -> int:
+        return self._connection(None).execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def items(self):
+        """Every stored (barcode, product), for maintenance jobs."""
+        for barcode, data in self._connection(None).execute("SELECT barcode, data FROM products"):
+            yield barcode, json.loads(data)
+
+
+class CircuitOpenError(Exception):
+    """The remote's circuit breaker is open; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over the last `window` calls.
+
+    closed    calls go through; opens when at least `min_calls` of the window
+              are recorded and the failure rate reaches `failure_rate`
+    open      calls fail fast with CircuitOpenError for `cooldown` seconds
+    half-open one probe call is let through; success closes, failure reopens
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_rate: float, min_calls: int, window: int, cooldown: float):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self.rejected = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. In half-open, only one probe at a time."""
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Give back a call slot without counting an outcome (e.g. cut short by a request deadline)."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.opened_count += 1
+        print(f"Open Food Facts circuit opened; failing fast for {self.cooldown:.0f}s")
+
+    def retry_in(self) -> float:
+        """Seconds until a probe may be let through (0 when closed)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.time() - self.opened_at))
+
+    def report(self) -> dict:
+        with self._lock:
+            recent = len(self._outcomes)
+            return {
+                "state": self.state,
+                "recentCalls": recent,
+                "recentFailureRate": round(self._outcomes.count(False) / recent, 4) if recent else None,
+                "opened": self.opened_count,
+                "rejected": self.rejected,
+                "retryInSeconds": round(max(0.0, self.cooldown - (time.time() - self.opened_at)), 1)
+                if self.state == self.OPEN else 0.0,
+            }
+
+
+# Connections per httpx client in the async pool (see RemoteTier._async_client)
+ASYNC_CONNECTIONS_PER_CLIENT = 16
+
+
+class RemoteTier:
+    """Open Food Facts (or a mirror) over HTTP, with pooled connections and a circuit breaker."""
+    name = "remote"
+
+    def __init__(self, base_url: str, timeout: float, breaker: CircuitBreaker,
+                 fields: Optional[Sequence[str]] = PRODUCT_FIELDS):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.ttl = None
+        self.breaker = breaker
+        # Projection asked of the remote (and so stored in the faster tiers)
+        self.fields = tuple(fields) if fields is not None else None
+        self._local = threading.local()
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_turn = itertools.count()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests  # imported on first use to keep startup light
+            session = requests.Session()
+            session.headers["User-Agent"] = USER_AGENT
+            self._local.session = session
+        return session
+
+    def _async_client(self):
+        # httpx clients are bound to the event loop they were first used on. httpcore's
+        # pool checks every connection for every queued request, which is quadratic at
+        # hundreds in flight, so the connections are split over small clients taken in turn.
+        import asyncio
+        import httpx  # only the async front end (asgi.py) needs it
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.get(loop)
+        if clients is None:
+            import ssl
+            import certifi
+            connections = max(1, int(_env_float("OFF_MAX_CONNECTIONS", 200)))
+            shards = -(-connections // ASYNC_CONNECTIONS_PER_CLIENT)
+            per_client = -(-connections // shards)
+            # Loading the CA bundle takes tens of milliseconds; do it once for all of them
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            clients = [
+                httpx.AsyncClient(
+                    headers={"User-Agent": USER_AGENT},
+                    limits=httpx.Limits(max_connections=per_client, max_keepalive_connections=per_client),
+                    verify=ssl_context,
+                )
+                for _ in range(shards)
+            ]
+            self._async_clients[loop] = clients
+        return clients[next(self._async_turn) % len(clients)]
+
+    def _start_call(self, timeout: Optional[float]) -> Optional[float]:
+        effective = deadlines.timeout_for(timeout if timeout is not None else self.timeout)
+        if not self.breaker.allow():
+            raise CircuitOpenError("Open Food Facts is unavailable (circuit open)")
+        return effective
+
+    def _call_failed(self, error: Exception, effective: Optional[float]):
+        if effective is not None and effective < self.timeout and _is_timeout(error):
+            # Our budget ran out, not the upstream's patience: not its failure
+            self.breaker.release()
+        else:
+            self.breaker.record(False)
+
+    def _call_answered(self, status_code: int):
+        # A 4xx means the upstream is up and answering; only 5xx counts against it
+        self.breaker.record(status_code < 500)
+        if status_code != 200:
+            raise RemoteStatusError(status_code)
+
+    def request(self, path: str, params: Optional[dict] = None, timeout: Optional[float] = None):
+        """
+        GET a path on the remote. Returns the decoded JSON.
+        Raises CircuitOpenError without calling out while the breaker is open,
+        and on transport errors and non-200s.
+        """
+        effective = self._start_call(timeout)
+        try:
+            response = self._session().get(f"{self.base_url}{path}", params=params, timeout=effective)
+        except Exception as e:
+            self._call_failed(e, effective)
+            raise
+        self._call_answered(response.status_code)
+        return response.json()
+
+    async def request_async(self, path: str, params: Optional[dict] = None, timeout: Optional[float] = None):
+        """request() as a coroutine, on a pooled httpx client."""
+        effective = self._start_call(timeout)
+        try:
+            response = await self._async_client().get(f"{self.base_url}{path}", params=params, timeout=effective)
+        except Exception as e:
+            self._call_failed(e, effective)
+            raise
+        self._call_answered(response.status_code)
+        return response.json()
+
+    def _product_params(self, fields: Optional[Sequence[str]]) -> Optional[dict]:
+        return {"fields": ",".join(fields)} if fields is not None else None
+
+    @staticmethod
+    def _product_entry(data: dict, fields: Optional[Sequence[str]]) -> Optional[Tuple[dict, float]]:
+        # Open Food Facts API returns data in format: {"status": 1, "product": {...}}
+        if data.get("status") == 1 and "product" in data:
+            return project_product(data["product"], fields), time.time()
+        return None
+
+    def fetch(self, barcode: str, timeout: Optional[float], fields: Optional[Sequence[str]]) -> Optional[Tuple[dict, float]]:
+        """Fetch one product, asking the remote for just `fields` (None = full record)."""
+        data = self.request(f"/api/v0/product/{barcode}.json", params=self._product_params(fields), timeout=timeout)
+        return self._product_entry(data, fields)
+
+    async def fetch_async(self, barcode: str, timeout: Optional[float],
+                          fields: Optional[Sequence[str]]) -> Optional[Tuple[dict, float]]:
+        data = await self.request_async(f"/api/v0/product/{barcode}.json", params=self._product_params(fields),
+                                        timeout=timeout)
+        return self._product_entry(data, fields)
+
+    def get(self, barcode: str, timeout: Optional[float] = None) -> Optional[Tuple[dict, float]]:
+        return self.fetch(barcode, timeout, self.fields)
+
+    async def get_async(self, barcode: str, timeout: Optional[float] = None) -> Optional[Tuple[dict, float]]:
+        return await self.fetch_async(barcode, timeout, self.fields)
+
+    def put(self, barcode: str, product: dict, stored_at: Optional[float] = None):
+        pass
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class RemoteStatusError(Exception):
+    """The remote answered with a non-200 status."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"API returned status code {status_code}")
+        self.status_code = status_code
+
+
+def _memory_tier():
+    return MemoryTier(
+        max_size=int(_env_float("PRODUCT_CACHE_SIZE", 1024)),
+        ttl=_env_float("PRODUCT_CACHE_TTL_SECONDS", 3600),
+    )
+
+
+def _store_tier():
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".product_store.sqlite3")
+    return StoreTier(
+        path=os.getenv("PRODUCT_STORE_PATH", default_path),
+        ttl=_env_float("PRODUCT_STORE_TTL_SECONDS", 7 * 24 * 3600),
+        timeout=_env_float("PRODUCT_STORE_TIMEOUT_SECONDS", 0.5),
+    )
+
+
+def _remote_tier():
+    breaker = CircuitBreaker(
+        failure_rate=_env_float("OFF_BREAKER_FAILURE_RATE", 0.5),
+        min_calls=int(_env_float("OFF_BREAKER_MIN_CALLS", 5)),
+        window=int(_env_float("OFF_BREAKER_WINDOW", 20)),
+        cooldown=_env_float("OFF_BREAKER_COOLDOWN_SECONDS", 30),
+    )
+    return RemoteTier(
+        base_url=os.getenv("OFF_BASE_URL", DEFAULT_OFF_BASE_URL),
+        timeout=_env_float("OFF_TIMEOUT_SECONDS", 10),
+        breaker=breaker,
+        fields=fetch_fields(),
+    )
+
+
+# Tier name -> factory; PRODUCT_SOURCES picks and orders them
+SOURCE_TYPES: Dict[str, Callable] = {
+    "memory": _memory_tier,
+    "store": _store_tier,
+    "remote": _remote_tier,
+}
+
+_chain: Optional[List] = None
+_stats: Dict[str, TierStats] = {}
+_chain_lock = threading.Lock()
+# The remote for remote_request() when PRODUCT_SOURCES leaves it out of the chain
+_standalone_remote = None
+
+
+def get_chain() -> List:
+    """The configured tiers, fastest first, built on first use."""
+    global _chain
+    if _chain is None:
+        with _chain_lock:
+            if _chain is None:
+                names = [n.strip() for n in os.getenv("PRODUCT_SOURCES", DEFAULT_SOURCES).split(",") if n.strip()]
+                unknown = [n for n in names if n not in SOURCE_TYPES]
+                if unknown:
+                    raise ValueError(f"Unknown product sources: {', '.join(unknown)}")
+                tiers = [SOURCE_TYPES[n]() for n in names]
+                _stats.clear()
+                _stats.update({tier.name: TierStats() for tier in tiers})
+                _chain = tiers
+    return _chain
+
+
+def reset_chain():
+    """Drop the configured tiers (and their stats) so the next lookup rebuilds them from the environment."""
+    global _chain, _standalone_remote
+    with _chain_lock:
+        _chain = None
+        _standalone_remote = None
+        _stats.clear()
+    with _refresh_cond:
+        _refresh_pending.clear()
+        _refresh_stats.update(queued=0, refreshed=0, failed=0, dropped=0)
+
+
+def get_tier(name: str):
+    """A configured tier by name, or None."""
+    return next((tier for tier in get_chain() if tier.name == name), None)
+
+
+def _is_timeout(error: Exception) -> bool:
+    try:
+        import requests
+        if isinstance(error, requests.exceptions.Timeout):
+            return True
+    except ImportError:
+        pass
+    try:
+        import httpx
+        return isinstance(error, httpx.TimeoutException)
+    except ImportError:
+        return False
+
+
+def _is_connection_error(error: Exception) -> bool:
+    try:
+        import requests
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return True
+    except ImportError:
+        pass
+    try:
+        import httpx
+        return isinstance(error, httpx.TransportError)
+    except ImportError:
+        return False
+
+
+def _error_message(error: Exception) -> str:
+    if _is_timeout(error):
+        return "Connection timed out. Please try again."
+    if _is_connection_error(error):
+        return "Connection error. Please check your internet connection."
+    if isinstance(error, deadlines.DeadlineExceeded):
+        return "Request deadline exceeded"
+    if isinstance(error, CircuitOpenError):
+        return "Open Food Facts is temporarily unavailable. Please try again shortly."
+    if isinstance(error, RemoteStatusError):
+        return str(error)
+    return f"Error: {error}"
+
+
+class ProductLookup(NamedTuple):
+    product: Optional[dict]
+    error: Optional[str]
+    # Tier that answered, or None
+    source: Optional[str] = None
+    # True when the copy is past its tier's TTL (a refresh has been queued)
+    stale: bool = False
+    age_seconds: Optional[float] = None
+    # When this copy was fetched from the remote
+    stored_at: Optional[float] = None
+
+
+def _write_back(tiers: List, barcode: str, product: dict, stored_at: float):
+    for tier in tiers:
+        try:
+            tier.put(barcode, product, stored_at)
+        except Exception as e:
+            print(f"Error writing product {barcode} to {tier.name}: {e}")
+    for listener in _cache_listeners:
+        try:
+            listener(barcode, product)
+        except Exception as e:
+            print(f"Error notifying cache listener for {barcode}: {e}")
+
+
+# Called with (barcode, product) whenever a product is written into the cache tiers
+_cache_listeners: List[Callable[[str, dict], None]] = []
+
+
+def add_cache_listener(listener: Callable[[str, dict], None]):
+    """Call listener(barcode, product) for every product written into the cache tiers. It runs on the lookup path, so keep it cheap."""
+    if listener not in _cache_listeners:
+        _cache_listeners.append(listener)
+
+
+def cache_products(products: Sequence[dict]) -> int:
+    """
+    Write products from a remote response (e.g. a search) into the cache
+    tiers, skipping ones already cached. Returns how many were new.
+    """
+    from barcodes import canonical_barcode
+    tiers = [tier for tier in get_chain() if not isinstance(tier, RemoteTier)]
+    fields = fetch_fields()
+    added = 0
+    for product in products:
+        barcode = canonical_barcode(str(product.get("code") or ""))
+        if not barcode or local_product(barcode) is not None:
+            continue
+        _write_back(tiers, barcode, project_product(product, fields), time.time())
+        added += 1
+    return added
+
+
+def local_product(barcode: str) -> Optional[dict]:
+    """A cached copy of a product (fresh or stale) from the memory or store tier, without any remote call."""
+    for tier in get_chain():
+        if isinstance(tier, RemoteTier):
+            continue
+        try:
+            entry = tier.get(barcode, None)
+        except Exception as e:
+            print(f"Error reading product {barcode} from {tier.name}: {e}")
+            continue
+        if entry is not None:
+            return entry[0]
+    return None
+
+
+def drive(steps: Generator, call: Callable):
+    """
+    Run a sans-IO generator: every call it yields is made with call(), and the
+    result (or the exception raised) is sent back in. Returns its return value.
+    """
+    try:
+        request = next(steps)
+        while True:
+            try:
+                result = call(request)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+async def drive_async(steps: Generator, call: Callable):
+    """drive() for a coroutine call()."""
+    try:
+        request = next(steps)
+        while True:
+            try:
+                result = await call(request)
+            except Exception as e:
+                request = steps.throw(e)
+            else:
+                request = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+# Lookup steps yield (tier, method name, args)
+def _call_tier(step):
+    tier, method, args = step
+    return getattr(tier, method)(*args)
+
+
+async def _call_tier_async(step):
+    # Only the remote awaits; the memory and store tiers answer in well under a millisecond
+    tier, method, args = step
+    method_async = getattr(tier, f"{method}_async", None)
+    if method_async is not None:
+        return await method_async(*args)
+    return getattr(tier, method)(*args)
+
+
+def _fetch_uncached(barcode: str, fields: Optional[Sequence[str]]) -> Generator:
+    """Fetch fields the cache tiers don't hold straight from the remote; nothing is written back."""
+    remote = get_tier("remote")
+    if remote is None:
+        return ProductLookup(None, "Product not found in Open Food Facts database")
+    if fields is not None:
+        fields = tuple(dict.fromkeys(tuple(PRODUCT_FIELDS) + tuple(fields)))
+    started = time.perf_counter()
+    try:
+        entry = yield remote, "fetch", (barcode, deadlines.timeout_for(remote.timeout), fields)
+    except deadlines.DeadlineExceeded as e:
+        return ProductLookup(None, str(e))
+    except Exception as e:
+        _stats[remote.name].record("error", (time.perf_counter() - started) * 1000)
+        return ProductLookup(None, _error_message(e))
+    _stats[remote.name].record("hit" if entry else "miss", (time.perf_counter() - started) * 1000)
+    if entry is None:
+        return ProductLookup(None, "Product not found in Open Food Facts database")
+    return ProductLookup(entry[0], None, remote.name, False, 0.0, entry[1])
+
+
+def _lookup_steps(barcode: str, fields: Optional[Sequence[str]]) -> Generator:
+    """lookup_product() as a sans-IO generator: yields each tier call, see drive()."""
+    tiers = get_chain()
+    cached_fields = next((t.fields for t in tiers if isinstance(t, RemoteTier)), fetch_fields())
+    if cached_fields is not None and (fields is None or not set(fields) <= set(cached_fields)):
+        return (yield from _fetch_uncached(barcode, fields))
+
+    error_msg = None
+    stale = None  # (product, stored_at, tier index)
+    stale_max = _env_float("PRODUCT_STALE_MAX_SECONDS", 30 * 24 * 3600)
+    for depth, tier in enumerate(tiers):
+        if stale is not None and isinstance(tier, RemoteTier):
+            # Serve the stale copy now rather than waiting on the network
+            break
+        started = time.perf_counter()
+        try:
+            timeout = deadlines.timeout_for(tier.timeout) if tier.timeout is not None else None
+            entry = yield tier, "get", (barcode, timeout)
+        except deadlines.DeadlineExceeded as e:
+            error_msg = str(e)
+            break
+        except Exception as e:
+            _stats[tier.name].record("error", (time.perf_counter() - started) * 1000)
+            if not isinstance(e, CircuitOpenError):
+                print(f"Error reading product {barcode} from {tier.name}: {e or type(e).__name__}")
+            error_msg = _error_message(e)
+            continue
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if entry is None:
+            _stats[tier.name].record("miss", elapsed_ms)
+            continue
+        product, stored_at = entry
+        age = time.time() - stored_at
+        if tier.ttl and age > tier.ttl:
+            if stale_max and age > stale_max:
+                _stats[tier.name].record("miss", elapsed_ms)
+                continue
+            _stats[tier.name].record("stale", elapsed_ms)
+            if stale is None or stored_at > stale[1]:
+                stale = (product, stored_at, depth)
+            continue
+
+        _stats[tier.name].record("hit", elapsed_ms)
+        # Write back into every faster tier
+        _write_back(tiers[:depth], barcode, product, stored_at)
+        return ProductLookup(product, None, tier.name, False, age, stored_at)
+
+    if stale is not None:
+        product, stored_at, depth = stale
+        _write_back(tiers[:depth], barcode, product, stored_at)
+        schedule_refresh(barcode)
+        return ProductLookup(product, None, tiers[depth].name, True, time.time() - stored_at, stored_at)
+
+    return ProductLookup(None, error_msg or "Product not found in Open Food Facts database")
+
+
+def lookup_product(barcode: str, fields: Optional[Sequence[str]] = PRODUCT_FIELDS) -> ProductLookup:
+    """
+    Look a product up through the tier chain.
+
+    Fresh copies are returned from the first tier that has one. If the cache
+    tiers only have a stale copy, it is returned without calling the remote
+    and a background refresh is queued. The remote is only called when no
+    usable copy is cached.
+
+    Args:
+        barcode: Canonical barcode (see barcodes.normalize_barcode).
+        fields: Product fields the caller needs (None = the full record). Fields
+                outside what the cache tiers hold (OFF_FETCH_FIELDS) are
+                fetched from the remote directly, with the same projection.
+
+    Returns:
+        ProductLookup: The product (or None with an error message), where it came
+                       from, and whether it is stale.
+    """
+    # The async front end may already have awaited this lookup for the request
+    lookup = awaited.result(("lookup", barcode, _fields_key(fields)))
+    if lookup is not None:
+        return lookup
+    return drive(_lookup_steps(barcode, fields), _call_tier)
+
+
+async def lookup_product_async(barcode: str, fields: Optional[Sequence[str]] = PRODUCT_FIELDS) -> ProductLookup:
+    """lookup_product() as a coroutine: the remote is called on the async client."""
+    return await drive_async(_lookup_steps(barcode, fields), _call_tier_async)
+
+
+def _fields_key(fields: Optional[Sequence[str]]) -> Optional[Tuple[str, ...]]:
+    return tuple(fields) if fields is not None else None
+
+
+def provide_lookup(barcode: str, fields: Optional[Sequence[str]], lookup: ProductLookup):
+    """Have lookup_product(barcode, fields) return this lookup for the rest of the current request."""
+    awaited.provide(("lookup", barcode, _fields_key(fields)), lookup)
+
+
+def cache_ttl() -> Optional[float]:
+    """Freshness lifetime of the fastest caching tier, in seconds (None if nothing caches)."""
+    return next((tier.ttl for tier in get_chain() if tier.ttl), None)
+
+
+def get_product(barcode: str) -> Tuple[Optional[dict], Optional[str]]:
+    """lookup_product() as (product_data, error_message); stale copies count as found."""
+    lookup = lookup_product(barcode)
+    return lookup.product, lookup.error
+
+
+# -------- Background refresh of stale products --------
+REFRESH_QUEUE_SIZE = int(_env_float("PRODUCT_REFRESH_QUEUE_SIZE", 1024))
+
+_refresh_pending: "OrderedDict[str, None]" = OrderedDict()
+_refresh_cond = threading.Condition()
+_refresh_thread: Optional[threading.Thread] = None
+_refresh_stats = {"queued": 0, "refreshed": 0, "failed": 0, "dropped": 0}
+
+
+def schedule_refresh(barcode: str):
+    """Queue a background refetch of a product from the remote (deduplicated, bounded)."""
+    global _refresh_thread
+    with _refresh_cond:
+        if barcode in _refresh_pending:
+            return
+        if len(_refresh_pending) >= REFRESH_QUEUE_SIZE:
+            _refresh_stats["dropped"] += 1
+            return
+        _refresh_pending[barcode] = None
+        _refresh_stats["queued"] += 1
+        if _refresh_thread is None or not _refresh_thread.is_alive():
+            _refresh_thread = threading.Thread(target=_refresh_worker, name="product-refresh", daemon=True)
+            _refresh_thread.start()
+        _refresh_cond.notify()
+
+
+def _refresh_worker():
+    while True:
+        with _refresh_cond:
+            while not _refresh_pending:
+                _refresh_cond.wait()
+            barcode = next(iter(_refresh_pending))
+
+        tiers = get_chain()
+        remote = next((tier for tier in tiers if isinstance(tier, RemoteTier)), None)
+        if remote is None:
+            with _refresh_cond:
+                _refresh_pending.clear()
+            continue
+
+        # While the breaker is open, wait for the cool-down; the refresh is then the probe
+        wait = remote.breaker.retry_in()
+        if wait:
+            time.sleep(min(wait, 5.0))
+            continue
+        try:
+            entry = remote.get(barcode, remote.timeout)
+        except CircuitOpenError:
+            # Another caller holds the half-open probe
+            time.sleep(0.1)
+            continue
+        except Exception as e:
+            print(f"Error refreshing product {barcode}: {e}")
+            entry = None
+            with _refresh_cond:
+                _refresh_stats["failed"] += 1
+        else:
+            if entry is not None:
+                _write_back([t for t in tiers if t is not remote], barcode, *entry)
+            with _refresh_cond:
+                _refresh_stats["refreshed"] += 1
+
+        with _refresh_cond:
+            _refresh_pending.pop(barcode, None)
+
+
+def _request_remote() -> "RemoteTier":
+    # The chain's remote, or one built once (with its own breaker) if the chain has none
+    global _standalone_remote
+    remote = get_tier("remote")
+    if remote is not None:
+        return remote
+    remote = _standalone_remote
+    if remote is None:
+        with _chain_lock:
+            if _standalone_remote is None:
+                _standalone_remote = _remote_tier()
+            remote = _standalone_remote
+    return remote
+
+
+def remote_request(path: str, params: Optional[dict] = None, timeout: Optional[float] = None):
+    """GET a path on the configured remote (e.g. the search API). Raises on failure."""
+    return _request_remote().request(path, params=params, timeout=timeout)
+
+
+async def remote_request_async(path: str, params: Optional[dict] = None, timeout: Optional[float] = None):
+    """remote_request() as a coroutine."""
+    return await _request_remote().request_async(path, params=params, timeout=timeout)
+
+
+def source_stats() -> dict:
+    """Per-tier hit rate, latency and size, in chain order."""
+    tiers = get_chain()
+    report = []
+    for tier in tiers:
+        try:
+            size = tier.size()
+        except Exception:
+            size = None
+        entry = {"name": tier.name, "timeout": tier.timeout, "ttl": tier.ttl, "size": size, **_stats[tier.name].report()}
+        if isinstance(tier, RemoteTier):
+            entry["breaker"] = tier.breaker.report()
+        report.append(entry)
+    with _refresh_cond:
+        refresh = {"pending": len(_refresh_pending), **_refresh_stats}
+    return {"tiers": report, "refresh": refresh}
@@ -0,0 +1,333 @@
+# backend/restriction_masks.py
+"""
+Per-product restriction bitmasks.
+
+Each product gets a fixed-width mask of what it triggers: one bit per major
+allergen (the 14 tags in dataset.allergen_vocabulary) and one per diet
+(vegan, vegetarian, halal, kosher, gluten-free). A bit is set when the full
+check (app.evaluate_product, i.e. check_ingredient_against_restrictions)
+flags the product for a profile holding just that allergen's names or just
+that diet. A profile is a mask over the same bits, so "is this safe for me"
+is `product_mask & profile_mask == 0`.
+
+Masks are conservative: a bit covers every synonym of its allergen, so a
+product can come out unsafe for a profile the full check would pass, never
+the other way round. Profiles naming something outside the bits (e.g. "kiwi",
+"shellfish", "low sodium") aren't exact; callers run the full check for them.
+
+Masks are stored next to the product store (PRODUCT_STORE_PATH) and keyed by
+a hash of the product and a version of the datasets the check reads, so a
+new dataset snapshot or a refreshed product recomputes them on next use.
+Products written into the cache tiers get theirs on a background thread
+(compute_in_background), so lookups never wait for one.
+
+    RESTRICTION_MASK_CACHE_SIZE   masks kept in memory (4096)
+    RESTRICTION_MASK_QUEUE_SIZE   products waiting for a background mask;
+                                  more are dropped (1000)
+"""
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dataset.allergen_vocabulary import CANONICAL_ALLERGENS, tag_to_name
+
+# Bump when the bit layout or the way bits are derived changes
+LAYOUT_VERSION = 1
+
+ALLERGEN_TAGS = tuple(CANONICAL_ALLERGENS)
+DIETS = ("vegan", "vegetarian", "halal", "kosher", "gluten-free")
+BITS = ALLERGEN_TAGS + DIETS
+ALL_BITS = (1 << len(BITS)) - 1
+
+# Datasets the check reads; their snapshot hashes version the masks
+MASK_DATASETS = ("allergens", "food_classification")
+
+
+def _allergen_terms(tag: str) -> Tuple[str, ...]:
+    entry = CANONICAL_ALLERGENS[tag]
+    return tuple(dict.fromkeys([s.lower().strip() for s in entry["synonyms"]] + [tag_to_name(tag)]))
+
+
+# Allergy name as a profile spells it (lower-cased) -> its bit
+_TERM_BITS: Dict[str, int] = {
+    term: 1 << bit for bit, tag in enumerate(ALLERGEN_TAGS) for term in _allergen_terms(tag)
+}
+_DIET_BITS: Dict[str, int] = {diet: 1 << (len(ALLERGEN_TAGS) + i) for i, diet in enumerate(DIETS)}
+
+
+def bit_profiles() -> List[Tuple[int, dict]]:
+    """(bit, single-item profile) for every bit: one allergen's names, or one diet."""
+    profiles = [(1 << bit, {"allergies": list(_allergen_terms(tag)), "restrictions": []})
+                for bit, tag in enumerate(ALLERGEN_TAGS)]
+    profiles += [(bit, {"allergies": [], "restrictions": [diet]}) for diet, bit in _DIET_BITS.items()]
+    return profiles
+
+
+def bit_names(mask: int) -> List[str]:
+    """Names of the set bits ("milk", "vegan", ...)."""
+    return [tag_to_name(name) if name.startswith("en:") else name
+            for bit, name in enumerate(BITS) if mask & (1 << bit)]
+
+
+def compute_mask(is_flagged: Callable[[dict], bool]) -> int:
+    """
+    A product's mask. is_flagged(profile) runs the full check of the
+    (already analyzed) product against a profile.
+    """
+    mask = 0
+    for bit, profile in bit_profiles():
+        if is_flagged(profile):
+            mask |= bit
+    return mask
+
+
+def profile_mask(profile: dict) -> Tuple[int, bool]:
+    """
+    A profile's mask, and whether it's exact: False when the profile names an
+    allergy or restriction that has no bit, so the mask alone can't clear a product.
+    """
+    return _profile_mask(tuple(profile.get("allergies") or ()), tuple(profile.get("restrictions") or ()))
+
+
+@lru_cache(maxsize=256)
+def _profile_mask(allergies: Tuple[str, ...], restrictions: Tuple[str, ...]) -> Tuple[int, bool]:
+    mask, exact = 0, True
+    for allergy in allergies:
+        name = str(allergy).lower().strip()
+        if not name:
+            continue
+        if name in _TERM_BITS:
+            mask |= _TERM_BITS[name]
+        else:
+            exact = False
+    for restriction in restrictions:
+        name = str(restriction).lower().strip()
+        if not name:
+            continue
+        if name in _DIET_BITS:
+            mask |= _DIET_BITS[name]
+        else:
+            exact = False
+    return mask, exact
+
+
+# (registry generation, version) of the last datasets_version() call
+_version_cache: Tuple[int, str] = (-1, "")
+
+
+def datasets_version() -> str:
+    """
+    Version of the datasets the masks were derived from (snapshot hashes, or
+    load time without snapshots). Recomputed only when the registry's state
+    has changed since the last call.
+    """
+    global _version_cache
+    from dataset.registry import dataset_status, generation
+    current = generation()
+    cached_generation, version = _version_cache
+    if cached_generation == current:
+        return version
+    status = dataset_status()
+    parts = [f"layout={LAYOUT_VERSION}"]
+    for name in MASK_DATASETS:
+        entry = status[name]
+        parts.append(f"{name}={entry['state']}:{entry['snapshot'] or entry['finishedAt']}")
+    version = hashlib.blake2b("|".join(parts).encode(), digest_size=8).hexdigest()
+    _version_cache = (current, version)
+    return version
+
+
+def datasets_ready() -> bool:
+    """True once the datasets the masks derive from are loaded; before that there is no current version."""
+    from dataset.registry import is_ready
+    return all(is_ready(name) for name in MASK_DATASETS)
+
+
+def wait_for_datasets():
+    """Load the datasets the masks derive from, or wait for a load in progress."""
+    from dataset.registry import get_dataset
+    for name in MASK_DATASETS:
+        get_dataset(name)
+
+
+def product_hash(product: dict) -> str:
+    return hashlib.blake2b(json.dumps(product, sort_keys=True, separators=(",", ":")).encode(),
+                           digest_size=8).hexdigest()
+
+
+class MaskStore:
+    """Masks in a sqlite table, with an LRU of recent ones in memory."""
+
+    def __init__(self, path: str, cache_size: int):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[int, str, str]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS restriction_masks "
+                "(barcode TEXT PRIMARY KEY, mask INTEGER NOT NULL, version TEXT NOT NULL, product_hash TEXT NOT NULL)"
+            )
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get(self, barcode: str) -> Optional[Tuple[int, str, str]]:
+        """(mask, datasets version, product hash), or None."""
+        with self._cache_lock:
+            row = self._cache.get(barcode)
+            if row is not None:
+                self._cache.move_to_end(barcode)
+                return row
+        row = self._connection().execute(
+            "SELECT mask, version, product_hash FROM restriction_masks WHERE barcode = ?", (barcode,)
+        ).fetchone()
+        if row is not None:
+            self._remember(barcode, tuple(row))
+        return tuple(row) if row else None
+
+    def put(self, barcode: str, mask: int, version: str, product_digest: str):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO restriction_masks (barcode, mask, version, product_hash) VALUES (?, ?, ?, ?)",
+            (barcode, mask, version, product_digest),
+        )
+        conn.commit()
+        self._remember(barcode, (mask, version, product_digest))
+
+    def _remember(self, barcode: str, row: Tuple[int, str, str]):
+        with self._cache_lock:
+            self._cache[barcode] = row
+            self._cache.move_to_end(barcode)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count(self, version: Optional[str] = None) -> int:
+        if version is None:
+            return self._connection().execute("SELECT COUNT(*) FROM restriction_masks").fetchone()[0]
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM restriction_masks WHERE version = ?", (version,)
+        ).fetchone()[0]
+
+
+_store: Optional[MaskStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> MaskStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".product_store.sqlite3")
+            _store = MaskStore(
+                path=os.getenv("PRODUCT_STORE_PATH", default_path),
+                cache_size=int(os.getenv("RESTRICTION_MASK_CACHE_SIZE", "4096")),
+            )
+        return _store
+
+
+def reset_store():
+    """Forget the store (e.g. after PRODUCT_STORE_PATH changes)."""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def product_mask(barcode: str, product: dict, compute: Optional[Callable[[], int]]) -> Tuple[Optional[int], bool]:
+    """
+    The stored mask for a product, or compute() it (and store it) when there
+    is none for this product content and dataset version.
+
+    Returns:
+        tuple: (mask, whether it was computed now); the mask is None when
+        none is stored and there is no compute
+    """
+    store = get_store()
+    digest = product_hash(product)
+    row = store.get(barcode)
+    if row is not None and row[1] == datasets_version() and row[2] == digest:
+        return row[0], False
+    if compute is None:
+        return None, False
+    mask = compute()
+    # Computing loads the datasets if they weren't yet, so read the version afterwards
+    store.put(barcode, mask, datasets_version(), digest)
+    return mask, True
+
+
+# -------- Computing masks off the request path --------
+_compute_for: Optional[Callable[[str, dict], object]] = None
+_queue: Optional[queue.Queue] = None
+_worker_pid = None
+_queue_lock = threading.Lock()
+_stats = {"queued": 0, "dropped": 0, "computed": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def compute_in_background(compute_for: Callable[[str, dict], object]):
+    """
+    Give every product written into the cache tiers a mask on a background
+    thread, with compute_for(barcode, product) (app.product_restriction_mask).
+    """
+    global _compute_for
+    import product_sources
+    _compute_for = compute_for
+    product_sources.add_cache_listener(queue_product)
+
+
+def queue_product(barcode: str, product: dict):
+    """Queue a product for a background mask; dropped when the queue is full. Cheap enough for the lookup path."""
+    global _queue, _worker_pid
+    if _compute_for is None:
+        return
+    with _queue_lock:
+        # One worker per process (gunicorn forks after the app is imported)
+        if _worker_pid != os.getpid():
+            _worker_pid = os.getpid()
+            _queue = queue.Queue(maxsize=int(os.getenv("RESTRICTION_MASK_QUEUE_SIZE", "1000")))
+            threading.Thread(target=_mask_loop, args=(_queue,), name="restriction-masks", daemon=True).start()
+        jobs = _queue
+    try:
+        jobs.put_nowait((barcode, product))
+        _count("queued")
+    except queue.Full:
+        _count("dropped")
+
+
+def _mask_loop(jobs: queue.Queue):
+    while True:
+        barcode, product = jobs.get()
+        try:
+            _, fresh = _compute_for(barcode, product)
+            _count("computed", fresh)
+        except Exception as e:
+            print(f"Error computing restriction mask for {barcode}: {e}")
+            _count("errors")
+
+
+def background_stats() -> dict:
+    """Background mask counters, plus how many products are waiting."""
+    with _stats_lock:
+        report = dict(_stats)
+    report["pending"] = _queue.qsize() if _queue is not None else 0
+    return report
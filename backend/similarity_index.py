@@ -0,0 +1,237 @@
+# backend/similarity_index.py
+"""
+MinHash / LSH index over the ingredient sets of locally known products.
+
+Each product's ingredients (Open Food Facts ingredient ids when present,
+parsed ingredients text otherwise) become a set of normalized names, and the
+set a MinHash signature of NUM_HASHES 64-bit values. Signatures are cut into
+BANDS bands; products sharing any band land in the same bucket, so a query
+only ranks the products it shares a bucket with (by exact Jaccard similarity
+of the ingredient sets) instead of the whole catalog.
+
+The index is built in the background from the local product store on first
+use, and then kept current incrementally: every product written into the
+cache tiers (product_sources.add_cache_listener) has its ingredient set
+queued, and the queue is folded in before the next query. The queue keeps
+at most SIMILARITY_PENDING_MAX (10000) products, dropping the oldest; a
+product dropped there is still picked up by the next full rebuild, which
+runs once the index is older than SIMILARITY_INDEX_TTL_SECONDS (3600).
+
+The index is shared: it is only read or changed under _lock. A query copies
+its candidates' token sets under the lock and ranks them after releasing it.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+NUM_HASHES = 64
+BANDS = 16  # 4 rows per band: pairs at Jaccard ~0.5 share a band ~65% of the time, at 0.8 ~100%
+ROWS = NUM_HASHES // BANDS
+
+# One random 64-bit seed per hash function (fixed, so signatures are stable across processes)
+_SEEDS = np.frombuffer(hashlib.blake2b(b"similarity-index-seeds", digest_size=64).digest() * (NUM_HASHES // 8),
+                       dtype=np.uint64).copy()
+_SEEDS ^= np.arange(NUM_HASHES, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+
+
+@lru_cache(maxsize=65536)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def signature(tokens: FrozenSet[str]) -> np.ndarray:
+    """MinHash signature of a non-empty token set."""
+    hashes = np.fromiter((_token_hash(t) for t in tokens), dtype=np.uint64, count=len(tokens))
+    return _mix(hashes[:, None] ^ _SEEDS[None, :]).min(axis=0)
+
+
+def ingredient_tokens(product: dict) -> FrozenSet[str]:
+    """A product's ingredient set: normalized names from ingredient ids, else from the ingredients text."""
+    from dataset.allergen_vocabulary import tag_to_name
+    tokens = set()
+    pending = list(product.get("ingredients") or [])
+    for ingredient in pending:
+        if not isinstance(ingredient, dict):
+            continue
+        ingredient_id = ingredient.get("id")
+        if isinstance(ingredient_id, str) and ingredient_id.strip():
+            tokens.add(tag_to_name(ingredient_id))
+        pending.extend(ingredient.get("ingredients") or [])
+    if not tokens:
+        from dataset.ingredient_parser import ingredient_names
+        text = product.get("ingredients_text") or product.get("ingredients_text_en") or ""
+        tokens = {" ".join(name.lower().replace("-", " ").split()) for name in ingredient_names(text)}
+    tokens.discard("")
+    return frozenset(tokens)
+
+
+class SimilarityIndex:
+    """Token sets, signatures and LSH buckets by barcode."""
+
+    def __init__(self):
+        self.tokens: Dict[str, FrozenSet[str]] = {}
+        self.info: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._keys: Dict[str, List[bytes]] = {}
+        self._buckets: List[Dict[bytes, set]] = [defaultdict(set) for _ in range(BANDS)]
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def add(self, barcode: str, product: dict):
+        """Add or update a product (no-op when its ingredient set is unchanged)."""
+        self.add_tokens(barcode, ingredient_tokens(product), product_info(product))
+
+    def add_tokens(self, barcode: str, tokens: FrozenSet[str], info: Tuple[str, Optional[str]]):
+        """add() with the ingredient set and (name, image url) already worked out."""
+        self.info[barcode] = info
+        if self.tokens.get(barcode) == tokens:
+            return
+        self.remove(barcode)
+        if not tokens:
+            return
+        sig = signature(tokens)
+        keys = [sig[b * ROWS:(b + 1) * ROWS].tobytes() for b in range(BANDS)]
+        for band, key in enumerate(keys):
+            self._buckets[band][key].add(barcode)
+        self.tokens[barcode] = tokens
+        self._keys[barcode] = keys
+
+    def remove(self, barcode: str):
+        keys = self._keys.pop(barcode, None)
+        self.tokens.pop(barcode, None)
+        if keys is None:
+            return
+        for band, key in enumerate(keys):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(barcode)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def candidates(self, sig: np.ndarray, exclude: Optional[str] = None) -> Dict[str, Tuple]:
+        """barcode -> (token set, name, image url) of the products sharing an LSH bucket with a signature."""
+        barcodes = set()
+        for band in range(BANDS):
+            barcodes |= self._buckets[band].get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), frozenset())
+        barcodes.discard(exclude)
+        return {barcode: (self.tokens[barcode],) + self.info[barcode] for barcode in barcodes}
+
+
+def product_info(product: dict) -> Tuple[str, Optional[str]]:
+    """(name, image url) shown for a product."""
+    return (
+        product.get("product_name") or product.get("product_name_en") or "Unknown Product",
+        product.get("image_front_small_url") or product.get("image_small_url") or product.get("image_url"),
+    )
+
+
+def rank(tokens: FrozenSet[str], candidates: Dict[str, Tuple]) -> List[Tuple[str, float, str, Optional[str]]]:
+    """(barcode, Jaccard similarity, name, image url) of candidates(), most similar first."""
+    scored = [(barcode, len(tokens & other) / len(tokens | other), name, image_url)
+              for barcode, (other, name, image_url) in candidates.items()]
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return scored
+
+
+_index: Optional[SimilarityIndex] = None
+_lock = threading.Lock()
+# barcode -> (token set, info) of products cached since the last query, oldest first (latest copy wins)
+_pending: "OrderedDict[str, Tuple[FrozenSet[str], Tuple[str, Optional[str]]]]" = OrderedDict()
+_building = False
+
+
+def _ttl() -> float:
+    return float(os.getenv("SIMILARITY_INDEX_TTL_SECONDS", "3600"))
+
+
+def _build():
+    global _index, _building
+    import product_sources
+    started = time.perf_counter()
+    index = SimilarityIndex()
+    try:
+        store = product_sources.get_tier("store")
+        if store is not None:
+            for barcode, product in store.items():
+                index.add(barcode, product)
+        with _lock:
+            # Products cached while building were queued; they are newer than the store scan
+            _fold_pending(index)
+            _index = index
+        print(f"Similarity index built: {len(index)} products in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"Error building similarity index: {e}")
+    finally:
+        _building = False
+
+
+def _fold_pending(index: SimilarityIndex):
+    # Caller holds _lock
+    for barcode, (tokens, info) in _pending.items():
+        index.add_tokens(barcode, tokens, info)
+    _pending.clear()
+
+
+def _on_cached(barcode: str, product: dict):
+    # Work the ingredient set out here, so the queue holds no whole products
+    entry = (ingredient_tokens(product), product_info(product))
+    limit = int(os.getenv("SIMILARITY_PENDING_MAX", "10000"))
+    with _lock:
+        _pending.pop(barcode, None)
+        _pending[barcode] = entry
+        while len(_pending) > limit:
+            _pending.popitem(last=False)
+
+
+def start():
+    """Start building the index in the background and listen for newly cached products."""
+    global _building
+    import product_sources
+    product_sources.add_cache_listener(_on_cached)
+    with _lock:
+        if _building:
+            return
+        _building = True
+    threading.Thread(target=_build, daemon=True).start()
+
+
+def get_index() -> Optional[SimilarityIndex]:
+    """The index with queued products folded in, or None while the first build runs."""
+    if _index is None or time.time() - _index.built_at > _ttl():
+        start()
+    with _lock:
+        index = _index
+        if index is not None:
+            _fold_pending(index)
+    return index
+
+
+def similar_products(product: dict, exclude: Optional[str] = None) -> Optional[List[Tuple[str, float, str, Optional[str]]]]:
+    """
+    (barcode, similarity, name, image url) of indexed products similar to
+    this one, most similar first; None while the index isn't built yet.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    tokens = ingredient_tokens(product)
+    if not tokens:
+        return []
+    sig = signature(tokens)
+    with _lock:
+        candidates = index.candidates(sig, exclude)
+    return rank(tokens, candidates)
@@ -0,0 +1,28 @@
+# backend/wsgi.py
+"""
+Production WSGI entry point.
+
+Datasets are loaded and indexed here, at import time, so that a pre-forking
+server (gunicorn with preload_app, see gunicorn.conf.py) does it once in the
+master and every worker shares the same pages copy-on-write:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Single-process servers work too, e.g. on Windows:
+
+    waitress-serve --threads=8 --port=5000 wsgi:app
+
+Cache warming starts here for single-process servers; under gunicorn it
+starts in each worker after the fork instead (post_fork), since threads
+started in the master don't survive it.
+"""
+import sys
+
+import cache_warmer
+from app import app, preload_dataset
+
+preload_dataset()
+if "gunicorn" not in sys.modules:
+    cache_warmer.start()
+
+__all__ = ["app"]
@@ -82,7 +82,12 @@ docReady(function () {
     try {
         // Initialize only if elements exist
         if (profileSelect && createProfileBtn && deleteProfileBtn) {
-            loadProfiles().catch(err => {
+            // Profiles, restrictions and history in one round trip
+            loadBootstrap().then(loaded => {
+                if (!loaded) {
+                    return loadProfiles();
+                }
+            }).catch(err => {
                 console.error("Error loading profiles:", err);
                 // Fallback: try to load restrictions directly
                 loadRestrictions();
@@ -190,6 +195,59 @@ function updateActiveRestrictionsDisplay() {
     activeRestrictionsList.innerHTML = html;
 }
 
+// Load profiles and active restrictions in a single request
+// (the response also carries server history and dataset readiness)
+async function loadBootstrap() {
+    // Only fall back to the dev server when the page isn't served by the backend
+    const urls = location.port === "5000"
+        ? [`/api/bootstrap`]
+        : [`/api/bootstrap`, `http://localhost:5000/api/bootstrap`];
+
+    for (const url of urls) {
+        try {
+            const resp = await fetch(url);
+            if (resp.ok) {
+                const data = await resp.json();
+                renderProfiles(data);
+                applyRestrictions(data.restrictions || { allergies: [], restrictions: [] });
+                if (data.readiness && !data.readiness.ready) {
+                    console.info("Datasets still loading:", data.readiness.datasets);
+                }
+                return true;
+            }
+        } catch (e) {
+            console.error(`Error fetching from ${url}:`, e);
+            continue;
+        }
+    }
+    return false;
+}
+
+// Populate the profile dropdown from {profiles, activeProfileId}
+function renderProfiles(data) {
+    profiles = data.profiles || [];
+    currentProfileId = data.activeProfileId || (profiles[0]?.id);
+
+    // Populate profile dropdown (only if element exists)
+    if (profileSelect) {
+        profileSelect.innerHTML = '';
+        profiles.forEach(profile => {
+            const option = document.createElement('option');
+            option.value = profile.id;
+            option.textContent = profile.name;
+            if (profile.id === currentProfileId) {
+                option.selected = true;
+            }
+            profileSelect.appendChild(option);
+        });
+    }
+
+    // Show/hide delete button (can't delete if only one profile)
+    if (deleteProfileBtn) {
+        deleteProfileBtn.style.display = profiles.length > 1 ? 'block' : 'none';
+    }
+}
+
 // Load profiles and set active one
 async function loadProfiles() {
     try {
@@ -203,27 +261,7 @@ async function loadProfiles() {
                 const resp = await fetch(url);
                 if (resp.ok) {
                     const data = await resp.json();
-                    profiles = data.profiles || [];
-                    currentProfileId = data.activeProfileId || (profiles[0]?.id);
-
-                    // Populate profile dropdown (only if element exists)
-                    if (profileSelect) {
-                        profileSelect.innerHTML = '';
-                        profiles.forEach(profile => {
-                            const option = document.createElement('option');
-                            option.value = profile.id;
-                            option.textContent = profile.name;
-                            if (profile.id === currentProfileId) {
-                                option.selected = true;
-                            }
-                            profileSelect.appendChild(option);
-                        });
-                    }
-
-                    // Show/hide delete button (can't delete if only one profile)
-                    if (deleteProfileBtn) {
-                        deleteProfileBtn.style.display = profiles.length > 1 ? 'block' : 'none';
-                    }
+                    renderProfiles(data);
 
                     // Load restrictions for active profile
                     await loadRestrictions();
@@ -252,14 +290,7 @@ async function loadRestrictions() {
             try {
                 const resp = await fetch(url);
                 if (resp.ok) {
-                    const data = await resp.json();
-                    allergyCheckboxes.forEach(checkbox => {
-                        checkbox.checked = data.allergies.includes(checkbox.value);
-                    });
-                    restrictionCheckboxes.forEach(checkbox => {
-                        checkbox.checked = data.restrictions.includes(checkbox.value);
-                    });
-                    updateActiveRestrictionsDisplay();
+                    applyRestrictions(await resp.json());
                     return;
                 }
             } catch (e) {
@@ -271,6 +302,17 @@ async function loadRestrictions() {
     }
 }
 
+// Check the boxes for {allergies, restrictions}
+function applyRestrictions(data) {
+    allergyCheckboxes.forEach(checkbox => {
+        checkbox.checked = data.allergies.includes(checkbox.value);
+    });
+    restrictionCheckboxes.forEach(checkbox => {
+        checkbox.checked = data.restrictions.includes(checkbox.value);
+    });
+    updateActiveRestrictionsDisplay();
+}
+
 // Handle profile change
 async function onProfileChange() {
     const selectedProfileId = profileSelect.value;
@@ -608,7 +650,7 @@ async function checkProduct(barcode) {
                 headers: { 'Content-Type': 'application/json' },
             });
 
-            if (resp.status === 404) {
+            if (resp.status === 404 || resp.status === 400) {
                 const errorData = await resp.json().catch(() => ({}));
                 const errorMsg = errorData.error || "i cant find it :)";
 